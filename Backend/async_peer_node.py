@@ -0,0 +1,196 @@
+import asyncio
+import socket
+import threading
+
+from Backend.peer_node import PeerNode
+from Backend.worker_pool import WorkerPool
+from Backend.compression import COMPRESSION_THRESHOLD
+from Backend.metrics import INCOMING
+from Backend.peer_message_handler import HEADER_SIZE, async_receive_frame, async_send_packet, create_packet, \
+    decode_packet
+from Backend.wire_format import JSON, detect_codec
+from message_type import MessageType
+
+
+class StreamConnection:
+    '''
+    Socket-like facade over an asyncio stream, so the existing handlers can answer on it with send_packet and
+    send_close. The methods are called from executor threads and hand the actual I/O over to the event loop.
+    '''
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, writer: asyncio.StreamWriter,
+                 compression_threshold: int = COMPRESSION_THRESHOLD):
+        self.loop = loop
+        self.writer = writer
+        self.closed = False
+        # codec used by send_packet, follows the codec of the last received frame
+        self.codec = JSON
+        # id of the request currently answered over this connection, echoed by send_packet
+        self.request_id = None
+        # compression agreed on with the sender, set for every frame like on a PeerConnection
+        self.compression = None
+        self.compression_threshold = compression_threshold
+        # NodeMetrics counting the frames sent over this connection, optional
+        self.metrics = None
+
+    async def _write(self, data: bytes):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def sendall(self, data: bytes):
+        if self.closed:
+            raise OSError("connection is closed")
+        asyncio.run_coroutine_threadsafe(self._write(data), self.loop).result()
+
+    def fileno(self):
+        if self.closed or self.writer.is_closing():
+            return -1
+        return self.writer.get_extra_info("socket").fileno()
+
+    def shutdown(self, how):
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.loop.call_soon_threadsafe(self.writer.close)
+
+
+class AsyncPeerNode(PeerNode):
+    '''
+    PeerNode running its server on an asyncio event loop instead of one thread per connection.
+    Only the connections live on the event loop: reading frames and the error frames of the accept path are
+    coroutines. Every message handler, PING and PONG included, still runs on the bounded worker pool, because the
+    handlers are shared with the threaded PeerNode and block on outgoing connections (fan_out, route_pong, ...).
+    A handler answering on its connection sends through StreamConnection.sendall, which blocks its worker thread until
+    the event loop wrote the frame. So the event loop removes the thread per idle connection, the number of requests
+    handled at once is still bounded by HANDLER_WORKERS. The wire protocol is the same as for the threaded PeerNode,
+    so both can be mixed in one network.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.server: asyncio.AbstractServer | None = None
+        # open incoming connections, only touched from the event loop
+        self.connections: set[StreamConnection] = set()
+
+    def start(self):
+        """Starts the event loop in a background thread and the asyncio server on it."""
+        self.worker_pool = WorkerPool(self.HANDLER_WORKERS, self.HANDLER_QUEUE_SIZE)
+        self.worker_pool.start()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+        # block until the server is bound, so the port is known afterwards just like with the threaded node
+        asyncio.run_coroutine_threadsafe(self._start_server(), self.loop).result()
+        self.running = True
+        print(f"Node {self.node_id} listening on {self.host}:{self.port} (asyncio)")
+        self._start_maintenance()
+
+    async def _start_server(self):
+        self.server = await asyncio.start_server(self._serve_connection, self.host, self.port,
+                                                 backlog=self.max_connections, reuse_address=True)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Coroutine version of the threaded accept loop and _handle_next_frame for a single connection."""
+        addr = writer.get_extra_info("peername")[:2]
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        print(f"{self.host}:{self.port}: incoming connection from {addr}")
+        conn = StreamConnection(self.loop, writer, self.COMPRESSION_THRESHOLD)
+        conn.metrics = self.metrics
+        self.connections.add(conn)
+        self.metrics.connection_opened(INCOMING)
+
+        try:
+            while not conn.closed:
+                try:
+                    frame = await asyncio.wait_for(async_receive_frame(reader, self.MAX_FRAME_SIZE),
+                                                   self.CONNECTION_IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, OSError, ConnectionError):
+                    break
+                if frame is None:
+                    break
+
+                # the next frame is only read after this one was handled, so the id can live on the connection
+                conn.request_id, data = frame
+                n_bytes = HEADER_SIZE + len(data)
+
+                try:
+                    conn.codec = detect_codec(data)
+                    data = decode_packet(data)
+                    self._apply_capabilities(conn, data)
+                except ValueError as e:
+                    self.metrics.record_error("malformed")
+                    print(f"Malformed frame from {addr}: {e}")
+                    error = create_packet(MessageType.ERROR, self.node_id, self.host, self.port, self.super_peer,
+                                          {"error": "malformed frame"})
+                    await async_send_packet(error, writer, conn.codec, conn.request_id, conn.compression,
+                                            conn.compression_threshold)
+                    break
+
+                self.metrics.record_in(data.get("type"), n_bytes)
+                if data.get("type") == MessageType.PING.value and self.worker_pool.is_under_pressure():
+                    self.worker_pool.record_dropped()
+                    continue
+
+                # frames of one connection are handled in order, like in the threaded node
+                result = self.loop.create_future()
+                if not self.worker_pool.submit(self._run_handler, result, conn, data, addr):
+                    error = create_packet(MessageType.ERROR, self.node_id, self.host, self.port, self.super_peer,
+                                          {"error": "overloaded"})
+                    await async_send_packet(error, writer, conn.codec, conn.request_id, conn.compression,
+                                            conn.compression_threshold)
+                    break
+
+                try:
+                    keep_open = await result
+                except Exception as e:
+                    print(f"Error host: {self.host}:{self.port} handling client connection from {addr}: {e}")
+                    break
+                if not keep_open:
+                    break
+        finally:
+            conn.closed = True
+            self.connections.discard(conn)
+            self.metrics.connection_closed(INCOMING)
+            writer.close()
+
+    def _run_handler(self, result: asyncio.Future, conn: StreamConnection, data: dict, addr):
+        '''
+        Worker job: runs the message handler and hands its result back to the waiting coroutine.
+        '''
+        try:
+            keep_open = self._handle_measured(conn, data, addr)
+        except Exception as e:
+            self.loop.call_soon_threadsafe(result.set_exception, e)
+        else:
+            self.loop.call_soon_threadsafe(result.set_result, keep_open)
+
+    def stop(self):
+        """Stops the asyncio server and the event loop."""
+        self.running = False
+        self.stopped.set()
+        self.maintenance_wakeup.set()
+        self.registry.remove_listener(self._registry_changed)
+        self.peers.clear()
+        self.pong_batcher.stop()
+        self.pool.close_all()
+        if self.loop is not None and self.server is not None:
+            async def shutdown():
+                self.server.close()
+                # kept alive connections would otherwise keep their coroutines waiting for the next frame
+                for conn in list(self.connections):
+                    conn.writer.close()
+                await asyncio.sleep(0.1)
+
+            try:
+                asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=5)
+            except Exception as e:
+                print(f"Error stopping asyncio server: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
@@ -0,0 +1,937 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from types import MappingProxyType
+
+from Backend.merkle import MerkleTree
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: appends and compactions are only serialized within one process
+    fcntl = None
+
+'''
+In-process cache of the board registry in data/boards.json, shared by the node and the Flask API of a process.
+
+The registry is stored as a snapshot (data/boards.json) plus an append-only log of the changes made since
+(data/boards.json.log, one JSON record per line). A registration or unregistration appends a single line instead of
+rewriting the whole file, a background thread folds the log into a new snapshot once it grew as long as the registry
+(and at the latest every compact_interval seconds). Records are idempotent, so replaying a log on top of the snapshot
+it was already folded into (e.g. after a crash during compaction) gives the same registry.
+
+Changes made by other processes are noticed on the next read: new log lines are read from the last position, a new
+snapshot or a new log means loading everything again. Readers get immutable entries and never touch the disk.
+Appends and compactions of all processes are serialized with an flock on data/boards.json.lock, so a compaction
+carries over every record appended by any process.
+
+Every change gets a version, so that other peers keeping a copy of the registry (RegistryReplica) only need the
+changes since the version they hold instead of the whole list. Versions are only comparable within one epoch, a new
+epoch starts with every process and tells the replicas to fetch everything again.
+'''
+
+BOARDS_FILE = os.path.join("data", "boards.json")
+RECEIVED_BOARDS_FILE = os.path.join("data", "received_boards.json")
+# changes a registry remembers, replicas further behind get the whole registry again
+REGISTRY_HISTORY = 1000
+# log records after which a compaction is started at the earliest, besides the size of the registry
+COMPACT_MIN_RECORDS = 1000
+COMPACT_INTERVAL = 60.0
+
+
+class BoardRegistry:
+    '''
+    Thread safe. Changes made through register / unregister are appended to the log right away, changes made to the
+    files by somebody else are noticed at most 'check_interval' seconds later on the next read.
+    Boards are indexed by board_id and by (peer_id, board_title).
+    Listeners are called with (added, removed) board entries after every change, outside of the lock.
+    '''
+
+    # searched through the keyword index of the node, see SqliteBoardRegistry for a registry searched by itself
+    searchable = False
+
+    def __init__(self, path: str = BOARDS_FILE, check_interval: float = 1.0, history: int = REGISTRY_HISTORY,
+                 compact_min_records: int = COMPACT_MIN_RECORDS, compact_interval: float = COMPACT_INTERVAL,
+                 clock=time.monotonic):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.lock_path = f"{path}.lock"
+        self.check_interval = check_interval
+        self.compact_min_records = compact_min_records
+        self.compact_interval = compact_interval
+        self.clock = clock
+
+        self.epoch = uuid.uuid4().hex
+        # incremented for every added, changed or removed board
+        self.version = 0
+        # (version, board_id, board entry or 'None' if it was removed), oldest first
+        self.history = deque(maxlen=history)
+
+        self.lock = threading.Lock()
+        # board_id: read only board entry, in the order the boards were registered
+        self.boards: dict = {}
+        # (peer_id, board_title): board ids
+        self.by_owner: dict[tuple, set] = {}
+        # tuple of all entries, built on the first read after a change
+        self.snapshot_cache = None
+        # (mtime_ns, size) of the snapshot file when it was loaded or written, 'None' if it did not exist
+        self.signature = None
+        # inode of the log file and bytes of it read or written so far
+        self.log_inode = None
+        self.log_offset = 0
+        self.log_records = 0
+        # boards in the snapshot file, the log is compacted once it holds as many records
+        self.snapshot_size = 0
+        self.last_check = None
+        self.loaded = False
+        self.listeners = []
+        self.loads = 0
+        self.appends = 0
+        self.compactions = 0
+
+        self.compact_wakeup = threading.Event()
+        self.compact_lock = threading.Lock()
+        self.compactor = None
+        self.closed = False
+
+    @staticmethod
+    def _freeze(board: dict):
+        return MappingProxyType(dict(board))
+
+    @staticmethod
+    def _stat(path: str):
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _owner(board) -> tuple:
+        return board.get("peer_id"), board.get("board_title")
+
+    # --- in-memory index --------------------------------------------------------------------------------------------
+
+    def _put(self, board) -> tuple:
+        '''
+        :return: (added, removed) board entries
+        '''
+        board_id = board.get("board_id")
+        old = self.boards.get(board_id)
+        if old == board:
+            return [], []
+        if old is not None:
+            self._unindex(old)
+        self.boards[board_id] = board
+        self.by_owner.setdefault(self._owner(board), set()).add(board_id)
+        self.snapshot_cache = None
+        return [board], [old] if old is not None else []
+
+    def _delete(self, board_id) -> tuple:
+        old = self.boards.pop(board_id, None)
+        if old is None:
+            return [], []
+        self._unindex(old)
+        self.snapshot_cache = None
+        return [], [old]
+
+    def _unindex(self, board):
+        owner = self._owner(board)
+        ids = self.by_owner.get(owner)
+        if ids is not None:
+            ids.discard(board.get("board_id"))
+            if not ids:
+                del self.by_owner[owner]
+
+    def _apply_record(self, record) -> tuple:
+        if not isinstance(record, dict):
+            return [], []
+        if record.get("op") == "put" and isinstance(record.get("board"), dict):
+            return self._put(self._freeze(record["board"]))
+        if record.get("op") == "del":
+            return self._delete(record.get("board_id"))
+        return [], []
+
+    def _record_changes(self, added: list, removed: list):
+        if not self.loaded:
+            # the first load is version 0, there is nothing a replica could have missed before
+            return
+        added_ids = {board.get("board_id") for board in added}
+        for board in removed:
+            if board.get("board_id") not in added_ids:
+                self.version += 1
+                self.history.append((self.version, board.get("board_id"), None))
+        for board in added:
+            self.version += 1
+            self.history.append((self.version, board.get("board_id"), board))
+
+    # --- files ------------------------------------------------------------------------------------------------------
+
+    def _load_snapshot(self) -> dict:
+        stat = self._stat(self.path)
+        self.signature = (stat.st_mtime_ns, stat.st_size) if stat is not None else None
+        if stat is None:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                boards = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[BOOTSTRAP] Fehler beim Laden von {self.path}: {e}")
+            # keep the last good state, a half written file is read again once it changed
+            self.signature = None
+            return dict(self.boards)
+        self.loads += 1
+        boards = boards if isinstance(boards, list) else []
+        return {board.get("board_id"): self._freeze(board) for board in boards if isinstance(board, dict)}
+
+    def _read_log(self, offset: int) -> list:
+        '''
+        :return: records of all complete lines from 'offset' on, advances log_offset past them
+        '''
+        try:
+            with open(self.log_path, "rb") as f:
+                self.log_inode = os.fstat(f.fileno()).st_ino
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            self.log_inode = None
+            self.log_offset = 0
+            return []
+        # a line without newline is still being written (or was cut off by a crash) and is read again later
+        end = data.rfind(b"\n") + 1
+        self.log_offset = offset + end
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                print(f"[BOOTSTRAP] Ungültiger Eintrag in {self.log_path}: {e}")
+        return records
+
+    def _reload(self) -> tuple:
+        '''
+        Loads snapshot and log from scratch.
+        :return: (added, removed) compared to the boards held before
+        '''
+        old = self.boards
+        self.boards = {}
+        self.by_owner = {}
+        snapshot = self._load_snapshot()
+        for board in snapshot.values():
+            self._put(board)
+        self.snapshot_size = len(snapshot)
+        records = self._read_log(0)
+        for record in records:
+            self._apply_record(record)
+        self.log_records = len(records)
+        self.snapshot_cache = None
+
+        added = [board for board_id, board in self.boards.items() if old.get(board_id) != board]
+        removed = [board for board_id, board in old.items() if self.boards.get(board_id) != board]
+        self._record_changes(added, removed)
+        self.loaded = True
+        return added, removed
+
+    def _changed_on_disk(self) -> str:
+        '''
+        :return: "reload" if snapshot or log were replaced, "tail" if the log grew, '' if nothing changed
+        '''
+        stat = self._stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size) if stat is not None else None
+        log_stat = self._stat(self.log_path)
+        log_inode = log_stat.st_ino if log_stat is not None else None
+        if signature != self.signature or log_inode != self.log_inode:
+            return "reload"
+        if log_stat is not None and log_stat.st_size < self.log_offset:
+            return "reload"
+        if log_stat is not None and log_stat.st_size > self.log_offset:
+            return "tail"
+        return ""
+
+    @contextmanager
+    def _file_lock(self):
+        '''
+        Holds the lock file shared by all processes using the registry, a compaction must not run between the copy of
+        the log tail and the replace of the log while somebody appends.
+        '''
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
+
+    def _append(self, records: list):
+        '''
+        Appends records to the log, a single write per call so concurrent appends of other processes do not interleave.
+        '''
+        data = b"".join(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n" for record in records)
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        with self._file_lock():
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                stat = os.fstat(fd)
+                # records of other processes appended since the last read are still ahead, the next refresh reads
+                # them together with these (records are idempotent)
+                in_sync = stat.st_ino == self.log_inode and stat.st_size == self.log_offset
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        if in_sync:
+            self.log_offset += len(data)
+        self.log_records += len(records)
+        self.appends += 1
+        if self.log_records >= max(self.compact_min_records, self.snapshot_size):
+            self.compact_wakeup.set()
+        if self.compactor is None and not self.closed:
+            self.compactor = threading.Thread(target=self._compact_loop, name="registry-compactor", daemon=True)
+            self.compactor.start()
+
+    def _compact_loop(self):
+        while not self.closed:
+            self.compact_wakeup.wait(self.compact_interval)
+            self.compact_wakeup.clear()
+            if self.closed:
+                return
+            try:
+                self.compact()
+            except OSError as e:
+                print(f"[BOOTSTRAP] Komprimieren von {self.log_path} fehlgeschlagen: {e}")
+
+    def compact(self) -> bool:
+        '''
+        Writes the registry as new snapshot and starts a new log with the records appended meanwhile. The snapshot is
+        written without holding the lock, registrations only wait while the rest of the log is copied.
+        :return: 'False' if the log was empty or another compaction ran meanwhile
+        '''
+        # one compaction per process at a time, the background thread and an explicit call may meet
+        if not self.compact_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._compact()
+        finally:
+            self.compact_lock.release()
+
+    def _compact(self) -> bool:
+        self.refresh(force=True)
+        with self.lock:
+            if self.log_records == 0:
+                return False
+            boards = [dict(board) for board in self.boards.values()]
+            offset = self.log_offset
+            files = (self.signature, self.log_inode)
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # every process writes its own snapshot, only the replace happens under the file lock
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(boards, f, ensure_ascii=False, indent=2)
+
+        with self.lock, self._file_lock():
+            if (self.signature, self.log_inode) != files or self._changed_on_disk() == "reload":
+                # another process compacted meanwhile, this snapshot would miss its records
+                os.remove(tmp_path)
+                return False
+            # records appended meanwhile (by this or any other process) are carried over into the new log
+            with open(self.log_path, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+            log_tmp_path = f"{self.log_path}.tmp"
+            with open(log_tmp_path, "wb") as f:
+                f.write(tail)
+            # a crash between the two replaces replays the old log onto the new snapshot, which changes nothing
+            os.replace(tmp_path, self.path)
+            os.replace(log_tmp_path, self.log_path)
+            stat = os.stat(self.path)
+            self.signature = (stat.st_mtime_ns, stat.st_size)
+            self.log_inode = os.stat(self.log_path).st_ino
+            # records of other processes in the tail were not read yet, the next refresh reads them from here
+            self.log_offset -= offset
+            self.log_records = tail.count(b"\n")
+            self.snapshot_size = len(boards)
+            self.compactions += 1
+        print(f"[BOOTSTRAP] Registry komprimiert: {len(boards)} Boards")
+        return True
+
+    def close(self):
+        '''
+        Stops the background compaction, the log stays as it is and is read again on the next start.
+        '''
+        self.closed = True
+        self.compact_wakeup.set()
+
+    # --- reading ----------------------------------------------------------------------------------------------------
+
+    def get_changes(self, epoch: str = None, version: int = -1) -> dict:
+        '''
+        :param epoch: epoch of the registry copy of the caller, 'None' if it has none
+        :param version: version of the registry copy of the caller
+        :return: the changes since that version {"epoch", "since", "version", "full": False, "upserted", "removed"}
+        or the whole registry {"epoch", "version", "full": True, "boards"} if the caller is too far behind
+        '''
+        self.refresh()
+        with self.lock:
+            oldest = self.history[0][0] if self.history else self.version + 1
+            if epoch != self.epoch or version > self.version or version < oldest - 1:
+                return {
+                    "epoch": self.epoch,
+                    "version": self.version,
+                    "full": True,
+                    "boards": [dict(board) for board in self.boards.values()],
+                }
+
+            # the last change of a board wins
+            changes = {}
+            for change_version, board_id, board in self.history:
+                if change_version > version:
+                    changes[board_id] = board
+            return {
+                "epoch": self.epoch,
+                "since": version,
+                "version": self.version,
+                "full": False,
+                "upserted": [dict(board) for board in changes.values() if board is not None],
+                "removed": [board_id for board_id, board in changes.items() if board is None],
+            }
+
+    def _notify(self, added: list, removed: list):
+        if not added and not removed:
+            return
+        for listener in list(self.listeners):
+            try:
+                listener(added, removed)
+            except Exception as e:
+                print(f"Board registry listener failed: {e}")
+
+    def _refresh_locked(self) -> tuple:
+        change = self._changed_on_disk() if self.loaded else "reload"
+        if change == "reload":
+            return self._reload()
+        if change == "tail":
+            added, removed = [], []
+            records = self._read_log(self.log_offset)
+            for record in records:
+                record_added, record_removed = self._apply_record(record)
+                added += record_added
+                removed += record_removed
+            self.log_records += len(records)
+            self._record_changes(added, removed)
+            return added, removed
+        return [], []
+
+    def refresh(self, force: bool = False):
+        '''
+        Reads the changes other processes made to the files, checked at most every check_interval seconds.
+        '''
+        now = self.clock()
+        with self.lock:
+            if not force and self.last_check is not None and now - self.last_check < self.check_interval:
+                return
+            self.last_check = now
+            added, removed = self._refresh_locked()
+        self._notify(added, removed)
+
+    def get_snapshot(self) -> tuple:
+        '''
+        :return: immutable tuple of read only board entries
+        '''
+        self.refresh()
+        with self.lock:
+            if self.snapshot_cache is None:
+                self.snapshot_cache = tuple(self.boards.values())
+            return self.snapshot_cache
+
+    def get_boards(self) -> list:
+        '''
+        :return: copy of all board entries, e.g. to send them as JSON
+        '''
+        return [dict(board) for board in self.get_snapshot()]
+
+    def get_board(self, board_id):
+        self.refresh()
+        with self.lock:
+            return self.boards.get(board_id)
+
+    def find_by_owner(self, peer_id, board_title) -> list:
+        '''
+        :return: read only entries of the boards 'peer_id' registered under 'board_title'
+        '''
+        self.refresh()
+        with self.lock:
+            return [self.boards[board_id] for board_id in self.by_owner.get((peer_id, board_title), ())]
+
+    # --- writing ----------------------------------------------------------------------------------------------------
+
+    def register(self, board: dict) -> bool:
+        '''
+        Adds a board and appends it to the log.
+        :return: 'False' if a board with the same board_id is already registered
+        '''
+        with self.lock:
+            # other processes may have registered it meanwhile
+            added, removed = self._refresh_locked()
+            if board.get("board_id") in self.boards:
+                registered = False
+            else:
+                self._append([{"op": "put", "board": dict(board)}])
+                changes = self._put(self._freeze(board))
+                self._record_changes(*changes)
+                added, removed = added + changes[0], removed + changes[1]
+                registered = True
+        self._notify(added, removed)
+        return registered
+
+    def _unregister_ids(self, select) -> list:
+        with self.lock:
+            added, removed = self._refresh_locked()
+            board_ids = select()
+            if board_ids:
+                self._append([{"op": "del", "board_id": board_id} for board_id in board_ids])
+            deleted = []
+            for board_id in board_ids:
+                deleted += self._delete(board_id)[1]
+            self._record_changes([], deleted)
+        self._notify(added, removed + deleted)
+        return [dict(board) for board in deleted]
+
+    def unregister(self, predicate) -> list:
+        '''
+        Removes all boards 'predicate' returns 'True' for, checks every board.
+        :return: removed board entries
+        '''
+        return self._unregister_ids(
+            lambda: [board_id for board_id, board in self.boards.items() if predicate(board)])
+
+    def unregister_owner(self, peer_id, board_title) -> list:
+        '''
+        Removes the boards 'peer_id' registered under 'board_title', a lookup in the index.
+        :return: removed board entries
+        '''
+        return self._unregister_ids(lambda: list(self.by_owner.get((peer_id, board_title), ())))
+
+    def unregister_ids(self, board_ids) -> list:
+        '''
+        Removes the boards with the given ids, unknown ids are skipped.
+        :return: removed board entries
+        '''
+        return self._unregister_ids(lambda: [board_id for board_id in board_ids if board_id in self.boards])
+
+    def add_listener(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "boards": len(self.boards),
+                "epoch": self.epoch,
+                "version": self.version,
+                "log_records": self.log_records,
+                "appends": self.appends,
+                "compactions": self.compactions,
+                "loads": self.loads,
+                "listeners": len(self.listeners),
+            }
+
+
+_registries: dict[tuple, object] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(path: str = BOARDS_FILE):
+    '''
+    :return: the registry of 'path' shared by everything in this process, kept in a SQLite database next to it
+    (migrated from 'path' on first use) if config.REGISTRY_BACKEND is "sqlite"
+    '''
+    from Backend import config
+
+    path = os.path.abspath(path)
+    backend = getattr(config, "REGISTRY_BACKEND", "json")
+    with _registries_lock:
+        registry = _registries.get((path, backend))
+        if registry is None:
+            if backend == "sqlite":
+                from Backend.sqlite_registry import SqliteBoardRegistry, database_path
+                registry = SqliteBoardRegistry(database_path(path), migrate_from=path)
+            else:
+                registry = BoardRegistry(path)
+            _registries[(path, backend)] = registry
+        return registry
+
+
+class RegistryReplica:
+    '''
+    Copy of the registries of the registry nodes, kept up to date with the changes they send along with their PONGs.
+    Like the registry it is saved as a snapshot (data/received_boards.json) plus a log of the changes applied since,
+    appended outside of the lock, so that neither a delta rewrites the whole file nor readers wait for the disk. The
+    file is only a warm start, the first PONG of every registry node brings the copy up to date. Every registry node (shard) has its own epoch and version, a board
+    registered with several of them is kept until the last one removed it. Thread safe.
+
+    Super peers also reconcile their copies with each other (anti-entropy): the boards of every source are kept in a
+    MerkleTree, a copy behind another one compares the digests and fetches only the key ranges that differ.
+    '''
+
+    def __init__(self, path: str = RECEIVED_BOARDS_FILE, compact_min_records: int = COMPACT_MIN_RECORDS):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.compact_min_records = compact_min_records
+        self.lock = threading.Lock()
+        # log records of the changes applied but not written yet
+        self.pending: list = []
+        # serializes the writes of this copy, taken before self.lock
+        self.write_lock = threading.Lock()
+        # records in the log, it is folded into a new snapshot once it holds as many as there are boards
+        self.log_records = 0
+        self.compactions = 0
+        # source ("host:port" of the registry node): (epoch, version) this copy reflects
+        self.positions: dict[str, tuple] = {}
+        # source: ids of the boards it holds
+        self.members: dict[str, set] = {}
+        # source: hash tree of the boards it holds, compared during anti-entropy
+        self.trees: dict[str, MerkleTree] = {}
+        # source: wall clock time its registry node produced the position held, only compared between epochs
+        self.updated_at: dict[str, float] = {}
+        self.boards: dict[str, dict] = {}
+        self.deltas_applied = 0
+        self.snapshots_applied = 0
+        self.ranges_applied = 0
+        self.boards_synced = 0
+
+    def load(self):
+        '''
+        Loads the boards saved by an earlier run. Their version is unknown, the first PONG of every registry node
+        replaces its boards with a snapshot.
+        '''
+        boards = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                boards = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Fehler beim Laden von {self.path}: {e}")
+        loaded = {board["board_id"]: board for board in boards if isinstance(board, dict) and "board_id" in board} \
+            if isinstance(boards, list) else {}
+
+        records = 0
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    records += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # cut off by a crash
+                        continue
+                    if not isinstance(record, dict):
+                        continue
+                    if record.get("op") == "put" and isinstance(record.get("board"), dict) \
+                            and "board_id" in record["board"]:
+                        loaded[record["board"]["board_id"]] = record["board"]
+                    elif record.get("op") == "del":
+                        loaded.pop(record.get("board_id"), None)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Fehler beim Laden von {self.log_path}: {e}")
+        with self.lock:
+            self.boards = loaded
+            self.log_records = records
+
+    def get_positions(self) -> dict:
+        '''
+        :return: what a PING carries to ask every registry node for the changes since this copy
+        '''
+        with self.lock:
+            return {source: {"epoch": epoch, "version": version}
+                    for source, (epoch, version) in self.positions.items()}
+
+    def get_sync_positions(self) -> dict:
+        '''
+        :return: positions with the time they were produced, sent to another super peer during anti-entropy
+        '''
+        with self.lock:
+            return {source: self._position(source) for source in self.positions}
+
+    def _position(self, source: str) -> dict:
+        epoch, version = self.positions[source]
+        return {"epoch": epoch, "version": version, "updated_at": self.updated_at.get(source, 0.0)}
+
+    def _is_newer(self, source: str, position: dict) -> bool:
+        '''
+        :return: 'True' if the copy of another node at 'position' is ahead of this one for 'source'. Versions of
+        different epochs can not be compared, the epoch started later wins then.
+        '''
+        return source not in self.positions or _newer(position, self._position(source))
+
+    def covers(self, sources) -> bool:
+        '''
+        :return: 'True' if the copy holds a position of every one of 'sources'
+        '''
+        with self.lock:
+            return all(source in self.positions for source in sources)
+
+    def get_ahead(self, positions: dict) -> dict:
+        '''
+        Answers the first request of an anti-entropy round.
+        :param positions: get_sync_positions of the requesting copy
+        :return: {source: {"position": ..., "children": digests below the root}} of the sources this copy is ahead on
+        '''
+        with self.lock:
+            ahead = {}
+            for source in self.positions:
+                other = _parse_position(positions.get(source)) if isinstance(positions, dict) else None
+                position = self._position(source)
+                if other is None or _newer(position, other):
+                    ahead[source] = {"position": position, "children": self._tree(source).get_children("")}
+            return ahead
+
+    def _tree(self, source: str) -> MerkleTree:
+        tree = self.trees.get(source)
+        if tree is None:
+            tree = self.trees[source] = MerkleTree()
+        return tree
+
+    def get_children(self, source: str, prefixes) -> tuple:
+        '''
+        :param prefixes: inner nodes of the hash tree of 'source'
+        :return: (position, {prefix: {child prefix: digest}}), position is 'None' if the source is unknown
+        :raise ValueError: if a prefix is a leaf or malformed
+        '''
+        with self.lock:
+            if source not in self.positions:
+                return None, {}
+            tree = self._tree(source)
+            return self._position(source), {prefix: tree.get_children(_check_prefix(prefix, tree))
+                                            for prefix in prefixes}
+
+    def get_ranges(self, source: str, leaves) -> tuple:
+        '''
+        :param leaves: leaves of the hash tree of 'source'
+        :return: (position, board entries of 'source' in the key ranges of the leaves)
+        :raise ValueError: if a prefix is not a leaf
+        '''
+        with self.lock:
+            if source not in self.positions:
+                return None, []
+            tree = self._tree(source)
+            boards = []
+            for leaf in leaves:
+                if not tree.is_leaf(_check_prefix(leaf, tree)):
+                    raise ValueError(f"{leaf!r} is no leaf")
+                boards.extend(dict(self.boards[board_id]) for board_id in tree.get_ids(leaf)
+                              if board_id in self.boards)
+            return self._position(source), boards
+
+    def replace_ranges(self, source: str, position: dict, leaves, boards: list):
+        '''
+        Replaces the boards of 'source' in the key ranges of 'leaves' by those fetched from a copy at 'position', the
+        digests of all other ranges were found equal.
+        :return: (upserted board entries, removed board entries) or 'None' if this copy is not behind 'position' anymore
+        :raise ValueError: if the position or the boards are malformed
+        '''
+        position = _parse_position(position)
+        if position is None:
+            raise ValueError("malformed position")
+        try:
+            boards = [dict(board) for board in boards]
+            ids = [board["board_id"] for board in boards]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"malformed boards: {e}")
+
+        with self.lock:
+            if not self._is_newer(source, position):
+                return None
+            tree = self._tree(source)
+            leaves = set(leaves)
+            if any(tree.leaf_of(board_id) not in leaves for board_id in ids):
+                raise ValueError("board outside of the requested ranges")
+            if not self.positions:
+                # boards loaded from the file belong to no source, the first position held replaces them
+                fetched = set(ids)
+                removed = [board for board_id, board in self.boards.items() if board_id not in fetched]
+                self.boards = {}
+            else:
+                removed = []
+            stale = {board_id for leaf in leaves for board_id in tree.get_ids(leaf)} - set(ids)
+            removed.extend(board for board in (self._drop(source, board_id) for board_id in stale) if board)
+            members = self.members.setdefault(source, set())
+            for board in boards:
+                self.boards[board["board_id"]] = board
+                members.add(board["board_id"])
+                tree.put(board)
+            self.positions[source] = (position["epoch"], position["version"])
+            self.updated_at[source] = position["updated_at"]
+            self.ranges_applied += len(leaves)
+            self.boards_synced += len(boards)
+            self._queue(boards, removed)
+        self._save()
+        return boards, removed
+
+    def _drop(self, source: str, board_id):
+        '''
+        :return: the entry of the board if no other source holds it and it was removed, otherwise 'None'
+        '''
+        self.members.get(source, set()).discard(board_id)
+        self._tree(source).remove(board_id)
+        if any(board_id in ids for ids in self.members.values()):
+            return None
+        # boards loaded from the file belong to no source until a snapshot arrived
+        return self.boards.pop(board_id, None)
+
+    def apply(self, changes: dict, source: str = ""):
+        '''
+        Applies changes returned by BoardRegistry.get_changes of the registry node 'source'. Changes older than this
+        copy are ignored, as are deltas starting after it (a PONG of an older search overtaken by a newer one), the next
+        PING asks again.
+        :return: (upserted board entries, removed board entries, full) or 'None' if nothing was applied
+        :raise ValueError: if the changes are malformed
+        '''
+        try:
+            epoch = changes["epoch"]
+            version = int(changes["version"])
+            full = bool(changes["full"])
+            if full:
+                boards = {board["board_id"]: dict(board) for board in changes["boards"]}
+            else:
+                since = int(changes["since"])
+                upserted = [dict(board) for board in changes["upserted"]]
+                deleted = [board_id for board_id in changes["removed"]]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"malformed registry changes: {e}")
+
+        with self.lock:
+            held_epoch, held_version = self.positions.get(source, (None, -1))
+            if full:
+                if epoch == held_epoch and version <= held_version:
+                    return None
+                if not self.positions:
+                    # the first snapshot replaces what was loaded from the file
+                    removed = [board for board_id, board in self.boards.items() if board_id not in boards]
+                    self.boards = {}
+                else:
+                    stale = self.members.get(source, set()) - set(boards)
+                    removed = [board for board in (self._drop(source, board_id) for board_id in stale) if board]
+                upserted = list(boards.values())
+                self.members[source] = set(boards)
+                self.trees[source] = MerkleTree()
+                self.snapshots_applied += 1
+            else:
+                if epoch != held_epoch or version <= held_version or since > held_version:
+                    return None
+                removed = [board for board in (self._drop(source, board_id) for board_id in deleted) if board]
+                self.members.setdefault(source, set()).update(board["board_id"] for board in upserted)
+                self.deltas_applied += 1
+            tree = self._tree(source)
+            for board in upserted:
+                self.boards[board["board_id"]] = board
+                tree.put(board)
+            self.positions[source] = (epoch, version)
+            # changes come straight from the registry node, their position is as new as it gets
+            self.updated_at[source] = time.time()
+            self._queue(upserted, removed)
+        self._save()
+        return upserted, removed, full
+
+    def _queue(self, upserted: list, removed: list):
+        '''
+        Remembers applied changes for the log, called with the lock held. A snapshot of a registry node is logged
+        as the boards it removed and the ones it holds, like a delta.
+        '''
+        self.pending.extend({"op": "del", "board_id": board["board_id"]} for board in removed)
+        self.pending.extend({"op": "put", "board": board} for board in upserted)
+
+    def _save(self):
+        '''
+        Appends the pending records to the log, or writes a new snapshot once the log holds as many records as there
+        are boards. Only the pending records and the boards of a snapshot are taken under the lock, the writing is
+        done without it.
+        '''
+        with self.write_lock:
+            with self.lock:
+                records, self.pending = self.pending, []
+                if not records:
+                    return
+                compact = self.log_records + len(records) >= max(self.compact_min_records, len(self.boards))
+                # entries are replaced, never changed, so the snapshot may be written from the same dicts
+                boards = list(self.boards.values()) if compact else None
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                if boards is None:
+                    data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(data)
+                    self.log_records += len(records)
+                    return
+                tmp_path = f"{self.path}.{os.getpid()}.{id(self)}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(boards, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+                # the snapshot holds every record written so far
+                open(self.log_path, "w").close()
+                self.log_records = 0
+                self.compactions += 1
+            except OSError as e:
+                print(f"Error saving boards to {self.path}: {e}")
+
+    def get_boards(self, board_ids=None) -> list:
+        '''
+        :param board_ids: ids of the wanted boards, 'None' for all
+        :return: copies of the board entries, unknown ids are skipped
+        '''
+        with self.lock:
+            if board_ids is None:
+                return [dict(board) for board in self.boards.values()]
+            return [dict(self.boards[board_id]) for board_id in board_ids if board_id in self.boards]
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "boards": len(self.boards),
+                "sources": {source: {"epoch": epoch, "version": version, "boards": len(self.members.get(source, ()))}
+                            for source, (epoch, version) in self.positions.items()},
+                "deltas_applied": self.deltas_applied,
+                "snapshots_applied": self.snapshots_applied,
+                "ranges_applied": self.ranges_applied,
+                "boards_synced": self.boards_synced,
+                "log_records": self.log_records,
+                "compactions": self.compactions,
+            }
+
+
+def _parse_position(position) -> dict | None:
+    '''
+    :return: a position sent by another node with checked types or 'None' if it is malformed
+    '''
+    if not isinstance(position, dict):
+        return None
+    try:
+        return {"epoch": position["epoch"], "version": int(position["version"]),
+                "updated_at": float(position.get("updated_at", 0.0))}
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _newer(position: dict, than: dict) -> bool:
+    if position["epoch"] == than["epoch"]:
+        return position["version"] > than["version"]
+    return position["updated_at"] > than["updated_at"]
+
+
+def _check_prefix(prefix, tree: MerkleTree) -> str:
+    if not isinstance(prefix, str) or len(prefix) > tree.depth or any(c not in "0123456789abcdef" for c in prefix):
+        raise ValueError(f"malformed prefix {prefix!r}")
+    return prefix
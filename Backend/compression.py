@@ -0,0 +1,117 @@
+import threading
+import time
+import zlib
+
+'''
+Optional compression of frame bodies, marked by a flag in the length header of the frame.
+Only frames above a size threshold are compressed and only towards peers that agreed on it during CONNECT,
+small frames (PING, CLOSE, ...) would cost more CPU than they save bytes.
+'''
+
+ZLIB = "zlib"
+# ordered by preference
+SUPPORTED_COMPRESSIONS = [ZLIB]
+
+# bytes a frame body needs before compressing it is tried
+COMPRESSION_THRESHOLD = 1024
+# zlib level, 1 is fastest, 9 is smallest
+COMPRESSION_LEVEL = 6
+
+
+class CompressionStats:
+    '''
+    Counters of the compression done by this process, used to tune the threshold and the level.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames_compressed = 0
+        # frames above the threshold which did not get smaller and were sent uncompressed
+        self.frames_incompressible = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.compress_seconds = 0.0
+        self.frames_decompressed = 0
+        self.decompress_seconds = 0.0
+
+    def record_compressed(self, size_before: int, size_after: int, seconds: float):
+        with self.lock:
+            self.frames_compressed += 1
+            self.bytes_before += size_before
+            self.bytes_after += size_after
+            self.compress_seconds += seconds
+
+    def record_incompressible(self, seconds: float):
+        with self.lock:
+            self.frames_incompressible += 1
+            self.compress_seconds += seconds
+
+    def record_decompressed(self, seconds: float):
+        with self.lock:
+            self.frames_decompressed += 1
+            self.decompress_seconds += seconds
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "frames_compressed": self.frames_compressed,
+                "frames_incompressible": self.frames_incompressible,
+                "bytes_before": self.bytes_before,
+                "bytes_after": self.bytes_after,
+                "bytes_saved": self.bytes_before - self.bytes_after,
+                "ratio": self.bytes_after / self.bytes_before if self.bytes_before else 1.0,
+                "compress_seconds": self.compress_seconds,
+                "frames_decompressed": self.frames_decompressed,
+                "decompress_seconds": self.decompress_seconds,
+            }
+
+
+compression_stats = CompressionStats()
+
+
+def compress_frame(data, threshold: int = COMPRESSION_THRESHOLD, level: int = COMPRESSION_LEVEL):
+    '''
+    Compresses a frame body if it is big enough and actually gets smaller.
+    :return: compressed body or 'None' if the frame should be sent as it is
+    '''
+    if len(data) < threshold:
+        return None
+
+    start = time.perf_counter()
+    compressed = zlib.compress(data, level)
+    seconds = time.perf_counter() - start
+
+    if len(compressed) >= len(data):
+        compression_stats.record_incompressible(seconds)
+        return None
+    compression_stats.record_compressed(len(data), len(compressed), seconds)
+    return compressed
+
+
+def decompress_frame(data, max_size: int) -> bytes:
+    '''
+    :param max_size: maximum size of the decompressed body, protects against tiny frames inflating to gigabytes
+    :raise ValueError: if the body is no valid zlib stream or inflates to more than max_size bytes
+    '''
+    start = time.perf_counter()
+    decompressor = zlib.decompressobj()
+    try:
+        body = decompressor.decompress(data, max_size)
+    except zlib.error as e:
+        raise ValueError(f"invalid compressed frame: {e}")
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError(f"compressed frame inflates to more than {max_size} bytes or is truncated")
+    compression_stats.record_decompressed(time.perf_counter() - start)
+    return body
+
+
+def choose_compression(offered):
+    '''
+    Picks the preferred compression out of the ones offered by a remote peer during CONNECT.
+    :return: name of the compression or 'None' if frames must not be compressed
+    '''
+    if isinstance(offered, list):
+        for compression in SUPPORTED_COMPRESSIONS:
+            if compression in offered:
+                return compression
+    return None
@@ -1,2 +1,10 @@
 BOOTSTRAP = ("botstrap-ip", 9001)
 LOCAL = ("local-ip", 9005)  
+# registry nodes the board registry is sharded over (consistent hashing on board_id), each of them also lets new
+# peers join. Empty: BOOTSTRAP alone
+REGISTRY_NODES = []
+# registry nodes every board is registered with
+REGISTRY_REPLICATION = 1
+# where the bootstrap node keeps the board registry: "json" (data/boards.json plus log) or "sqlite" (data/boards.db,
+# created from data/boards.json on first start)
+REGISTRY_BACKEND = "json"
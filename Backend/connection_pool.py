@@ -0,0 +1,348 @@
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from Backend.multiplexer import MultiplexedConnection
+from Backend.compression import COMPRESSION_THRESHOLD
+from Backend.metrics import OUTGOING
+from Backend.peer_message_handler import MAX_FRAME_SIZE, send_packet, receive_packet
+from Backend.wire_format import JSON
+
+
+class PeerConnection:
+    '''
+    Long-lived framed connection to a single remote peer.
+    Wraps the raw socket and behaves like one, so it can be handed to send_packet / receive_packet directly.
+    Besides the socket it carries what was negotiated with the peer, e.g. the codec used by send_packet.
+    '''
+
+    def __init__(self, sock: socket.socket, address: tuple[str, int], io_timeout: float, codec: str = JSON,
+                 max_frame_size: int = MAX_FRAME_SIZE, compression: str = None,
+                 compression_threshold: int = COMPRESSION_THRESHOLD, metrics=None, direction: str = OUTGOING):
+        self.sock = sock
+        self.address = address
+        self.io_timeout = io_timeout
+        self.codec = codec
+        # id of the request currently answered over this connection, echoed by send_packet
+        self.request_id = None
+        # frames are received into this buffer with recv_into, it is allocated on the first frame
+        self.receive_buffer = None
+        # FrameReader of an incoming connection read without blocking by the accept loop
+        self.frame_reader = None
+        self.max_frame_size = max_frame_size
+        # compression used by send_packet for frames above the threshold, 'None' sends everything uncompressed
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        # NodeMetrics counting the frames sent over this connection and the open connections, optional
+        self.metrics = metrics
+        self.direction = direction
+        if metrics is not None:
+            metrics.connection_opened(direction)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # number of frames sent over this connection, 0 means the connection is fresh
+        self.uses = 0
+
+    def is_healthy(self) -> bool:
+        '''
+        Checks whether an idle connection can be reused.
+        An idle connection must not be readable: if it is, the remote side either closed it
+        or sent a frame nobody is waiting for. In both cases it must not be handed out again.
+        :return: 'True' if the connection can be reused, otherwise 'False'
+        '''
+        if self.sock.fileno() == -1:
+            return False
+        try:
+            self.sock.setblocking(False)
+            self.sock.recv(1, socket.MSG_PEEK)
+            return False
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            if self.sock.fileno() != -1:
+                self.sock.settimeout(self.io_timeout)
+
+    def sendall(self, data):
+        self.last_used = time.monotonic()
+        self.uses += 1
+        self.sock.sendall(data)
+
+    def recv(self, n_bytes: int, flags: int = 0):
+        return self.sock.recv(n_bytes, flags)
+
+    def recv_into(self, buffer, n_bytes: int = 0, flags: int = 0):
+        return self.sock.recv_into(buffer, n_bytes, flags)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def shutdown(self, how):
+        self.sock.shutdown(how)
+
+    def close(self):
+        if self.metrics is not None and self.sock.fileno() != -1:
+            self.metrics.connection_closed(self.direction)
+        self.sock.close()
+
+
+class ConnectionPool:
+    '''
+    Per node pool of outgoing connections keyed by (host, port).
+    Idle connections are kept open and reused for following frames to the same peer, instead of paying a TCP
+    handshake for every single message. A connection is only shared after it was released, so callers always
+    have exclusive access to the connection they acquired.
+    '''
+
+    def __init__(self, max_idle_per_peer: int = 4, max_idle_total: int = 64, idle_timeout: float = 30.0,
+                 connect_timeout: float = 3.0, io_timeout: float = 10.0, max_parallel_requests: int = 8,
+                 max_frame_size: int = MAX_FRAME_SIZE, compression_threshold: int = COMPRESSION_THRESHOLD,
+                 metrics=None, max_parallel_sends: int = 16):
+        self.max_idle_per_peer = max_idle_per_peer
+        self.max_idle_total = max_idle_total
+        # should stay below the idle timeout of the remote server, so that we drop connections before it does
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.io_timeout = io_timeout
+        # upper bound for answers received from peers
+        self.max_frame_size = max_frame_size
+        self.compression_threshold = compression_threshold
+        self.metrics = metrics
+
+        self.idle: dict[tuple[str, int], deque[PeerConnection]] = {}
+        self.idle_count = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # what was negotiated with a peer during CONNECT, applies to all connections to its address
+        self.capabilities: dict[tuple[str, int], dict] = {}
+
+        # shared connections for pipelined requests to peers supporting request ids
+        self.multiplexed: dict[tuple[str, int], MultiplexedConnection] = {}
+        # peers without request ids get concurrent requests over several exclusive connections instead
+        self.max_parallel_requests = max_parallel_requests
+        self.executor = None
+        # frames sent to several peers at once (PING floods) use their own bounded set of threads
+        self.max_parallel_sends = max_parallel_sends
+        self.send_executor = None
+
+    def set_capabilities(self, host: str, port: int, capabilities: dict):
+        self.capabilities[(host, port)] = capabilities
+
+    def get_capabilities(self, host: str, port: int) -> dict:
+        return self.capabilities.get((host, port), {})
+
+    def _open(self, address: tuple[str, int], connect_timeout: float = None) -> PeerConnection:
+        sock = socket.create_connection(address, timeout=connect_timeout or self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.io_timeout)
+        capabilities = self.get_capabilities(*address)
+        return PeerConnection(sock, address, self.io_timeout, capabilities.get("codec", JSON), self.max_frame_size,
+                              capabilities.get("compression"), self.compression_threshold, self.metrics)
+
+    def acquire(self, host: str, port: int, connect_timeout: float = None) -> PeerConnection:
+        '''
+        Hands out a healthy idle connection to (host, port) or opens a new one.
+        :param connect_timeout: seconds to wait for a new connection, defaults to the connect timeout of the pool
+        :return: connection exclusively owned by the caller until release() is called
+        '''
+        address = (host, port)
+        now = time.monotonic()
+        conn = None
+        while conn is None:
+            with self.lock:
+                idle = self.idle.get(address)
+                if not idle:
+                    break
+                conn = idle.pop()
+                self.idle_count -= 1
+            if now - conn.last_used >= self.idle_timeout or not conn.is_healthy():
+                conn.close()
+                conn = None
+
+        if conn is None:
+            return self._open(address, connect_timeout)
+        # the capabilities may have been negotiated after the connection was opened
+        capabilities = self.get_capabilities(host, port)
+        conn.codec = capabilities.get("codec", JSON)
+        conn.compression = capabilities.get("compression")
+        return conn
+
+    def release(self, conn: PeerConnection, reuse: bool = True):
+        '''
+        Gives a connection back to the pool. Broken connections or connections exceeding the idle limits are closed.
+        :param reuse: 'False' if the connection is in an unknown state (e.g. after an error) and must be discarded
+        '''
+        if not reuse or self.closed or conn.fileno() == -1:
+            conn.close()
+            return
+
+        with self.lock:
+            idle = self.idle.setdefault(conn.address, deque())
+            if len(idle) < self.max_idle_per_peer and self.idle_count < self.max_idle_total:
+                idle.append(conn)
+                self.idle_count += 1
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self, host: str, port: int):
+        conn = self.acquire(host, port)
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, reuse=False)
+            raise
+        else:
+            self.release(conn)
+
+    def send(self, host: str, port: int, packet, connect_timeout: float = None, send_timeout: float = None):
+        '''
+        Sends a single frame without waiting for an answer.
+        If a reused connection turns out to be stale, the frame is sent again over a fresh connection.
+        :param connect_timeout: seconds to wait for a new connection, defaults to the connect timeout of the pool
+        :param send_timeout: seconds the peer may take to accept the frame, defaults to the io timeout of the pool
+        '''
+        conn = self.acquire(host, port, connect_timeout)
+        reused = conn.uses > 0
+        try:
+            self._send_within(packet, conn, send_timeout)
+        except OSError:
+            self.release(conn, reuse=False)
+            if not reused:
+                raise
+            # stale pooled connection, reconnect transparently
+            conn = self._open((host, port), connect_timeout)
+            try:
+                self._send_within(packet, conn, send_timeout)
+            except Exception:
+                self.release(conn, reuse=False)
+                raise
+        self.release(conn)
+
+    def _send_within(self, packet, conn: PeerConnection, send_timeout: float = None):
+        if send_timeout is None:
+            send_packet(packet, conn)
+            return
+        conn.settimeout(send_timeout)
+        send_packet(packet, conn)
+        conn.settimeout(self.io_timeout)
+
+    def send_many(self, targets, packet, connect_timeout: float = None, send_timeout: float = None) -> dict:
+        '''
+        Sends the same frame to several peers concurrently, at most max_parallel_sends at a time. Every target has its
+        own connect and send timeout, so a dead or slow peer only delays its own frame: the call takes as long as the
+        slowest target, not as long as all targets together.
+        :param targets: list of (host, port), a peer listed twice gets the frame twice
+        :return: (host, port): exception for every target the frame could not be sent to, empty if all succeeded
+        '''
+        targets = list(targets)
+        if len(targets) <= 1:
+            # nothing to overlap, spare the thread hand-over
+            failures = {}
+            for host, port in targets:
+                try:
+                    self.send(host, port, packet, connect_timeout, send_timeout)
+                except Exception as e:
+                    failures[(host, port)] = e
+            return failures
+
+        with self.lock:
+            if self.send_executor is None:
+                self.send_executor = ThreadPoolExecutor(max_workers=self.max_parallel_sends,
+                                                        thread_name_prefix="pool-send")
+        futures = {self.send_executor.submit(self.send, host, port, packet, connect_timeout, send_timeout): (host, port)
+                   for host, port in targets}
+        wait(futures)
+        return {target: future.exception() for future, target in futures.items() if future.exception() is not None}
+
+    def request(self, host: str, port: int, packet):
+        '''
+        Sends a single frame and waits for exactly one answer frame on the same connection.
+        :return: received frame or 'None' if the peer closed the connection without answering
+        '''
+        for attempt in range(2):
+            conn = self.acquire(host, port)
+            reused = conn.uses > 0
+            try:
+                send_packet(packet, conn)
+                response = receive_packet(conn)
+            except (OSError, ConnectionError):
+                self.release(conn, reuse=False)
+                if reused and attempt == 0:
+                    continue
+                raise
+            if response is None:
+                self.release(conn, reuse=False)
+                if reused and attempt == 0:
+                    continue
+                return None
+            self.release(conn)
+            return response
+        return None
+
+    def _get_multiplexed(self, host: str, port: int) -> MultiplexedConnection:
+        address = (host, port)
+        with self.lock:
+            mux = self.multiplexed.get(address)
+            if mux is not None and not mux.closed:
+                return mux
+        conn = self._open(address)
+        mux = MultiplexedConnection(conn, self.idle_timeout, self.io_timeout)
+        with self.lock:
+            current = self.multiplexed.get(address)
+            if current is not None and not current.closed:
+                # somebody else was faster, keep a single shared connection per peer
+                mux.close()
+                return current
+            self.multiplexed[address] = mux
+        return mux
+
+    def submit(self, host: str, port: int, packet) -> Future:
+        '''
+        Sends a request without waiting for its answer. Requests to peers that agreed on request ids are pipelined over
+        a single shared connection, for all other peers they run concurrently over exclusive pooled connections.
+        :return: future resolving to the answer frame like request() returns it
+        '''
+        if self.get_capabilities(host, port).get("mux"):
+            for attempt in range(2):
+                try:
+                    return self._get_multiplexed(host, port).request(packet)
+                except (OSError, ConnectionError):
+                    # the shared connection broke, a new one is opened on the next attempt
+                    if attempt == 1:
+                        raise
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_parallel_requests,
+                                                   thread_name_prefix="pool-request")
+        return self.executor.submit(self.request, host, port, packet)
+
+    def get_idle_count(self) -> int:
+        return self.idle_count
+
+    def close_all(self):
+        '''Closes all idle connections, connections currently in use are closed on release.'''
+        with self.lock:
+            self.closed = True
+            idle = [conn for conns in self.idle.values() for conn in conns]
+            self.idle.clear()
+            self.idle_count = 0
+            multiplexed = list(self.multiplexed.values())
+            self.multiplexed.clear()
+        for conn in idle:
+            conn.close()
+        for mux in multiplexed:
+            mux.close()
+        if self.send_executor is not None:
+            self.send_executor.shutdown(wait=False)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
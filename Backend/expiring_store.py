@@ -0,0 +1,152 @@
+import math
+import threading
+import time
+from collections import deque
+
+
+class ExpiringStore:
+    '''
+    Dict-like store whose entries expire 'ttl' seconds after they were set, bounded to 'capacity' entries.
+
+    Expiry uses a timing wheel: time is cut into ticks of 'resolution' seconds and every tick owns a slot listing
+    the keys set during it. Moving the wheel forward by one tick drops the keys of the slot that is reused, so
+    every entry is removed exactly once and cleaning up costs amortized O(1) per set entry. If the store is full,
+    the oldest entries are evicted before their time.
+    Entries live at least 'ttl' and at most 'ttl' + 'resolution' seconds.
+    '''
+
+    def __init__(self, ttl: float = 60.0, capacity: int = 10000, resolution: float = 1.0, clock=time.monotonic):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.resolution = resolution
+        self.clock = clock
+
+        # one slot more than ticks in the ttl, the slot of the current tick is still being filled
+        self.n_slots = max(1, math.ceil(ttl / resolution)) + 1
+        self.slots = [deque() for _ in range(self.n_slots)]
+        self.current_tick = self._now()
+
+        # key: (value, tick the entry was set in)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _now(self) -> int:
+        return int(self.clock() / self.resolution)
+
+    def _advance(self):
+        tick = self._now()
+        if tick <= self.current_tick:
+            return
+
+        # after a whole turn without access every slot is outdated, there is no need to visit a slot twice
+        steps = min(tick - self.current_tick, self.n_slots)
+        for step in range(steps):
+            self._drop_slot((tick - step) % self.n_slots)
+        self.current_tick = tick
+
+    def _drop_slot(self, index: int):
+        slot = self.slots[index]
+        while slot:
+            key, tick = slot.popleft()
+            entry = self.entries.get(key)
+            # keys set again later are listed in a newer slot as well
+            if entry is not None and entry[1] == tick:
+                del self.entries[key]
+                self.expired += 1
+
+    def _evict_oldest(self):
+        # slots from the oldest tick to the current one
+        for offset in range(1, self.n_slots + 1):
+            slot = self.slots[(self.current_tick + offset) % self.n_slots]
+            while slot:
+                key, tick = slot.popleft()
+                entry = self.entries.get(key)
+                if entry is not None and entry[1] == tick:
+                    del self.entries[key]
+                    self.evicted += 1
+                    return
+
+    def _set(self, key, value):
+        if key not in self.entries and len(self.entries) >= self.capacity:
+            self._evict_oldest()
+        self.entries[key] = (value, self.current_tick)
+        self.slots[self.current_tick % self.n_slots].append((key, self.current_tick))
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self._advance()
+            self._set(key, value)
+
+    def add_if_absent(self, key, value) -> bool:
+        '''
+        Sets the entry only if the key is not stored yet, checking and setting is atomic.
+        :return: 'True' if the entry was set, 'False' if the key was already known
+        '''
+        with self.lock:
+            self._advance()
+            if key in self.entries:
+                return False
+            self._set(key, value)
+            return True
+
+    def get(self, key, default=None):
+        with self.lock:
+            self._advance()
+            entry = self.entries.get(key)
+        return default if entry is None else entry[0]
+
+    def __getitem__(self, key):
+        with self.lock:
+            self._advance()
+            return self.entries[key][0]
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            self._advance()
+            return key in self.entries
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        # the key stays listed in its slot and is skipped there
+        return default if entry is None else entry[0]
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self.entries[key]
+
+    def __len__(self) -> int:
+        with self.lock:
+            self._advance()
+            return len(self.entries)
+
+    def keys(self) -> list:
+        with self.lock:
+            self._advance()
+            return list(self.entries)
+
+    def values(self) -> list:
+        with self.lock:
+            self._advance()
+            return [value for value, _ in self.entries.values()]
+
+    def items(self) -> list:
+        with self.lock:
+            self._advance()
+            return [(key, value) for key, (value, _) in self.entries.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            self._advance()
+            return {
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                "ttl": self.ttl,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,71 @@
+import bisect
+import hashlib
+
+from Backend import config
+
+'''
+Consistent hashing of board ids onto the registry nodes listed in config.REGISTRY_NODES. Adding a registry node only
+moves the boards of the ring segments it takes over, about 1 / (number of nodes) of all boards.
+'''
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    '''
+    Every node is placed on the ring 'vnodes' times, a key belongs to the first nodes following its hash clockwise.
+    '''
+
+    def __init__(self, nodes, vnodes: int = 64):
+        '''
+        :param nodes: (host, port) of the registry nodes
+        '''
+        self.nodes = list(dict.fromkeys(tuple(node) for node in nodes))
+        self.vnodes = vnodes
+        points = sorted((_hash(f"{host}:{port}#{i}"), (host, port)) for host, port in self.nodes for i in range(vnodes))
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def get_nodes(self, key: str, count: int = 1) -> list:
+        '''
+        :param count: number of distinct nodes, the replicas of a key
+        :return: (host, port) of the nodes responsible for 'key', the primary first
+        '''
+        count = min(count, len(self.nodes))
+        selected = []
+        start = bisect.bisect(self.hashes, _hash(str(key)))
+        for i in range(len(self.owners)):
+            node = self.owners[(start + i) % len(self.owners)]
+            if node not in selected:
+                selected.append(node)
+                if len(selected) == count:
+                    break
+        return selected
+
+
+_rings: dict[tuple, HashRing] = {}
+
+
+def registry_nodes() -> list:
+    '''
+    :return: (host, port) of all registry nodes, only BOOTSTRAP unless config.REGISTRY_NODES is set
+    '''
+    nodes = getattr(config, "REGISTRY_NODES", None) or [config.BOOTSTRAP]
+    return [tuple(node) for node in nodes]
+
+
+def get_ring() -> HashRing:
+    nodes = tuple(registry_nodes())
+    ring = _rings.get(nodes)
+    if ring is None:
+        ring = _rings[nodes] = HashRing(nodes)
+    return ring
+
+
+def registry_owners(board_id: str) -> list:
+    '''
+    :return: (host, port) of the REGISTRY_REPLICATION registry nodes a board is registered with
+    '''
+    return get_ring().get_nodes(board_id, getattr(config, "REGISTRY_REPLICATION", 1))
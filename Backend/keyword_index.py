@@ -0,0 +1,168 @@
+import bisect
+import re
+import threading
+
+from Backend.keyword_summary import normalize_keyword
+
+'''
+Inverted index over all boards a node knows: term -> board ids. Terms are the normalized keywords and title words of
+a board. Exact lookups are a dict access, prefix lookups a binary search in the sorted list of all terms, so neither
+degrades with the number of boards, only with the number of matches.
+'''
+
+# where a board entry came from
+OWN = "own"
+REGISTERED = "registered"
+RECEIVED = "received"
+# ordered by authority, an entry is not replaced by the copy of a less authoritative source
+ALL_SOURCES = (OWN, REGISTERED, RECEIVED)
+
+TITLE_SEPARATOR = re.compile(r"\W+")
+
+
+def board_terms(board: dict) -> set:
+    '''
+    :param board: board entry in the format of data/boards.json
+    :return: normalized keywords and title words of the board
+    '''
+    terms = {normalize_keyword(keyword) for keyword in board.get("keywords") or []}
+    terms |= {normalize_keyword(word) for word in TITLE_SEPARATOR.split(board.get("board_title") or "")}
+    terms.discard("")
+    return terms
+
+
+class KeywordIndex:
+    '''
+    Thread safe, board entries are kept as they were added and returned as copies.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # board_id: (board entry, source, terms)
+        self.boards = {}
+        # term: set of board ids
+        self.postings: dict[str, set] = {}
+        # all terms of the postings in sorted order, for prefix lookups
+        self.terms = []
+
+    def _add(self, board: dict, source: str):
+        board_id = board.get("board_id")
+        if board_id is None:
+            return
+        existing = self.boards.get(board_id)
+        if existing is not None:
+            if ALL_SOURCES.index(existing[1]) < ALL_SOURCES.index(source):
+                return
+            self._remove(board_id)
+
+        terms = board_terms(board)
+        self.boards[board_id] = (dict(board), source, terms)
+        for term in terms:
+            ids = self.postings.get(term)
+            if ids is None:
+                ids = self.postings[term] = set()
+                bisect.insort(self.terms, term)
+            ids.add(board_id)
+
+    def _remove(self, board_id) -> bool:
+        entry = self.boards.pop(board_id, None)
+        if entry is None:
+            return False
+        for term in entry[2]:
+            ids = self.postings[term]
+            ids.discard(board_id)
+            if not ids:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+        return True
+
+    def add_board(self, board: dict, source: str = REGISTERED):
+        '''
+        Adds a board or replaces the entry with the same board_id, unless that one came from a more authoritative
+        source.
+        :param board: board entry in the format of data/boards.json, entries without board_id are ignored
+        '''
+        with self.lock:
+            self._add(board, source)
+
+    def remove_board(self, board_id, source: str = None) -> bool:
+        '''
+        :param source: only remove the entry if it came from this source
+        '''
+        with self.lock:
+            entry = self.boards.get(board_id)
+            if entry is None or (source is not None and entry[1] != source):
+                return False
+            return self._remove(board_id)
+
+    def remove_boards(self, predicate, source: str = None) -> list:
+        '''
+        :param predicate: called with every board entry, entries it returns 'True' for are removed
+        :return: removed board entries
+        '''
+        with self.lock:
+            removed = [board for board, board_source, _ in self.boards.values()
+                       if (source is None or board_source == source) and predicate(board)]
+            for board in removed:
+                self._remove(board["board_id"])
+        return removed
+
+    def replace_source(self, source: str, boards: list):
+        '''
+        Replaces all boards of a source, e.g. after a board list was loaded again.
+        '''
+        with self.lock:
+            for board_id in [board_id for board_id, entry in self.boards.items() if entry[1] == source]:
+                self._remove(board_id)
+            for board in boards:
+                self._add(board, source)
+
+    def _lookup(self, keyword: str, prefix: bool) -> set:
+        keyword = normalize_keyword(keyword)
+        if not keyword:
+            return set()
+        if not prefix:
+            return set(self.postings.get(keyword, ()))
+
+        ids = set()
+        for i in range(bisect.bisect_left(self.terms, keyword), len(self.terms)):
+            term = self.terms[i]
+            if not term.startswith(keyword):
+                break
+            ids |= self.postings[term]
+        return ids
+
+    def search(self, keywords, prefix: bool = False, sources=ALL_SOURCES) -> list:
+        '''
+        :param keywords: one of them has to match, no keywords match every board like Board.query_matches
+        :param prefix: keywords also match terms they are a prefix of
+        :param sources: sources of the boards to consider
+        :return: copies of the matching board entries
+        '''
+        with self.lock:
+            if keywords:
+                ids = set()
+                for keyword in keywords:
+                    ids |= self._lookup(keyword, prefix)
+            else:
+                ids = self.boards.keys()
+            return [dict(self.boards[board_id][0]) for board_id in ids if self.boards[board_id][1] in sources]
+
+    def get_terms(self, sources=ALL_SOURCES) -> set:
+        with self.lock:
+            terms = set()
+            for _, source, entry_terms in self.boards.values():
+                if source in sources:
+                    terms |= entry_terms
+            return terms
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            per_source = {source: 0 for source in ALL_SOURCES}
+            for _, source, _ in self.boards.values():
+                per_source[source] = per_source.get(source, 0) + 1
+            return {
+                "boards": len(self.boards),
+                "terms": len(self.terms),
+                "per_source": per_source,
+            }
@@ -0,0 +1,131 @@
+import base64
+import hashlib
+
+'''
+Compact summaries of the keywords reachable through a neighbour, used to forward PINGs only where they can match.
+
+A summary is an attenuated Bloom filter: level 0 holds the keywords of the boards of a node itself, level i the
+keywords of the nodes i hops further away (the union of level i - 1 of all its neighbours). A PING that may still
+travel t hops past a neighbour is only worth sending to it if one of its levels 0..t - 1 may contain a keyword.
+Bloom filters have false positives but no false negatives, so pruning never hides a matching board that is
+covered by the summary.
+'''
+
+SUMMARY_BITS = 4096
+SUMMARY_HASHES = 4
+# levels of a summary, hops beyond this depth are not covered and the PING is forwarded as if it matched
+SUMMARY_DEPTH = 3
+
+
+def normalize_keyword(keyword: str) -> str:
+    return str(keyword).strip().lower()
+
+
+class BloomFilter:
+    '''
+    Bloom filter over strings, the bit array is a python int.
+    '''
+
+    def __init__(self, n_bits: int = SUMMARY_BITS, n_hashes: int = SUMMARY_HASHES, bits: int = 0):
+        self.n_bits = n_bits
+        self.n_hashes = n_hashes
+        self.bits = bits
+
+    def _positions(self, key: str):
+        # double hashing, two 64 bit halves of one digest give all positions
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits |= 1 << position
+
+    def might_contain(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits >> position & 1 for position in self._positions(key))
+
+    def union(self, other: "BloomFilter") -> "BloomFilter":
+        if (other.n_bits, other.n_hashes) != (self.n_bits, self.n_hashes):
+            raise ValueError("bloom filters of different shapes can not be combined")
+        return BloomFilter(self.n_bits, self.n_hashes, self.bits | other.bits)
+
+    def get_fill_ratio(self) -> float:
+        return self.bits.bit_count() / self.n_bits
+
+    def to_bytes(self) -> bytes:
+        return self.bits.to_bytes(self.n_bits // 8, "big")
+
+    @classmethod
+    def from_bytes(cls, data: bytes, n_bits: int, n_hashes: int) -> "BloomFilter":
+        if len(data) * 8 != n_bits:
+            raise ValueError("bloom filter size does not match")
+        return cls(n_bits, n_hashes, int.from_bytes(data, "big"))
+
+
+class KeywordSummary:
+    '''
+    Attenuated Bloom filter, see the module description.
+    '''
+
+    def __init__(self, levels: list[BloomFilter]):
+        self.levels = levels
+
+    @classmethod
+    def build(cls, keywords, neighbour_summaries, depth: int = SUMMARY_DEPTH) -> "KeywordSummary":
+        '''
+        :param keywords: keywords of the boards of this node
+        :param neighbour_summaries: latest summaries received from the neighbours
+        '''
+        own = BloomFilter()
+        for keyword in keywords:
+            own.add(normalize_keyword(keyword))
+
+        levels = [own]
+        for level in range(1, depth):
+            combined = BloomFilter()
+            for summary in neighbour_summaries:
+                if len(summary.levels) >= level:
+                    combined = combined.union(summary.levels[level - 1])
+            levels.append(combined)
+        return cls(levels)
+
+    def might_match(self, keywords, hops: int) -> bool:
+        '''
+        :param keywords: keywords of a PING, one of them has to match
+        :param hops: number of nodes the PING may still reach through this neighbour, the neighbour itself included
+        :return: 'False' only if none of the reachable nodes covered by the summary can have a matching board
+        '''
+        if hops > len(self.levels):
+            # the summary does not see that far, it can not rule anything out
+            return True
+        levels = self.levels[:max(hops, 0)]
+        for keyword in keywords:
+            keyword = normalize_keyword(keyword)
+            if any(level.might_contain(keyword) for level in levels):
+                return True
+        return False
+
+    def to_payload(self) -> dict:
+        own = self.levels[0]
+        return {
+            "n_bits": own.n_bits,
+            "n_hashes": own.n_hashes,
+            "levels": [base64.b64encode(level.to_bytes()).decode("ascii") for level in self.levels],
+        }
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "KeywordSummary":
+        '''
+        :raise ValueError: if the payload is no summary of the expected shape
+        '''
+        try:
+            n_bits = int(payload["n_bits"])
+            n_hashes = int(payload["n_hashes"])
+            levels = [BloomFilter.from_bytes(base64.b64decode(level), n_bits, n_hashes) for level in payload["levels"]]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"malformed keyword summary: {e}")
+        if (n_bits, n_hashes) != (SUMMARY_BITS, SUMMARY_HASHES) or not levels:
+            raise ValueError("keyword summary of an unsupported shape")
+        return cls(levels)
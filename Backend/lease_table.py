@@ -0,0 +1,100 @@
+import heapq
+import threading
+import time
+
+'''
+Leases of the boards registered with a registry node. A board stays registered only while its owner renews the lease
+with heartbeats, boards of crashed peers are removed once their lease ran out. Leases are soft state: they are kept in
+memory only, a restarted registry node grants every board it loaded a fresh lease.
+'''
+
+
+class LeaseTable:
+    '''
+    Expiry time per board id plus a heap ordered by expiry. Renewing a lease pushes a new heap entry and leaves the old
+    one behind, it is skipped when it comes up. Granting, renewing and evicting a lease cost O(log n), the heap is
+    rebuilt once it holds more than twice as many entries as there are leases. Thread safe.
+    '''
+
+    def __init__(self, duration: float, clock=time.monotonic):
+        '''
+        :param duration: seconds a lease lasts after it was granted or renewed
+        '''
+        self.duration = duration
+        self.clock = clock
+        self.lock = threading.Lock()
+        # board_id: time the lease ends
+        self.expiries: dict = {}
+        # (time the lease ends, board_id), entries of renewed or released leases stay until they come up
+        self.heap: list = []
+
+        self.granted = 0
+        self.renewed = 0
+        self.expired = 0
+
+    def grant(self, board_ids) -> float:
+        '''
+        Grants new leases or renews existing ones.
+        :return: time the leases end
+        '''
+        with self.lock:
+            expiry = self.clock() + self.duration
+            for board_id in board_ids:
+                if board_id in self.expiries:
+                    self.renewed += 1
+                else:
+                    self.granted += 1
+                self.expiries[board_id] = expiry
+                heapq.heappush(self.heap, (expiry, board_id))
+            if len(self.heap) > 2 * len(self.expiries) + 64:
+                self.heap = [(expiry, board_id) for board_id, expiry in self.expiries.items()]
+                heapq.heapify(self.heap)
+            return expiry
+
+    def release(self, board_ids):
+        '''
+        Drops the leases of unregistered boards.
+        '''
+        with self.lock:
+            for board_id in board_ids:
+                self.expiries.pop(board_id, None)
+
+    def _skip_outdated(self):
+        while self.heap and self.expiries.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def next_expiry(self):
+        '''
+        :return: time the next lease ends or 'None' if there is none
+        '''
+        with self.lock:
+            self._skip_outdated()
+            return self.heap[0][0] if self.heap else None
+
+    def pop_expired(self, now: float = None) -> list:
+        '''
+        Removes the leases that ended.
+        :return: ids of their boards, the earliest first
+        '''
+        with self.lock:
+            now = self.clock() if now is None else now
+            expired = []
+            self._skip_outdated()
+            while self.heap and self.heap[0][0] <= now:
+                _, board_id = heapq.heappop(self.heap)
+                del self.expiries[board_id]
+                expired.append(board_id)
+                self._skip_outdated()
+            self.expired += len(expired)
+            return expired
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "duration": self.duration,
+                "leases": len(self.expiries),
+                "heap": len(self.heap),
+                "granted": self.granted,
+                "renewed": self.renewed,
+                "expired": self.expired,
+            }
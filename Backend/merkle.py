@@ -0,0 +1,110 @@
+import hashlib
+import json
+
+'''
+Hash tree over board entries for the anti-entropy of registry copies. The board ids are spread by their md5 over
+FANOUT ** DEPTH key ranges (the leaves), every node of the tree is addressed by the hex prefix of the md5 it covers:
+"" is the root, "a" a branch and "a3" a leaf with the default depth of 2. Two copies compare the digests top down and
+only walk into the subtrees that differ, so the bytes exchanged grow with the number of changed ranges and not with the
+size of the registry.
+'''
+
+FANOUT = 16
+DEPTH = 2
+
+
+def key_hash(board_id) -> str:
+    return hashlib.md5(str(board_id).encode("utf-8")).hexdigest()
+
+
+def entry_digest(board: dict) -> int:
+    '''
+    :return: 128 bit digest of a board entry, equal entries have equal digests regardless of the key order
+    '''
+    data = json.dumps(board, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return int.from_bytes(hashlib.md5(data.encode("utf-8")).digest(), "big")
+
+
+class MerkleTree:
+    '''
+    The digest of a node is the XOR of the digests of all entries below it, so adding, changing or removing an entry
+    updates the DEPTH + 1 nodes on its path in O(DEPTH) without rehashing any range. Not thread safe, the owner locks.
+    '''
+
+    def __init__(self, depth: int = DEPTH):
+        self.depth = depth
+        # prefix: XOR of the entry digests below it, prefixes without entries are left out
+        self.nodes: dict[str, int] = {}
+        # leaf prefix: {board_id: entry digest}
+        self.leaves: dict[str, dict] = {}
+
+    def leaf_of(self, board_id) -> str:
+        return key_hash(board_id)[:self.depth]
+
+    def _toggle(self, leaf: str, digest: int):
+        for length in range(self.depth + 1):
+            prefix = leaf[:length]
+            value = self.nodes.get(prefix, 0) ^ digest
+            if value:
+                self.nodes[prefix] = value
+            else:
+                self.nodes.pop(prefix, None)
+
+    def put(self, board: dict):
+        board_id = board["board_id"]
+        leaf = self.leaf_of(board_id)
+        entries = self.leaves.setdefault(leaf, {})
+        old = entries.get(board_id)
+        digest = entry_digest(board)
+        if old == digest:
+            return
+        if old is not None:
+            self._toggle(leaf, old)
+        entries[board_id] = digest
+        self._toggle(leaf, digest)
+
+    def remove(self, board_id):
+        leaf = self.leaf_of(board_id)
+        entries = self.leaves.get(leaf)
+        if not entries or board_id not in entries:
+            return
+        self._toggle(leaf, entries.pop(board_id))
+        if not entries:
+            del self.leaves[leaf]
+
+    def get_digest(self, prefix: str = "") -> str:
+        return format(self.nodes.get(prefix, 0), "032x")
+
+    def get_children(self, prefix: str) -> dict:
+        '''
+        :return: {child prefix: hex digest} of the non-empty children of an inner node
+        '''
+        if len(prefix) >= self.depth:
+            raise ValueError(f"{prefix!r} is a leaf")
+        children = {}
+        for digit in "0123456789abcdef"[:FANOUT]:
+            child = prefix + digit
+            if child in self.nodes:
+                children[child] = self.get_digest(child)
+        return children
+
+    def get_ids(self, leaf: str) -> list:
+        '''
+        :return: ids of the boards in the key range of a leaf
+        '''
+        return list(self.leaves.get(leaf, ()))
+
+    def is_leaf(self, prefix: str) -> bool:
+        return len(prefix) == self.depth
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.leaves.values())
+
+
+def diff_children(own: dict, other: dict) -> list:
+    '''
+    :param own: {child prefix: hex digest} of a node on this side
+    :param other: the same of the other side
+    :return: child prefixes whose digests differ, including children only one side has
+    '''
+    return sorted(prefix for prefix in set(own) | set(other) if own.get(prefix) != other.get(prefix))
@@ -0,0 +1,165 @@
+import bisect
+import threading
+
+from message_type import MessageType
+
+'''
+Runtime metrics of a node in the text format Prometheus scrapes:
+https://prometheus.io/docs/instrumenting/exposition_formats/
+
+Recording only increments a few counters under a lock, everything else (sorting, formatting, gauges like the thread
+count) is done when the metrics are scraped.
+'''
+
+# upper bounds of the handler latency buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+INCOMING = "incoming"
+OUTGOING = "outgoing"
+
+# the type of a frame is chosen by its sender, anything but a known message type is counted as UNKNOWN so that peers
+# can not create new label series
+UNKNOWN = "unknown"
+MALFORMED = "malformed"
+TYPE_LABELS = frozenset(msg_type.value for msg_type in MessageType) | {UNKNOWN, MALFORMED}
+
+
+def type_label(msg_type) -> str:
+    '''
+    :return: the label a message type is counted under
+    '''
+    msg_type = getattr(msg_type, "value", msg_type)
+    return msg_type if isinstance(msg_type, str) and msg_type in TYPE_LABELS else UNKNOWN
+
+
+def escape_label(value) -> str:
+    '''
+    :return: value escaped for a label of the text exposition format
+    '''
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    '''
+    Cumulative histogram with fixed buckets, not thread safe on its own.
+    '''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # one more slot for observations above the last bucket (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list:
+        result = []
+        total = 0
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+
+class NodeMetrics:
+    '''
+    Counters of a single node: messages, bytes, handler latency and errors per message type plus open connections.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages_in: dict[str, int] = {}
+        self.bytes_in: dict[str, int] = {}
+        self.messages_out: dict[str, int] = {}
+        self.bytes_out: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self.latency: dict[str, Histogram] = {}
+        self.connections = {INCOMING: 0, OUTGOING: 0}
+
+    def record_in(self, msg_type: str, n_bytes: int):
+        msg_type = type_label(msg_type)
+        with self.lock:
+            self.messages_in[msg_type] = self.messages_in.get(msg_type, 0) + 1
+            self.bytes_in[msg_type] = self.bytes_in.get(msg_type, 0) + n_bytes
+
+    def record_out(self, msg_type: str, n_bytes: int):
+        msg_type = type_label(msg_type)
+        with self.lock:
+            self.messages_out[msg_type] = self.messages_out.get(msg_type, 0) + 1
+            self.bytes_out[msg_type] = self.bytes_out.get(msg_type, 0) + n_bytes
+
+    def record_handled(self, msg_type: str, seconds: float, failed: bool = False):
+        msg_type = type_label(msg_type)
+        with self.lock:
+            histogram = self.latency.get(msg_type)
+            if histogram is None:
+                histogram = self.latency[msg_type] = Histogram()
+            histogram.observe(seconds)
+            if failed:
+                self.errors[msg_type] = self.errors.get(msg_type, 0) + 1
+
+    def record_error(self, msg_type: str):
+        msg_type = type_label(msg_type)
+        with self.lock:
+            self.errors[msg_type] = self.errors.get(msg_type, 0) + 1
+
+    def connection_opened(self, direction: str):
+        with self.lock:
+            self.connections[direction] += 1
+
+    def connection_closed(self, direction: str):
+        with self.lock:
+            self.connections[direction] -= 1
+
+    def render(self, gauges: dict = None, counters: dict = None) -> str:
+        '''
+        :param gauges: additional gauges as {name: (help, value)}, collected by the caller at scrape time
+        :param counters: additional counters as {name: (help, value)}
+        :return: all metrics in the Prometheus text exposition format
+        '''
+        with self.lock:
+            per_type = [
+                ("peernote_messages_received_total", "Frames received per message type", dict(self.messages_in)),
+                ("peernote_received_bytes_total", "Bytes received per message type", dict(self.bytes_in)),
+                ("peernote_messages_sent_total", "Frames sent per message type", dict(self.messages_out)),
+                ("peernote_sent_bytes_total", "Bytes sent per message type", dict(self.bytes_out)),
+                ("peernote_handler_errors_total", "Failed or malformed frames per message type", dict(self.errors)),
+            ]
+            latency = {msg_type: (h.cumulative_counts(), h.sum, h.count) for msg_type, h in self.latency.items()}
+            connections = dict(self.connections)
+
+        lines = []
+        for name, help_text, values in per_type:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for msg_type, value in sorted(values.items()):
+                lines.append(f'{name}{{type="{escape_label(msg_type)}"}} {value}')
+
+        name = "peernote_handler_latency_seconds"
+        lines.append(f"# HELP {name} Time spent handling a frame per message type")
+        lines.append(f"# TYPE {name} histogram")
+        for msg_type, (cumulative, total, count) in sorted(latency.items()):
+            msg_type = escape_label(msg_type)
+            for bound, value in zip(LATENCY_BUCKETS, cumulative):
+                lines.append(f'{name}_bucket{{type="{msg_type}",le="{bound}"}} {value}')
+            lines.append(f'{name}_bucket{{type="{msg_type}",le="+Inf"}} {cumulative[-1]}')
+            lines.append(f'{name}_sum{{type="{msg_type}"}} {total}')
+            lines.append(f'{name}_count{{type="{msg_type}"}} {count}')
+
+        name = "peernote_connections_active"
+        lines.append(f"# HELP {name} Open connections per direction")
+        lines.append(f"# TYPE {name} gauge")
+        for direction, value in sorted(connections.items()):
+            lines.append(f'{name}{{direction="{escape_label(direction)}"}} {value}')
+
+        for metric_type, metrics in (("gauge", gauges or {}), ("counter", counters or {})):
+            for name, (help_text, value) in metrics.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
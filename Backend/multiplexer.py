@@ -0,0 +1,103 @@
+import itertools
+import select
+import threading
+import time
+from concurrent.futures import Future
+
+from Backend.peer_message_handler import send_packet, receive_frame
+
+
+class MultiplexedConnection:
+    '''
+    One connection shared by many outstanding requests.
+    Every request carries its own request id in the frame header and is answered with the same id, so requests can be
+    sent back to back without waiting and answers are matched no matter in which order they arrive.
+    A reader thread owns the receiving side of the connection and resolves the futures handed out by request().
+    '''
+
+    def __init__(self, conn, idle_timeout: float, request_timeout: float):
+        '''
+        :param conn: connected PeerConnection, owned by this object from now on
+        :param idle_timeout: seconds without outstanding requests after which the connection is closed
+        :param request_timeout: seconds to wait for the next answer while requests are outstanding
+        '''
+        self.conn = conn
+        self.address = conn.address
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.pending: dict[int, Future] = {}
+        self.request_ids = itertools.count(1)
+        # guards pending and serializes writes of different callers
+        self.lock = threading.Lock()
+        self.closed = False
+        self.last_activity = time.monotonic()
+
+        threading.Thread(target=self._read_answers, daemon=True).start()
+
+    def request(self, packet) -> Future:
+        '''
+        Sends a request without waiting for the answer.
+        :return: future resolving to the raw answer frame
+        :raise ConnectionError: if the connection is already closed
+        '''
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("multiplexed connection is closed")
+            request_id = next(self.request_ids) & 0xFFFFFFFF
+            self.pending[request_id] = future
+            self.last_activity = time.monotonic()
+            try:
+                send_packet(packet, self.conn, request_id)
+            except OSError:
+                del self.pending[request_id]
+                self.closed = True
+                raise
+        return future
+
+    def _read_answers(self):
+        error = None
+        while not self.closed:
+            # wait for the start of the next frame, only a frame that already started is read with the socket timeout
+            try:
+                readable, _, _ = select.select([self.conn], [], [], 1)
+            except (OSError, ValueError) as e:
+                error = e
+                break
+
+            if not readable:
+                waited = time.monotonic() - self.last_activity
+                if (self.pending and waited > self.request_timeout) or (not self.pending and waited > self.idle_timeout):
+                    error = TimeoutError("no answer from peer")
+                    break
+                continue
+
+            try:
+                frame = receive_frame(self.conn)
+            except (OSError, ConnectionError) as e:
+                error = e
+                break
+            if frame is None:
+                break
+
+            request_id, data = frame
+            with self.lock:
+                self.last_activity = time.monotonic()
+                future = self.pending.pop(request_id, None)
+            # frames without a known request id are not meant for anybody waiting here
+            if future is not None:
+                future.set_result(data)
+
+        self.close(error)
+
+    def get_pending_count(self) -> int:
+        return len(self.pending)
+
+    def close(self, error: Exception = None):
+        with self.lock:
+            self.closed = True
+            pending = list(self.pending.values())
+            self.pending.clear()
+        self.conn.close()
+        for future in pending:
+            future.set_exception(error or ConnectionError("connection closed before the answer arrived"))
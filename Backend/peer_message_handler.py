@@ -1,3 +1,4 @@
+import asyncio
 import random
 import struct
 import threading
@@ -6,82 +7,310 @@ from collections import deque
 
 from message_type import MessageType
 from datetime import datetime
-import json
 import socket
 from Backend.config import BOOTSTRAP
+from Backend.hash_ring import registry_nodes
+from Backend.keyword_index import OWN, RECEIVED, REGISTERED
+from Backend.wire_format import JSON, SUPPORTED_CODECS, choose_codec, detect_codec, encode, decode
+from Backend.compression import COMPRESSION_THRESHOLD, SUPPORTED_COMPRESSIONS, choose_compression, compress_frame, \
+    decompress_frame
 
 HEADER_SIZE = 4
+# the highest bit of the length header marks frames followed by a 4 byte request id,
+# only sent to peers that agreed on multiplexing during CONNECT
+FLAG_REQUEST_ID = 0x80000000
+# the second highest bit marks compressed frames, only sent to peers that agreed on a compression during CONNECT
+FLAG_COMPRESSED = 0x40000000
+LENGTH_MASK = 0x3FFFFFFF
+REQUEST_ID_SIZE = 4
+
+# frames announcing more bytes are rejected before anything is allocated for them
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# receive buffers kept by a connection between frames, bigger frames get a temporary buffer
+RECEIVE_BUFFER_SIZE = 64 * 1024
+MAX_RETAINED_BUFFER_SIZE = 1024 * 1024
+
+# search strategies, carried as "mode" in the PING payload
+# flooding forwards a PING to every neighbour, a random walker to a single random one per hop and uses its ttl as
+# step budget. Walkers need far fewer messages on large sparse overlays but take longer to find rare boards.
+SEARCH_FLOOD = "flood"
+SEARCH_RANDOM_WALK = "random_walk"
+
+
+class FrameTooLargeError(ConnectionError):
+    '''
+    The length header announced a frame above the allowed maximum. The rest of the stream can not be trusted anymore,
+    so the connection has to be closed like for any other broken connection.
+    '''
 
 
 def create_packet(msg_type: MessageType, node_id: str, host: str, port: int, is_super, payload: list):
     '''
-    Create a json string by inserting the parameters in the following frame:
+    Create a message by inserting the parameters in the following frame:
 
     "type": MessageType,
     "node_id": uuid,
     "timestmap": timestamp of sending,
     "payload": payload
+
+    The message is only encoded in send_packet, with the codec negotiated for the connection it is sent over.
     :param msg_type: type of message
     :param node_id: unique user id
     :param payload: user definied dict
     :return:
     '''
-    # serialize to json string
-    return json.dumps({
+    return {
         "type": msg_type,
         "node_id": node_id,
         "host": host,
         "port": port,
         "super": is_super,
-        # might be too dirty, need to maybe deserialize it
-        "timestamp": str(datetime.now()),
+        # epoch seconds
+        "timestamp": time.time(),
         "payload": payload
-    })
+    }
+
 
+def encode_packet(data, conn) -> bytes:
+    '''
+    Encodes a message created by create_packet with the codec of the connection (JSON if none was negotiated).
+    Already serialized json strings are sent as they are.
+    '''
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    return encode(data, getattr(conn, "codec", JSON))
+
+
+def decode_packet(data) -> dict:
+    '''
+    Decodes a frame returned by receive_packet, the codec is detected from the frame itself.
+    '''
+    return decode(data)
 
-def send_packet(data: str, conn: socket):
+
+def frame_header(length: int, request_id: int = None, compressed: bool = False) -> bytes:
+    if compressed:
+        length |= FLAG_COMPRESSED
+    if request_id is None:
+        return length.to_bytes(HEADER_SIZE, byteorder='big')
+    return struct.pack(">II", length | FLAG_REQUEST_ID, request_id)
+
+
+def send_packet(data, conn: socket, request_id: int = None):
+    '''
+    Sends a single frame.
+    :param request_id: id of the request this frame belongs to, by default the id of the request the connection is
+    currently answering (if any)
+    '''
+    if request_id is None:
+        request_id = getattr(conn, "request_id", None)
+    encoded = encode_packet(data, conn)
+    # big frames are compressed if the peer agreed on it
+    compressed = None
+    if getattr(conn, "compression", None):
+        compressed = compress_frame(encoded, getattr(conn, "compression_threshold", COMPRESSION_THRESHOLD))
+        if compressed is not None:
+            encoded = compressed
     # prepare header containing how much bytes are being send in this packet
-    header = len(data).to_bytes(HEADER_SIZE, byteorder='big')
+    header = frame_header(len(encoded), request_id, compressed is not None)
     # send real packet
-    conn.sendall(header + bytes(data, encoding="utf-8"))
+    conn.sendall(header + encoded)
 
+    metrics = getattr(conn, "metrics", None)
+    if metrics is not None:
+        msg_type = data.get("type") if isinstance(data, dict) else "unknown"
+        metrics.record_out(getattr(msg_type, "value", msg_type), len(header) + len(encoded))
 
-def receive_packet(conn: socket):
-    header = receive_exactly(n_bytes=HEADER_SIZE, conn=conn, header=True)
+
+def receive_frame(conn: socket, copy: bool = True):
+    '''
+    Receives a single frame together with its request id.
+    The frame is received with recv_into into the reusable buffer of the connection (if it has one).
+    :param copy: 'False' returns a memoryview into that buffer instead of a copy. It is only valid until the next frame
+    is received on the connection, so it must be decoded right away.
+    :return: tuple (request_id, data), request_id is 'None' for frames without one, or 'None' if the connection was
+    closed before a new frame started
+    :raise FrameTooLargeError: if the frame is bigger than the maximum frame size of the connection
+    '''
+    buffer = get_receive_buffer(conn, HEADER_SIZE + REQUEST_ID_SIZE)
     # no header no package
-    if header is None:
+    if not receive_into(conn, buffer[:HEADER_SIZE], header=True):
         return None
 
-    data_size = struct.unpack(">i", header)[0]
-    # receive data
-    data = receive_exactly(data_size, conn)
-    data = data.decode("utf-8")
-    return data
+    data_size = struct.unpack_from(">I", buffer)[0]
+    flags = data_size & ~LENGTH_MASK
+    data_size &= LENGTH_MASK
+    request_id = None
+    if flags & FLAG_REQUEST_ID:
+        receive_into(conn, buffer[HEADER_SIZE:HEADER_SIZE + REQUEST_ID_SIZE])
+        request_id = struct.unpack_from(">I", buffer, HEADER_SIZE)[0]
+
+    max_frame_size = getattr(conn, "max_frame_size", MAX_FRAME_SIZE)
+    check_frame_size(data_size, max_frame_size)
+
+    # receive data, decoding is left to decode_packet
+    data = get_receive_buffer(conn, data_size)[:data_size]
+    receive_into(conn, data)
+    if flags & FLAG_COMPRESSED:
+        return request_id, decompress_body(data, max_frame_size)
+    return request_id, bytes(data) if copy else data
 
 
-def receive_exactly(n_bytes, conn, header: bool = False):
+def receive_packet(conn: socket, copy: bool = True):
+    frame = receive_frame(conn, copy)
+    if frame is None:
+        return None
+    return frame[1]
+
+
+class FrameReader:
+    '''
+    Assembles the frames of a non-blocking connection from the bytes that arrived so far, so that the accept loop can
+    wait for a whole frame without a thread blocking on the connection. Bytes of a following frame stay in the buffer.
+    '''
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+        # time.monotonic() the first byte of the incomplete frame in the buffer arrived, 'None' if there is none
+        self.started = None
+
+    def receive(self, conn) -> bool:
+        '''
+        Reads the bytes available on the connection without blocking, at most RECEIVE_BUFFER_SIZE per call.
+        :return: 'False' if the remote side closed the connection
+        '''
+        try:
+            part = conn.recv(RECEIVE_BUFFER_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return True
+        if not part:
+            return False
+        if not self.buffer:
+            self.started = time.monotonic()
+        self.buffer += part
+        return True
+
+    def next_frame(self):
+        '''
+        :return: tuple (request_id, data, compressed) of the first complete frame in the buffer or 'None'
+        :raise FrameTooLargeError: if the frame is bigger than max_frame_size
+        '''
+        if len(self.buffer) < HEADER_SIZE:
+            return None
+        data_size = struct.unpack_from(">I", self.buffer)[0]
+        flags = data_size & ~LENGTH_MASK
+        data_size &= LENGTH_MASK
+        check_frame_size(data_size, self.max_frame_size)
+
+        start = HEADER_SIZE + (REQUEST_ID_SIZE if flags & FLAG_REQUEST_ID else 0)
+        end = start + data_size
+        if len(self.buffer) < end:
+            return None
+        request_id = struct.unpack_from(">I", self.buffer, HEADER_SIZE)[0] if flags & FLAG_REQUEST_ID else None
+        data = bytes(self.buffer[start:end])
+        # a fresh buffer, a big frame must not pin its memory until the connection is closed
+        self.buffer = self.buffer[end:]
+        self.started = time.monotonic() if self.buffer else None
+        return request_id, data, bool(flags & FLAG_COMPRESSED)
+
+
+def decompress_body(data, max_frame_size: int) -> bytes:
+    try:
+        return decompress_frame(data, max_frame_size)
+    except ValueError as e:
+        # the length was fine, but nobody can tell what the peer meant to send
+        raise ConnectionError(str(e))
+
+
+def check_frame_size(data_size: int, max_frame_size: int):
+    if data_size > max_frame_size:
+        raise FrameTooLargeError(f"frame of {data_size} bytes exceeds the maximum of {max_frame_size} bytes")
+
+
+def get_receive_buffer(conn, n_bytes: int) -> memoryview:
     '''
+    :return: view of at least n_bytes on the receive buffer of the connection, the buffer only grows if needed
+    '''
+    # plain sockets can not keep a buffer, they get a fresh one for every frame
+    if not hasattr(conn, "receive_buffer"):
+        return memoryview(bytearray(n_bytes))
+
+    buffer = conn.receive_buffer
+    if buffer is not None and len(buffer) >= n_bytes:
+        return buffer
 
+    view = memoryview(bytearray(max(n_bytes, RECEIVE_BUFFER_SIZE)))
+    # an exceptionally big frame must not pin its memory for the lifetime of the connection
+    if n_bytes <= MAX_RETAINED_BUFFER_SIZE:
+        conn.receive_buffer = view
+    return view
 
-    :param n_bytes: n bytes to receive
-    :param conn: connection to receive bytes from
-    :return: buffer containing readed byte
+
+def receive_into(conn, view: memoryview, header: bool = False) -> bool:
+    '''
+    Fills the whole view with bytes from the connection.
+    :param header: 'True' if the view is the start of a new frame, closing the connection before is no error then
+    :return: 'False' if the connection was closed before the first byte of a header, otherwise 'True'
     '''
-    buf = bytearray()
+    n_bytes = len(view)
+    received = 0
     # Ensure that exactly the desired amount of bytes is received
-    while len(buf) < n_bytes:
+    while received < n_bytes:
         # passive waiting until data is coming
-        part = conn.recv(n_bytes - len(buf))
+        part = conn.recv_into(view[received:])
         if not part:
-            if header and len(buf) == 0:
-                return None
-            # connection is closed from the other side if this happens
-            else:
-                # this happens when the header did contain more bytes to read, than the buffer really contained, or any other kind of error
-                raise ConnectionError("unexpected closing while receiving data.")
-        buf.extend(part)
-    return buf
+            if header and received == 0:
+                return False
+            # this happens when the header did contain more bytes to read, than the buffer really contained, or any other kind of error
+            raise ConnectionError("unexpected closing while receiving data.")
+        received += part
+    return True
+
 
+async def async_send_packet(data, writer, codec: str = JSON, request_id: int = None, compression: str = None,
+                            compression_threshold: int = COMPRESSION_THRESHOLD):
+    '''
+    asyncio counterpart of send_packet, uses the same framing.
+    :param writer: asyncio.StreamWriter of the connection
+    :param compression: compression agreed on with the peer, 'None' sends the frame uncompressed
+    '''
+    encoded = data.encode("utf-8") if isinstance(data, str) else encode(data, codec)
+    # big frames are compressed if the peer agreed on it
+    compressed = compress_frame(encoded, compression_threshold) if compression else None
+    if compressed is not None:
+        encoded = compressed
+    writer.write(frame_header(len(encoded), request_id, compressed is not None) + encoded)
+    await writer.drain()
+
+
+async def async_receive_frame(reader, max_frame_size: int = MAX_FRAME_SIZE):
+    '''
+    asyncio counterpart of receive_frame, uses the same framing.
+    :param reader: asyncio.StreamReader of the connection
+    :return: tuple (request_id, data) or 'None' if the connection was closed before a new frame started
+    '''
+    try:
+        header = await reader.readexactly(HEADER_SIZE)
+    except asyncio.IncompleteReadError as e:
+        if len(e.partial) == 0:
+            return None
+        raise ConnectionError("unexpected closing while receiving data.")
+
+    data_size = struct.unpack(">I", header)[0]
+    flags = data_size & ~LENGTH_MASK
+    data_size &= LENGTH_MASK
+    request_id = None
+    try:
+        if flags & FLAG_REQUEST_ID:
+            request_id = struct.unpack(">I", await reader.readexactly(REQUEST_ID_SIZE))[0]
+        check_frame_size(data_size, max_frame_size)
+        data = await reader.readexactly(data_size)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("unexpected closing while receiving data.")
+    if flags & FLAG_COMPRESSED:
+        return request_id, decompress_body(data, max_frame_size)
+    return request_id, data
 
 
 def handle_ping(node, conn, data: dict):
@@ -97,23 +326,50 @@ def handle_ping(node, conn, data: dict):
     origin_port = payload.get("origin"
                               "_port")
 
-    if ping_id in node.routing_table:
+    walker = payload.get("mode") == SEARCH_RANDOM_WALK
+    prefix = bool(payload.get("prefix", False))
+
+    # checking and remembering the ping is atomic, the same ping may arrive on several connections at once.
+    # PONGs go back to the listening address of the sender, the connection the PING came on may be gone by then
+    route = ((data.get("host"), data.get("port")), time.time(), (origin_host, origin_port))
+    first_visit = node.routing_table.add_if_absent(ping_id, route)
+    if not first_visit and not walker:
         print("Already received PING --> ignoring")
         # ignore duplicate ping
         return
+    if not first_visit:
+        # walkers cross each other and go in circles, they answer only once per node but keep walking
+        print("Walker visited again --> forwarding only")
+
+    # Der Bootstrap Node schickt einer Origin mit Kopie der Registry nur die Änderungen seit deren Version und die
+    # IDs der passenden registrierten Boards statt der Boards selbst
+    # Ein Super Peer mit vollständiger Kopie der Registry hat den registrierten Teil der Suche schon beantwortet,
+    # die Nodes dahinter (auch die Registry Nodes) suchen darin nicht noch einmal
+    registry_served = bool(payload.get("registry_served"))
+    registry_position = payload.get("registry") if node.bootstrap and first_visit else None
+    registry_changes = None
+    registry_matches = []
+    if registry_position is not None:
+        registry_changes = node.get_registry_changes(registry_position)
+        if not registry_served:
+            registry_matches = [board["board_id"]
+                                for board in node.find_matching_boards(keywords, prefix, (REGISTERED,))]
+        boards = node.find_matching_boards(keywords, prefix, (OWN,))
+    elif first_visit:
+        # Match prüfen, über den Keyword Index aller eigenen und registrierten (oder kopierten) Boards
+        sources = node._answer_sources()
+        if registry_served:
+            sources = tuple(source for source in sources if source not in (REGISTERED, RECEIVED))
+        boards = node.find_matching_boards(keywords, prefix, sources)
+        # a registry node holds only its shard, a super peer's copy holds all of them
+        registry_served = registry_served or RECEIVED in sources
     else:
-        node.routing_table[ping_id] = (conn, time.time())
+        boards = []
 
-    # Match prüfen
-    if True:
-        print(f"Node-board id {node.board.board_id}")
-        try:
-            with open("data/boards.json", "r", encoding="utf-8") as f:
-                boards = json.load(f)
-                print(f"[BOOTSTRAP] Loaded boards: {boards}")
-        except Exception as e:
-            print(f"[BOOTSTRAP] Fehler beim Laden von board.json: {e}")
-            boards = []
+    registry_updated = registry_changes is not None and (
+            registry_changes["full"] or registry_changes["upserted"] or registry_changes["removed"])
+    if boards or registry_matches or registry_updated:
+        print(f"[PING] {len(boards) + len(registry_matches)} matching boards for {list(keywords)}")
 
         pong_payload = {
             "ping_id": ping_id,
@@ -124,40 +380,85 @@ def handle_ping(node, conn, data: dict):
             "responder_port": node.port,
             "boards": boards,
         }
+        if registry_changes is not None:
+            pong_payload["registry"] = registry_changes
+            pong_payload["registry_matches"] = registry_matches
 
-        try:
-            pong_conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            pong_conn.connect((origin_host, origin_port))
-            pong_packet = create_packet(MessageType.PONG, node.node_id, node.host, node.port, node.super_peer,
-                                        pong_payload)
-            send_packet(pong_packet, pong_conn)
-            pong_conn.close()
-        except Exception as e:
-            print(f"Failed to send PONG to origin: {e}")
-
-    # Weiterleiten an andere Peers
+        if walker:
+            # the path of a walker is long and goes in circles, its few PONGs go straight to the origin
+            try:
+                pong_packet = create_packet(MessageType.PONG, node.node_id, node.host, node.port, node.super_peer,
+                                            pong_payload)
+                node.pool.send(origin_host, origin_port, pong_packet)
+            except Exception as e:
+                print(f"Failed to send PONG to origin: {e}")
+        else:
+            # zurück über den Weg des PINGs, die Super Peers darauf bündeln die PONGs
+            node.route_pong(ping_id, pong_payload)
+
+    # Ein Super Peer mit frischen Ergebnissen einer eigenen Suche nach denselben Keywords antwortet für die anderen
+    # Nodes und leitet nicht weiter
+    cached = node.get_cached_search(keywords, prefix, ttl - 1) if first_visit and not walker and ttl > 1 else None
+    if cached is not None:
+        answer_from_cache(node, payload, cached)
+        return
+
+    # Weiterleiten an andere Peers, nur in Richtung der Peers bei denen die Keywords passen können.
+    # Ein Walker geht nur an einen davon.
     if ttl > 1:
         new_payload = payload.copy()
         new_payload["ttl"] = ttl - 1
+        if registry_served:
+            new_payload["registry_served"] = True
 
-        with node.peers_lock:
-            peers = deque(node.peers.items())
+        # the keyword summaries only hold whole keywords, prefix searches can not be pruned
+        summary_keywords = () if prefix else keywords
+        if walker:
+            peers = node.select_walker_targets(summary_keywords, ttl - 1, 1, exclude=data["node_id"])
+        else:
+            peers = node.select_ping_targets(summary_keywords, ttl - 1, exclude=data["node_id"])
 
-        while peers:
-            peer_id, (host, port, _) = peers.popleft()
+        targets = [(host, port) for peer_id, (host, port, _) in peers
+                   # Don't send back to sender, a walker in a dead end has to
+                   if peer_id != data["node_id"] or walker]
+        if first_visit and not walker and targets:
+            # die zurückgerouteten PONGs beantworten später dieselbe Suche aus dem Cache
+            node.collect_routed_results(ping_id, keywords, prefix, ttl - 1)
+        fwd_packet = create_packet(MessageType.PING, node.node_id, node.host, node.port, node.super_peer, new_payload)
+        # alle Nachbarn gleichzeitig, ein langsamer oder toter Peer hält die anderen nicht auf
+        node.fan_out(targets, fwd_packet, "forwarded PING")
 
-            if peer_id == data["node_id"]:
-                continue  # Don't send back to sender
 
-            try:
-                fwd_conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                fwd_conn.connect((host, port))
-                fwd_packet = create_packet(MessageType.PING, node.node_id, node.host, node.port, node.super_peer,
-                                           new_payload)
-                send_packet(fwd_packet, fwd_conn)
-                fwd_conn.close()
-            except Exception as e:
-                print(f"Failed to forward PING to {host}:{port} from sender {node.host}:{node.port}: {e}")
+def answer_from_cache(node, ping_payload: dict, cached: list):
+    '''
+    Sends one PONG per cached responder back to the origin of a PING, on behalf of the responder.
+    Registry nodes are left out: their PONGs carry the changes since the registry position of the PING, the origin sends
+    every search to the registry nodes directly (see PeerNode._query_registry_shards) and gets the changes since its
+    current position from there.
+    '''
+    skip = {node.node_id, ping_payload.get("origin_id")}
+    shards = set(registry_nodes())
+    sent = 0
+    for responder in cached:
+        if responder.get("responder_id") in skip:
+            continue
+        if (responder.get("responder_host"), responder.get("responder_port")) in shards:
+            continue
+        skip.add(responder.get("responder_id"))
+        pong_payload = {
+            "ping_id": ping_payload.get("ping_id"),
+            "title": responder.get("board_title"),
+            "board_id": responder.get("board_id"),
+            "responder_id": responder.get("responder_id"),
+            "responder_host": responder.get("responder_host"),
+            "responder_port": responder.get("responder_port"),
+            "boards": responder.get("boards"),
+            "cached_by": node.node_id,
+        }
+        if node.route_pong(ping_payload.get("ping_id"), pong_payload):
+            sent += 1
+    node.cached_pongs_sent += sent
+    print(f"[CACHE] Answered PING {ping_payload.get('ping_id')} with {sent} cached results")
 
 
 def handle_pong(node, data):
@@ -175,38 +476,35 @@ def handle_pong(node, data):
     print(responder_info)
 
     print(data)
+    # entries may expire any time, so look them up only once
+    pongs = node.pongs_received.get(ping_id)
+    route = node.routing_table.get(ping_id) if pongs is None else None
+
     # pong belongs to this node
-    if ping_id in node.pongs_received:
-        node.pongs_received[ping_id].append(responder_info)
+    if pongs is not None:
+        if payload.get("registry") is not None:
+            # Änderungen der Registry übernehmen (landen in data/received_boards.json), die passenden registrierten
+            # Boards kommen danach aus der eigenen Kopie
+            source = f"{payload.get('responder_host')}:{payload.get('responder_port')}"
+            node.apply_registry_changes(payload["registry"], source)
+            matches = node.registry_replica.get_boards(payload.get("registry_matches") or [])
+            responder_info["boards"] = (payload.get("boards") or []) + matches
+            if not responder_info["boards"]:
+                # only sent to bring the registry copy up to date, not a search result
+                return
+        elif (payload.get("responder_host"), payload.get("responder_port")) in registry_nodes():
+            # e.g. answered from the cache of a super peer, only a part of the registry
+            for board in payload.get("boards") or []:
+                node.keyword_index.add_board(board, RECEIVED)
+
+        pongs.append(responder_info)
         print(f"Stored PONG from {responder_info['responder_id']}")
-        print(f"[PAYLOAD]: {node.pongs_received[ping_id]}")
-
-        if payload.get("responder_host") == BOOTSTRAP[0] and payload.get("responder_port") == BOOTSTRAP[1]:
-            #payload save into json file and delete old content
-            try:
-                with open("data/received_boards.json", "w", encoding="utf-8") as f:
-                    json.dump(payload.get("boards", []), f, ensure_ascii=False, indent=2)
-                print(f"Saved boards to data/received_boards.json")
-            except Exception as e:
-                print(f"Error saving boards to data/boards.json: {e}")
-            
-
-
+        print(f"[PAYLOAD]: {pongs}")
 
     # if pong is not directed to this node -> send to next in routing table
-    elif ping_id in node.routing_table:
-
-        # get previous connection
-        prev_conn, _ = node.routing_table[ping_id]
-        try:
-            # prepare png
-            pong_packet = create_packet(MessageType.PONG, node.node_id, node.host, node.port, node.super_peer,
-                                        payload)
-
-            # send pong
-            send_packet(pong_packet, prev_conn)
-        except Exception as e:
-            print(f"Failed to route PONG: {e}")
+    elif route is not None:
+        node.add_routed_result(ping_id, responder_info)
+        node.route_pong(ping_id, payload)
 
 
 def peer_list_handler(node, content: list[dict]):
@@ -231,19 +529,27 @@ def peer_list_handler(node, content: list[dict]):
                 break
 
 
-def connect_handler(node, conn, node_id, host, port, super):
+def connect_handler(node, conn, node_id, host, port, super, offer=None):
     '''
     This method is called when a peers tries to connect bidirectional to self.
     self will check if there is enough space in it's own peer list and in that case answer positively,
     otherwise negatively by sending a format which is not expected.
+    The answer also contains the codec and the compression chosen from the ones offered by the peer, peers that did
+    not offer anything get the old empty answer.
     :return:
     '''
 
     try:
 
         def send_correct_response(conn):
+            response_payload = []
+            if isinstance(offer, dict):
+                response_payload = {"codec": choose_codec(offer.get("codecs")), "mux": bool(offer.get("mux")),
+                                    "compression": choose_compression(offer.get("compression"))}
+                # the peer is reachable under its announced address as well, use the same codec towards it
+                node.pool.set_capabilities(host, port, response_payload)
             data = create_packet(MessageType.CONNECT_RESPONSE, node.node_id, node.host, node.port, node.super_peer,
-                                 [])
+                                 response_payload)
             send_packet(data, conn)
 
         if node_id in node.peers:
@@ -253,14 +559,20 @@ def connect_handler(node, conn, node_id, host, port, super):
             # if there is space in list accept
             node.peers[node_id] = (host, port, super)
             send_correct_response(conn)
+            # the new neighbour shall not flood this node with PINGs until the next periodic summary
+            node.send_keyword_summary(host, port)
         else:
-            node.send_close(conn)
+            send_close(node, conn)
     except Exception as e:
         print(f"Error while asking sending connection resposne: {e}")
 
 
 def get_peers_handler(node, conn, other_id, host, port):
     if not node.super_peer:
+        # connections are kept open and may be shared, so tell the requester explicitly that there is no answer
+        data = create_packet(MessageType.ERROR, node.node_id, node.host, node.port, node.super_peer,
+                             {"error": "not a super peer"})
+        send_packet(data, conn)
         return
 
     # add to own peer list if other_id is not in peer list
@@ -294,6 +606,30 @@ def get_peers_handler(node, conn, other_id, host, port):
         print(f"Error sending peer list: {e}")
 
 
+def registry_sync_handler(node, conn, payload):
+    '''
+    Answers one request of an anti-entropy round (see PeerNode.sync_registry) from the registry copy of this node:
+    "positions" asks for the sources this copy is ahead on, "prefixes" for the digests below inner nodes of the hash
+    tree of "source" and "ranges" for the boards in the key ranges of its leaves.
+    '''
+    replica = node.registry_replica
+    payload = payload if isinstance(payload, dict) else {}
+    try:
+        if "positions" in payload:
+            answer = {"sources": replica.get_ahead(payload["positions"])}
+        elif "ranges" in payload:
+            position, boards = replica.get_ranges(payload.get("source"), payload["ranges"])
+            answer = {"position": position, "boards": boards}
+        else:
+            position, children = replica.get_children(payload.get("source"), payload.get("prefixes") or [])
+            answer = {"position": position, "children": children}
+    except (ValueError, TypeError) as e:
+        answer = {"error": f"malformed registry sync request: {e}"}
+    data = create_packet(MessageType.REGISTRY_SYNC_RESPONSE, node.node_id, node.host, node.port, node.super_peer,
+                         answer)
+    send_packet(data, conn)
+
+
 def send_close(node, conn: socket):
     if conn.fileno() != -1:
         data = create_packet(MessageType.CLOSE, node.node_id, node.host, node.port, node.super_peer, {})
@@ -4,16 +4,92 @@ import uuid
 import random
 import requests
 import os
+import selectors
 
 from collections import deque
 from Backend.Board import Board
+from Backend.connection_pool import ConnectionPool, PeerConnection
+from Backend.worker_pool import WorkerPool
 from Backend.peer_message_handler import *
+from Backend.compression import compression_stats
+from Backend.metrics import NodeMetrics, INCOMING
+from Backend.expiring_store import ExpiringStore
+from Backend.keyword_summary import KeywordSummary
+from Backend.keyword_index import KeywordIndex, ALL_SOURCES, OWN, REGISTERED, RECEIVED, board_terms
+from Backend.query_cache import QueryCache
+from Backend.pong_batcher import PongBatcher
+from Backend.search_handle import SearchHandle, SearchResults
+from Backend.board_registry import BOARDS_FILE, RegistryReplica, get_registry
+from Backend.merkle import DEPTH, diff_children
+from Backend.lease_table import LeaseTable
+from Backend.hash_ring import registry_nodes, registry_owners
 from message_type import MessageType
 from Backend.config import BOOTSTRAP
 
 
 class PeerNode:
     MAX_PEER_LIST = 5
+    # seconds an incoming connection may stay idle before it is closed, has to be larger than the pool idle timeout
+    CONNECTION_IDLE_TIMEOUT = 60
+    # incoming connections waiting for their next frame, above it the one idle the longest is closed
+    MAX_IDLE_CONNECTIONS = 512
+    # seconds to wait for the rest of a frame once it started arriving, also the send timeout of incoming connections
+    FRAME_TIMEOUT = 10
+    # threads handling incoming frames and the number of frames that may wait for them
+    HANDLER_WORKERS = 16
+    HANDLER_QUEUE_SIZE = 256
+    # frames sent to several peers at once (PINGs, keyword summaries) go out concurrently on at most FANOUT_CONCURRENCY
+    # threads, a peer not accepting the connection or the frame within the timeouts is skipped
+    FANOUT_CONCURRENCY = 16
+    FANOUT_CONNECT_TIMEOUT = 2.0
+    FANOUT_SEND_TIMEOUT = 2.0
+    # bytes a single incoming frame may have, bigger frames close the connection
+    MAX_FRAME_SIZE = MAX_FRAME_SIZE
+    # bytes a frame body needs before it is compressed for peers supporting it, lower it for slow WAN links
+    COMPRESSION_THRESHOLD = COMPRESSION_THRESHOLD
+    # seconds and number of searches the routing state of PINGs passing through is kept
+    ROUTING_TTL = 120
+    ROUTING_CAPACITY = 10000
+    # seconds and number of own searches whose PONGs are kept
+    PONG_TTL = 600
+    PONG_CAPACITY = 1000
+    # seconds between two keyword summaries sent to every peer, older summaries are ignored after SUMMARY_TTL
+    SUMMARY_INTERVAL = 30
+    SUMMARY_TTL = 100
+    # a changed registry is advertised SUMMARY_DEBOUNCE seconds later instead of with the next SUMMARY_INTERVAL,
+    # a burst of registrations goes out as one summary
+    SUMMARY_DEBOUNCE = 1.0
+    # ttl of a flooding search and seconds a search handle yields results by default
+    SEARCH_TTL = 5
+    SEARCH_DEADLINE = 5.0
+    # expanding ring search: ttl of the first ring, ttl added per ring and seconds to wait for PONGs of a ring
+    RING_START_TTL = 1
+    RING_TTL_STEP = 2
+    RING_WINDOW = 0.5
+    # random walk search: walkers sent by the origin and hops each of them may walk
+    WALKERS = 4
+    WALKER_STEPS = 32
+    # super peers answer PINGs from the results of own searches and of searches they forwarded with the same keywords
+    # for QUERY_CACHE_TTL seconds, starting QUERY_CACHE_SETTLE seconds after the search was sent
+    QUERY_CACHE_TTL = 30
+    QUERY_CACHE_CAPACITY = 256
+    QUERY_CACHE_SETTLE = 1.0
+    # PONGs go back along the path of their PING, super peers collect those of their subtree for PONG_BATCH_WINDOW
+    # seconds (or until PONG_BATCH_MAX) and send them on in one frame
+    PONG_BATCH_WINDOW = 0.02
+    PONG_BATCH_MAX = 64
+    # registry file of a registry node, each registry node of one process needs its own
+    REGISTRY_FILE = BOARDS_FILE
+    # seconds between two anti-entropy rounds of a super peer, each one reconciles the registry copy with a random
+    # super peer neighbour. A super peer holding a copy of every shard answers the registry part of searches itself.
+    SYNC_INTERVAL = 10
+    ANSWER_FROM_REPLICA = True
+    # registered boards are leases, a registry node removes a board BOARD_LEASE seconds after its registration or the
+    # last heartbeat of its owner. Owners renew after LEASE_RENEW_FRACTION of the lease, shifted by up to
+    # +-LEASE_JITTER of that interval so that the heartbeats of peers started together spread out
+    BOARD_LEASE = 300
+    LEASE_RENEW_FRACTION = 1 / 3
+    LEASE_JITTER = 0.2
 
     def __init__(self, host: str = "127.0.0.1", port: int = 8000, super_peer: bool = False, board: Board = None):
 
@@ -22,7 +98,8 @@ class PeerNode:
         self.host: str = host
         self.port: int = port
 
-        if (host, port) == BOOTSTRAP:
+        # every registry node (a shard of the board registry) works as bootstrap node
+        if (host, port) in registry_nodes():
             self.bootstrap = True
         else:
             self.bootstrap = False
@@ -32,8 +109,61 @@ class PeerNode:
         self.max_total_conn = 100
 
         # Data structures for routing using ping and pong
-        self.routing_table = {}  # ping_id: (conn, timestamp)
-        self.pongs_received = {}  # ping_id: list of pong info (optional, for storing results)
+        # both expire, a PING older than ROUTING_TTL is neither recognized as duplicate nor can its PONGs be routed back
+        # ping_id: (address of the peer the PING came from, timestamp, address of the origin)
+        self.routing_table = ExpiringStore(self.ROUTING_TTL, self.ROUTING_CAPACITY)
+        # ping_id: list of pong info (optional, for storing results)
+        self.pongs_received = ExpiringStore(self.PONG_TTL, self.PONG_CAPACITY)
+
+        # latest keyword summaries of the neighbours (node_id: KeywordSummary), PINGs are only forwarded where they
+        # may match. Neighbours without a summary still get every PING.
+        self.neighbour_summaries = ExpiringStore(self.SUMMARY_TTL, 1000)
+        # every board this node knows: its own boards, the registry of the bootstrap node and received board lists
+        self.keyword_index = KeywordIndex()
+        # data/boards.json and its log, cached in memory and shared with the Flask API of this process
+        self.registry = get_registry(self.REGISTRY_FILE)
+        # copy of the registry of the bootstrap node, its PONGs only carry the changes since the version held here
+        self.registry_replica = RegistryReplica()
+        # results of own and forwarded searches, used by super peers to answer PINGs of other nodes without forwarding
+        self.query_cache = QueryCache(self.QUERY_CACHE_TTL, self.QUERY_CACHE_CAPACITY, self.QUERY_CACHE_SETTLE)
+        # PONGs routed back through this super peer per forwarded PING (ping_id: list of pong info)
+        self.routed_results = ExpiringStore(self.ROUTING_TTL, self.ROUTING_CAPACITY)
+        # (time of the query cache clock the window closes, ping_id, keywords, prefix, ttl the PING was forwarded with),
+        # a forwarded search goes into the query cache once its window closed
+        self.routed_windows = deque(maxlen=self.ROUTING_CAPACITY)
+        self.routed_lock = threading.Lock()
+        self.cached_pongs_sent = 0
+        self.pong_batcher = PongBatcher(self._send_pong_batch, self.PONG_BATCH_WINDOW, self.PONG_BATCH_MAX,
+                                        self.ROUTING_TTL)
+        # PONGs sent straight to the origin because the peer on the path back was gone
+        self.pongs_sent_direct = 0
+        # registry nodes: lease of every registered board, the maintenance thread removes the boards whose lease ended
+        self.leases = LeaseTable(self.BOARD_LEASE)
+        # boards this node registered (board_id: registration), their leases are renewed with heartbeats
+        self.registered_boards = {}
+        self.registered_lock = threading.Lock()
+        # shortest lease the registry nodes granted, renewals are timed by it
+        self.granted_lease = self.BOARD_LEASE
+        self.heartbeats_sent = 0
+        self.reregistrations = 0
+        # anti-entropy rounds of the registry copy, the REGISTRY_SYNC requests they needed and the failed ones
+        self.registry_syncs = 0
+        self.sync_requests = 0
+        self.sync_failures = 0
+        # (board_id, title, keywords) of self.board when it was indexed, the board may be replaced or changed later
+        self.indexed_own_board = None
+        self.pings_forwarded = 0
+        self.pings_pruned = 0
+        # expanding ring searches, the rings they issued and how many found enough results before max_ttl
+        self.ring_searches = 0
+        self.rings_issued = 0
+        self.ring_searches_satisfied = 0
+        # set on stop, wakes up the maintenance thread
+        self.stopped = threading.Event()
+        # wakes up the maintenance thread before its next timer, e.g. to send a changed keyword summary
+        self.maintenance_wakeup = threading.Event()
+        # time.monotonic() of the first registry change the sent keyword summary does not cover yet, 'None' if none
+        self.summary_dirty_since = None
 
         # MUTEXE -------------------------------------------
         self.peers_lock = threading.Lock()
@@ -50,6 +180,23 @@ class PeerNode:
         self.peers = {}
         self.data_store = {}
         self.server_socket = None
+
+        # counters exposed on /metrics
+        self.metrics = NodeMetrics()
+
+        # reused outgoing connections to other peers
+        self.pool = ConnectionPool(max_frame_size=self.MAX_FRAME_SIZE,
+                                   compression_threshold=self.COMPRESSION_THRESHOLD, metrics=self.metrics,
+                                   max_parallel_sends=self.FANOUT_CONCURRENCY)
+        self.fanout_failures = 0
+
+        # bounded pool handling incoming frames, created on start
+        self.worker_pool: WorkerPool | None = None
+        self.selector = None
+        # connections handed back to the accept loop by the workers after a frame was handled
+        self.resumed_connections = deque()
+        self.wakeup_reader = None
+        self.wakeup_writer = None
         self.running = False
 
         # super peer section
@@ -60,6 +207,7 @@ class PeerNode:
             self.board = Board("default", {""})
         else:
             self.board = board
+        self.load_board_lists()
         print(f"Node {self.node_id} initialized at {self.host}:{self.port}")
 
         self.pongs = 0
@@ -87,48 +235,389 @@ class PeerNode:
 
         self.port = self.server_socket.getsockname()[1]
         self.server_socket.listen(self.max_connections)
+        self.server_socket.setblocking(False)
         self.running: bool = True
         print(f"Node {self.node_id} listening on {self.host}:{self.port}")
 
+        self.worker_pool = WorkerPool(self.HANDLER_WORKERS, self.HANDLER_QUEUE_SIZE)
+        self.worker_pool.start()
+
+        # workers wake up the accept loop through this pair when they hand a connection back
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+
         # Start a new thread to continuously accept connections
         threading.Thread(target=self._accept_connections, daemon=True).start()
+        self._start_maintenance()
+
+    def _start_maintenance(self):
+        self.stopped.clear()
+        threading.Thread(target=self._maintenance_loop, daemon=True).start()
+
+    def _maintenance_loop(self):
+        '''
+        Periodic work of a running node: refreshing the keyword summaries of all peers, on super peers the
+        anti-entropy of the registry copy, renewing the leases of the own registered boards and on registry nodes
+        removing the boards whose lease ended.
+        '''
+        next_summary = time.monotonic() + self.SUMMARY_INTERVAL
+        next_sync = time.monotonic() + self.SYNC_INTERVAL
+        next_renewal = time.monotonic() + self._renewal_interval()
+        while True:
+            dirty_since = self.summary_dirty_since
+            if dirty_since is not None:
+                next_summary = min(next_summary, dirty_since + self.SUMMARY_DEBOUNCE)
+            due = min(next_summary, next_sync, next_renewal)
+            next_expiry = self.leases.next_expiry() if self.bootstrap else None
+            if next_expiry is not None:
+                due = min(due, next_expiry)
+            self.maintenance_wakeup.wait(max(0.0, due - time.monotonic()))
+            self.maintenance_wakeup.clear()
+            if self.stopped.is_set():
+                return
+            now = time.monotonic()
+            if self.bootstrap:
+                self.expire_leases()
+            if now >= next_summary:
+                # changes from now on need another summary
+                self.summary_dirty_since = None
+                self.send_keyword_summaries()
+                next_summary = now + self.SUMMARY_INTERVAL
+            if now >= next_sync:
+                if self.super_peer and not self.bootstrap:
+                    self.sync_registry()
+                next_sync = now + self.SYNC_INTERVAL
+            if now >= next_renewal:
+                self.send_heartbeats()
+                next_renewal = now + self._renewal_interval()
 
     def _accept_connections(self):
-        """Internal method to accept incoming connections."""
+        """
+        Internal method to accept incoming connections. Idle connections are watched here as well, their frames are
+        read without blocking and only a complete frame is handed to the worker pool. So no thread is bound to a
+        connection while it is idle or while a frame is trickling in.
+        """
+        # registered connection: time.monotonic() it was registered, the one registered the longest first
+        idle_since = {}
+        self.selector.register(self.server_socket, selectors.EVENT_READ, "accept")
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, "wakeup")
+
         while self.running:
             try:
-                conn, addr = self.server_socket.accept()
-                print(f"{self.host}:{self.port}: incoming connection from {addr}")
-                # Handle connection in a new thread
-                threading.Thread(target=self._handle_peer_connection_request, args=(conn, addr), daemon=True).start()
-            except Exception as e:
+                events = self.selector.select(timeout=1)
+            except (OSError, ValueError) as e:
                 if self.running:
                     print(f"Error accepting connection: {e}")
                 break
 
+            for key, _ in events:
+                if key.data == "accept":
+                    try:
+                        conn, addr = self.server_socket.accept()
+                    except BlockingIOError:
+                        continue
+                    except OSError as e:
+                        if self.running:
+                            print(f"Error accepting connection: {e}")
+                        continue
+                    print(f"{self.host}:{self.port}: incoming connection from {addr}")
+                    conn = PeerConnection(conn, addr, self.FRAME_TIMEOUT, max_frame_size=self.MAX_FRAME_SIZE,
+                                          compression_threshold=self.COMPRESSION_THRESHOLD, metrics=self.metrics,
+                                          direction=INCOMING)
+                    conn.frame_reader = FrameReader(self.MAX_FRAME_SIZE)
+                    self._watch_connection(conn, addr, idle_since)
+
+                elif key.data == "wakeup":
+                    try:
+                        self.wakeup_reader.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    while self.resumed_connections:
+                        conn, addr = self.resumed_connections.popleft()
+                        if conn.fileno() != -1:
+                            self._watch_connection(conn, addr, idle_since)
+
+                else:
+                    # bytes of a frame arrived, read them without blocking
+                    conn = key.fileobj
+                    try:
+                        open_ = conn.frame_reader.receive(conn)
+                        frame = conn.frame_reader.next_frame()
+                    except FrameTooLargeError as e:
+                        print(f"Closing connection from {key.data}: {e}")
+                        open_, frame = False, None
+                    except OSError:
+                        open_, frame = False, None
+                    if frame is not None:
+                        # a closed connection is noticed after this frame was handled
+                        self._dispatch_frame(conn, key.data, frame, idle_since)
+                    elif not open_:
+                        self._forget_connection(conn, idle_since)
+
+            # connections are kept alive for further frames, but not forever
+            now = time.monotonic()
+            for conn, since in list(idle_since.items()):
+                started = conn.frame_reader.started
+                if started is not None and now - started > self.FRAME_TIMEOUT:
+                    print(f"Closing connection from {conn.address}: frame not complete after {self.FRAME_TIMEOUT}s")
+                    self._forget_connection(conn, idle_since)
+                elif started is None and now - since > self.CONNECTION_IDLE_TIMEOUT:
+                    self._forget_connection(conn, idle_since)
+
+        for conn in idle_since:
+            conn.close()
+        self.selector.close()
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
+
+    def _watch_connection(self, conn, addr, idle_since: dict):
+        '''
+        Lets the accept loop wait for the next frame of an incoming connection. A frame that already arrived together
+        with the previous one is handed to a worker right away. Above MAX_IDLE_CONNECTIONS the connection idle the
+        longest is closed, its peer opens a new one when it needs it.
+        '''
+        try:
+            frame = conn.frame_reader.next_frame()
+        except FrameTooLargeError as e:
+            print(f"Closing connection from {addr}: {e}")
+            conn.close()
+            return
+        if frame is not None:
+            self._dispatch_frame(conn, addr, frame, idle_since)
+            return
+
+        # frames are read without blocking in the accept loop
+        conn.settimeout(0.0)
+        self.selector.register(conn, selectors.EVENT_READ, addr)
+        idle_since[conn] = time.monotonic()
+        while len(idle_since) > self.MAX_IDLE_CONNECTIONS:
+            oldest = next(iter(idle_since))
+            print(f"Closing idle connection from {oldest.address}: more than {self.MAX_IDLE_CONNECTIONS} connections")
+            self._forget_connection(oldest, idle_since)
+
+    def _forget_connection(self, conn, idle_since: dict):
+        self.selector.unregister(conn)
+        del idle_since[conn]
+        conn.close()
+
+    def _dispatch_frame(self, conn, addr, frame: tuple, idle_since: dict):
+        '''
+        Hands a complete frame to the worker pool, the connection is owned by the worker until it is handed back.
+        '''
+        if conn in idle_since:
+            self.selector.unregister(conn)
+            del idle_since[conn]
+        # the handlers answer with blocking sends
+        conn.settimeout(self.FRAME_TIMEOUT)
+        if not self.worker_pool.submit(self._handle_next_frame, conn, addr, frame):
+            self._shed_connection(conn)
+
+    def _handle_next_frame(self, conn, addr, frame: tuple):
+        '''
+        Worker job: handles exactly one frame of an incoming connection and hands the connection back to the accept
+        loop afterwards. PINGs are dropped while the worker pool is under pressure, they are the cheapest messages to
+        lose as the search is flooded over several paths anyway.
+        :param frame: tuple (request_id, data, compressed) read by the accept loop
+        '''
+        # the answers to this frame carry its request id
+        conn.request_id, data, compressed = frame
+        try:
+            if compressed:
+                data = decompress_body(data, self.MAX_FRAME_SIZE)
+            n_bytes = HEADER_SIZE + len(data)
+            # answer in the codec the peer uses
+            conn.codec = detect_codec(data)
+            try:
+                data = decode_packet(data)
+            except ValueError:
+                self.metrics.record_error("malformed")
+                raise
+            self.metrics.record_in(data.get("type"), n_bytes)
+            self._apply_capabilities(conn, data)
+            if data.get("type") == MessageType.PING.value and self.worker_pool.is_under_pressure():
+                self.worker_pool.record_dropped()
+                keep_open = True
+            else:
+                keep_open = self._handle_measured(conn, data, addr)
+        except Exception as e:
+            print(f"Error host: {self.host}:{self.port} handling client connection from {addr}: {e}")
+            # the connection is in an unknown state now
+            keep_open = False
+        conn.request_id = None
+
+        if keep_open and conn.fileno() != -1 and self.running:
+            self.resumed_connections.append((conn, addr))
+            try:
+                self.wakeup_writer.send(b"\0")
+            except OSError:
+                conn.close()
+        elif conn.fileno() != -1:
+            conn.close()
+
+    def _shed_connection(self, conn):
+        '''
+        Rejects a connection while the worker pool is saturated by answering with an ERROR frame and closing it.
+        '''
+        try:
+            error_packet = create_packet(MessageType.ERROR, self.node_id, self.host, self.port, self.super_peer,
+                                         {"error": "overloaded"})
+            send_packet(error_packet, conn)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def _handle_measured(self, conn, data: dict, addr) -> bool:
+        '''
+        Runs _handle_message and records how long it took and whether it failed.
+        '''
+        msg_type = data.get("type")
+        failed = False
+        start = time.perf_counter()
+        try:
+            return self._handle_message(conn, data, addr)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.metrics.record_handled(msg_type, time.perf_counter() - start, failed)
+
+    def render_metrics(self) -> str:
+        '''
+        :return: counters of this node together with pool, worker and thread gauges in the Prometheus text format
+        '''
+        worker_stats = self.get_worker_stats()
+        compression = self.get_compression_stats()
+        cache = self.query_cache.get_stats()
+        batches = self.pong_batcher.get_stats()
+        gauges = {
+            "peernote_threads": ("Threads of the process", threading.active_count()),
+            "peernote_peers": ("Peers in the peer list", len(self.peers)),
+            "peernote_pool_idle_connections": ("Idle outgoing connections kept by the pool", self.pool.get_idle_count()),
+            "peernote_worker_queue_depth": ("Frames waiting for a handler thread", worker_stats.get("queue_depth", 0)),
+            "peernote_worker_threads": ("Handler threads", worker_stats.get("workers", 0)),
+            "peernote_routing_table_entries": ("PINGs remembered for duplicate detection and PONG routing",
+                                               len(self.routing_table)),
+            "peernote_pong_store_entries": ("Own searches whose PONGs are kept", len(self.pongs_received)),
+            "peernote_query_cache_entries": ("Cached search results", cache["size"]),
+        }
+        counters = {
+            "peernote_worker_rejected_total": ("Frames rejected because the worker queue was full",
+                                               worker_stats.get("rejected", 0)),
+            "peernote_worker_dropped_total": ("PINGs dropped under pressure", worker_stats.get("dropped", 0)),
+            "peernote_pongs_total": ("PONGs received", self.pongs),
+            "peernote_pings_forwarded_total": ("PINGs sent to neighbours", self.pings_forwarded),
+            "peernote_pings_pruned_total": ("PINGs not sent because the keyword summary of the neighbour ruled them out",
+                                            self.pings_pruned),
+            "peernote_query_cache_hits_total": ("PINGs answered from cached search results", cache["hits"]),
+            "peernote_query_cache_misses_total": ("PINGs of cacheable searches without fresh cached results",
+                                                  cache["misses"]),
+            "peernote_fanout_failures_total": ("Frames of a fan-out that could not be sent to a peer",
+                                               self.fanout_failures),
+            "peernote_pong_batches_total": ("Frames of batched PONGs sent back along the path of their PING",
+                                            batches["batches"]),
+            "peernote_pong_duplicates_total": ("PONGs not passed on because the same responder already answered",
+                                               batches["duplicates_dropped"]),
+            "peernote_search_rings_total": ("Rings issued by expanding ring searches", self.rings_issued),
+            "peernote_compression_saved_bytes_total": ("Bytes saved by compressing frames", compression["bytes_saved"]),
+            "peernote_compression_seconds_total": ("CPU seconds spent compressing and decompressing frames",
+                                                   compression["compress_seconds"] + compression["decompress_seconds"]),
+        }
+        return self.metrics.render(gauges, counters)
+
+    def _apply_capabilities(self, conn, data: dict):
+        '''
+        Answers on an incoming connection are only compressed if the sender agreed on it during CONNECT.
+        The sender is identified by the address it announces in every frame.
+        '''
+        conn.compression = self.pool.get_capabilities(data.get("host"), data.get("port")).get("compression")
+
+    def get_compression_stats(self) -> dict:
+        '''
+        :return: frames and bytes compressed by this process and the CPU time spent on it
+        '''
+        return compression_stats.get_stats()
+
+    def get_routing_stats(self) -> dict:
+        '''
+        :return: current size, limits and expiry counters of the routing table and the pong store, search counters
+        '''
+        return {
+            "routing_table": self.routing_table.get_stats(),
+            "pongs_received": self.pongs_received.get_stats(),
+            "neighbour_summaries": self.neighbour_summaries.get_stats(),
+            "keyword_index": self.keyword_index.get_stats(),
+            "query_cache": self.query_cache.get_stats(),
+            "registry": self.registry.get_stats() if self.bootstrap else self.registry_replica.get_stats(),
+            "cached_pongs_sent": self.cached_pongs_sent,
+            "pong_batches": self.pong_batcher.get_stats(),
+            "pongs_sent_direct": self.pongs_sent_direct,
+            "leases": {
+                "table": self.leases.get_stats() if self.bootstrap else None,
+                "registered_boards": len(self.registered_boards),
+                "heartbeats_sent": self.heartbeats_sent,
+                "reregistrations": self.reregistrations,
+            },
+            "registry_sync": {
+                "rounds": self.registry_syncs,
+                "requests": self.sync_requests,
+                "failures": self.sync_failures,
+            },
+            "fanout_failures": self.fanout_failures,
+            "pings_forwarded": self.pings_forwarded,
+            "pings_pruned": self.pings_pruned,
+            "expanding_ring": {
+                "searches": self.ring_searches,
+                "rings": self.rings_issued,
+                "satisfied": self.ring_searches_satisfied,
+            },
+        }
+
+    def get_worker_stats(self) -> dict:
+        '''
+        :return: queue depth and admission counters of the worker pool handling incoming frames
+        '''
+        if self.worker_pool is None:
+            return {}
+        return self.worker_pool.get_stats()
+
     def connect(self, host, port, add_to_peers: bool = False) -> bool:
         try:
-            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            conn.connect((host, port))
-            print("Successful connection")
-            data = create_packet(MessageType.CONNECT, self.node_id, self.host, self.port, self.super_peer, [])
-            send_packet(data, conn)
+            # offer the codecs this node understands and request ids, older peers ignore the payload
+            data = create_packet(MessageType.CONNECT, self.node_id, self.host, self.port, self.super_peer,
+                                 {"codecs": SUPPORTED_CODECS, "mux": True, "compression": SUPPORTED_COMPRESSIONS})
 
             # await response
-            response = receive_packet(conn)
+            response = self.pool.request(host, port, data)
 
             if response is not None:
-                resp_data = json.loads(response)
+                resp_data = decode_packet(response)
                 res = resp_data.get("type") == MessageType.CONNECT_RESPONSE.value and resp_data.get(
                     'node_id') != self.node_id
+                if res:
+                    self._store_capabilities(host, port, resp_data.get("payload"))
                 if res and add_to_peers:
                     self.peers[resp_data.get('node_id')] = (host, port, resp_data.get("super", False))
+                    self.send_keyword_summary(host, port)
                 return res
             return False
         except Exception as e:
             print(f"Error while {self.host}:{self.port} tries to connect to {host}:{port}: {e}")
             return False
 
+    def _store_capabilities(self, host, port, answer):
+        '''
+        Remembers what was agreed on with a peer during CONNECT. Peers answering with the old empty payload
+        keep using JSON.
+        '''
+        if not isinstance(answer, dict):
+            answer = {}
+        codec = answer.get("codec") if answer.get("codec") in SUPPORTED_CODECS else JSON
+        compression = answer.get("compression") if answer.get("compression") in SUPPORTED_COMPRESSIONS else None
+        self.pool.set_capabilities(host, port, {"codec": codec, "mux": answer.get("mux") is True,
+                                                "compression": compression})
+
     def request_peers(self):
         '''
         Using this function a (super) peer can request other peers from it's own peer list
@@ -141,19 +630,8 @@ class PeerNode:
 
         # if there is no peer in the list use the bootstrapping peer as connection
         if len(self.peers) == 0 and not self.bootstrap:
-            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-            conn.connect(BOOTSTRAP)
-
-            data = create_packet(MessageType.GET_PEERS, self.node_id, self.host, self.port, self.super_peer, [])
-            send_packet(data, conn)
-
-            # expect some kind of answer
-            self._handle_peer_connection_request(conn, BOOTSTRAP)
-
-            # sanity close
-            if conn.fileno() != -1:
-                self.send_close(conn)
+            # spread the first requests of new peers over all registry nodes
+            self._request_peer_list(*random.choice(registry_nodes()))
 
         # avoid using self.peers because it does not allow to change size during iteration
 
@@ -164,33 +642,30 @@ class PeerNode:
             # copy to keep track of visited and to be visited peers
             visited = list(self.peers.keys())
 
-        # 'iterate' through all peers
-        while queue:
-
-            # LIFO - Queue
-            peer_id, (host, port, is_super) = queue.popleft()
-
-            # return if not super
-            if not is_super or peer_id == self.node_id:
-                continue
+        data = create_packet(MessageType.GET_PEERS, self.node_id, self.host, self.port, self.super_peer, [])
 
-            # connect to remote peer - TODO: fix if connection fails
-            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            conn.connect((host, port))
-
-            # send get peers message
-            data = create_packet(MessageType.GET_PEERS, self.node_id, self.host, self.port, self.super_peer, [])
-            send_packet(data, conn)
+        # 'iterate' through all peers, one wave of known peers after another
+        while queue:
 
-            self._handle_peer_connection_request(conn, (host, port))
+            # ask all super peers of the current wave at once, the requests are pipelined
+            requests = []
+            while queue:
+                peer_id, (host, port, is_super) = queue.popleft()
 
-            if len(self.peers) >= self.max_total_conn:
-                return
+                # skip if not super
+                if not is_super or peer_id == self.node_id:
+                    continue
+                requests.append((host, port, self.pool.submit(host, port, data)))
 
-            # close socket
+            # add the answered peers
+            for host, port, future in requests:
+                try:
+                    self._handle_peer_list_response(future.result(timeout=self.pool.io_timeout))
+                except Exception as e:
+                    print(f"Error requesting peers from {host}:{port}: {e}")
 
-            if conn.fileno() != -1:
-                self.send_close(conn)
+                if len(self.peers) >= self.max_total_conn:
+                    return
 
             # add possible new peers - TODO: visited as set
             with self.peers_lock:
@@ -199,6 +674,28 @@ class PeerNode:
                         visited.append(new_peer_id)
                         queue.append((new_peer_id, new_peer_info))
 
+    def _request_peer_list(self, host, port):
+        '''
+        Sends GET_PEERS to a single super peer and adds the peers of the answered PEER_LIST.
+        '''
+        data = create_packet(MessageType.GET_PEERS, self.node_id, self.host, self.port, self.super_peer, [])
+        try:
+            response = self.pool.request(host, port, data)
+        except Exception as e:
+            print(f"Error requesting peers from {host}:{port}: {e}")
+            return
+
+        self._handle_peer_list_response(response)
+
+    def _handle_peer_list_response(self, response):
+        if response is None:
+            return
+
+        response = decode_packet(response)
+        if response.get("type") == MessageType.PEER_LIST.value:
+            print("Got peer list.")
+            peer_list_handler(self, response.get('payload'))
+
     def do_bootstrap(self):
         '''
         This function shall work for simple peers to bootstrap to the network, in order to do this just try to connect
@@ -209,12 +706,28 @@ class PeerNode:
         '''
 
         if not self.bootstrap:
-            return self.connect(BOOTSTRAP[0], BOOTSTRAP[1], True)
+            # any registry node lets a peer join, starting with a random one spreads the load
+            nodes = registry_nodes()
+            for host, port in random.sample(nodes, len(nodes)):
+                if self.connect(host, port, True):
+                    return True
+            return False
 
     # Issue a search request to all known peers for boards with specific keywords.
-    def issue_search_request(self, keywords: set = {}):
+    def issue_search_request(self, keywords: set = {}, ttl: int = None, results: list = None,
+                             mode: str = SEARCH_FLOOD, prefix: bool = False) -> str:
+        '''
+        Sends a PING, the PONGs are collected in pongs_received under the returned ping id.
+        :param ttl: hops a flooded PING travels (SEARCH_TTL by default), steps of every walker (WALKER_STEPS)
+        :param results: list the PONGs are appended to, lets several PINGs of one search share their results
+        :param mode: SEARCH_FLOOD forwards the PING to all neighbours on every hop,
+        SEARCH_RANDOM_WALK sends WALKERS walkers, each forwarded to one random neighbour per hop
+        :param prefix: keywords also match board keywords and title words they are a prefix of
+        :return: ping id of the search
+        '''
         ping_id = str(uuid.uuid4())
-        ttl = 5
+        walk = mode == SEARCH_RANDOM_WALK
+        ttl = ttl or (self.WALKER_STEPS if walk else self.SEARCH_TTL)
 
         payload = {
             "ping_id": ping_id,
@@ -222,147 +735,703 @@ class PeerNode:
             "origin_host": self.host,
             "origin_port": self.port,
             "ttl": ttl,
-            "keywords": keywords,
+            "keywords": list(keywords),
+            "mode": mode,
+            "prefix": prefix,
         }
+        if not self.bootstrap:
+            # position of the registry copy per registry node, each of them answers with its changes since then
+            payload["registry"] = self.registry_replica.get_positions()
+
+        # to save all received pongs (if any)
+        self.pongs_received[ping_id] = results if results is not None else []
+        # the PING comes back through other peers, this node must neither answer nor forward it again
+        self.routing_table[ping_id] = (None, time.time(), (self.host, self.port))
+        if self.super_peer and keywords and not walk:
+            self.query_cache.put(keywords, prefix, self.pongs_received[ping_id], ttl)
+        # the keyword summaries only hold whole keywords, prefix searches can not be pruned
+        summary_keywords = () if prefix else keywords
+        if walk:
+            targets = self.select_walker_targets(summary_keywords, ttl, self.WALKERS)
+        else:
+            targets = self.select_ping_targets(summary_keywords, ttl)
+        addresses = [(host, port) for _, (host, port, _) in targets]
+        packet = create_packet(MessageType.PING, self.node_id, self.host, self.port, self.super_peer, payload)
+        self.fan_out(addresses, packet, "ping")
+        if not walk:
+            self._query_registry_shards(payload, addresses)
+        return ping_id
+
+    def _query_registry_shards(self, payload: dict, addresses: list):
+        '''
+        Every registry node holds only its shard of the registry, the ones the flood may not reach get the PING
+        directly with ttl 1, they answer without forwarding it.
+        '''
+        shards = [node for node in registry_nodes() if node not in addresses and node != (self.host, self.port)]
+        if not shards:
+            return
+        packet = create_packet(MessageType.PING, self.node_id, self.host, self.port, self.super_peer,
+                               dict(payload, ttl=1))
+        self.fan_out(shards, packet, "registry PING")
 
-        self.pongs_received[ping_id] = []  # to save all received pongs (if any)
+    def fan_out(self, targets: list, packet, what: str) -> dict:
+        '''
+        Sends a frame to several peers concurrently, see ConnectionPool.send_many.
+        :param targets: list of (host, port)
+        :param what: name of the frame used in the log
+        :return: (host, port): exception for every peer the frame could not be sent to
+        '''
+        try:
+            failures = self.pool.send_many(targets, packet, self.FANOUT_CONNECT_TIMEOUT, self.FANOUT_SEND_TIMEOUT)
+        except RuntimeError as e:
+            # the pool was closed while this node stopped
+            failures = {target: e for target in targets}
+        for (host, port), e in failures.items():
+            print(f"Error sending {what} to {host}:{port} – {e}")
+        self.fanout_failures += len(failures)
+        return failures
+
+    def route_pong(self, ping_id, payload: dict) -> bool:
+        '''
+        Sends a PONG one step back along the path its PING came, super peers batch the PONGs of their subtree.
+        :return: 'False' if the PING is unknown or expired and the PONG was dropped
+        '''
+        route = self.routing_table.get(ping_id)
+        if route is None or route[0] is None:
+            return False
+        previous = route[0]
+        if self.super_peer:
+            self.pong_batcher.add(previous, payload)
+        else:
+            self._send_pong_batch(previous, [payload])
+        return True
+
+    def _send_pong_batch(self, address: tuple, payloads: list):
+        '''
+        A single PONG is sent as it is, several as one PONG_BATCH. If the peer on the path back is gone, the PONGs are
+        sent straight to their origins.
+        '''
+        if len(payloads) == 1:
+            packet = create_packet(MessageType.PONG, self.node_id, self.host, self.port, self.super_peer, payloads[0])
+        else:
+            packet = create_packet(MessageType.PONG_BATCH, self.node_id, self.host, self.port, self.super_peer,
+                                   {"pongs": payloads})
+        try:
+            self.pool.send(address[0], address[1], packet, self.FANOUT_CONNECT_TIMEOUT, self.FANOUT_SEND_TIMEOUT)
+        except Exception as e:
+            print(f"[PONG] Path back through {address[0]}:{address[1]} failed ({e}), sending to the origins")
+            self._send_pongs_direct(payloads)
+
+    def _send_pongs_direct(self, payloads: list):
+        for payload in payloads:
+            route = self.routing_table.get(payload.get("ping_id"))
+            if route is None or route[2] is None:
+                continue
+            host, port = route[2]
+            try:
+                packet = create_packet(MessageType.PONG, self.node_id, self.host, self.port, self.super_peer, payload)
+                self.pool.send(host, port, packet, self.FANOUT_CONNECT_TIMEOUT, self.FANOUT_SEND_TIMEOUT)
+                self.pongs_sent_direct += 1
+            except Exception as e:
+                print(f"Failed to send PONG to origin {host}:{port}: {e}")
+
+    def search(self, keywords: set = {}, deadline: float = None, max_results: int = None, mode: str = SEARCH_FLOOD,
+               prefix: bool = False, ttl: int = None) -> SearchHandle:
+        '''
+        Starts a search and returns right away.
+        :param deadline: seconds the handle yields results, defaults to SEARCH_DEADLINE
+        :param max_results: answering nodes after which the handle stops, 'None' for no limit
+        :return: handle yielding the PONGs as they arrive, see SearchHandle
+        '''
+        results = SearchResults()
+        ping_id = self.issue_search_request(keywords, ttl, results, mode, prefix)
+        return SearchHandle(ping_id, results, self.SEARCH_DEADLINE if deadline is None else deadline, max_results)
+
+    def expanding_ring_search(self, keywords: set = {}, target_results: int = 1, max_ttl: int = None,
+                              window: float = None) -> list:
+        '''
+        Searches with a growing ttl instead of flooding SEARCH_TTL hops right away. The first ring reaches
+        RING_START_TTL hops, every further ring RING_TTL_STEP hops more, until 'target_results' nodes answered or
+        'max_ttl' is reached. Popular boards are found in the first rings with a fraction of the PINGs of a flood.
+        Every ring is a new PING, nodes of the inner rings would drop a known ping id without forwarding it.
+        :param target_results: number of answering nodes that ends the search
+        :param max_ttl: ttl of the last ring, defaults to SEARCH_TTL
+        :param window: seconds to wait for the PONGs of a ring, defaults to RING_WINDOW
+        :return: PONGs of all rings, one per answering node
+        '''
+        max_ttl = max_ttl or self.SEARCH_TTL
+        window = self.RING_WINDOW if window is None else window
+        # PONGs of all rings are collected in the same list
+        results = []
+        self.ring_searches += 1
+
+        ttl = min(self.RING_START_TTL, max_ttl)
+        while True:
+            self.rings_issued += 1
+            forwarded = self.pings_forwarded
+            self.issue_search_request(keywords, ttl, results)
+            print(f"[SEARCH] Ring with ttl {ttl} for {list(keywords)}")
+
+            # if the keyword summaries ruled out every neighbour, no PONG can come back within this ring
+            deadline = time.monotonic() + (window if self.pings_forwarded != forwarded else 0)
+            while len(self._distinct_responders(results)) < target_results and time.monotonic() < deadline:
+                if self.stopped.wait(0.01):
+                    break
+
+            answered = self._distinct_responders(results)
+            if len(answered) >= target_results:
+                self.ring_searches_satisfied += 1
+                break
+            if ttl >= max_ttl or self.stopped.is_set():
+                break
+            ttl = min(ttl + self.RING_TTL_STEP, max_ttl)
+
+        print(f"[SEARCH] {len(answered)} results with ttl {ttl}")
+        return list(answered.values())
+
+    @staticmethod
+    def _distinct_responders(pongs: list) -> dict:
+        '''
+        :return: responder_id: first PONG of that responder, inner rings answer again in every further ring
+        '''
+        responders = {}
+        for pong in list(pongs):
+            responders.setdefault(pong.get("responder_id"), pong)
+        return responders
+
+    def select_ping_targets(self, keywords, ttl: int, exclude: str = None) -> list:
+        '''
+        Picks the peers a PING is sent to. A peer is skipped if its keyword summary rules out a match on every node
+        the PING could still reach through it. PINGs without keywords and peers without a summary are flooded.
+        :param ttl: ttl the PING carries when it arrives at the peer
+        :param exclude: node id of the peer the PING came from
+        :return: list of (peer_id, (host, port, is_super))
+        '''
         with self.peers_lock:
-            for _, (host, port, _) in self.peers.items():
-                try:
-                    conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    conn.connect((host, port))
-                    packet = create_packet(MessageType.PING, self.node_id, self.host, self.port, self.super_peer,
-                                           payload)
-                    send_packet(packet, conn)
-                    # optional das ganze hierdurch handeln lassen
-                    # threading.Thread(target=self._handle_peer_connection, args=(conn, (host, port)), daemon=True).start()
-                except Exception as e:
-                    print(f"Error sending ping to {host}:{port} – {e}")
+            peers = [(peer_id, info) for peer_id, info in self.peers.items() if peer_id != exclude]
 
-    def _handle_peer_connection_request(self, conn, addr):
-        """Handles a single client connection (a peer)."""
+        if not keywords:
+            selected = peers
+        else:
+            selected = []
+            for peer_id, info in peers:
+                summary = self.neighbour_summaries.get(peer_id)
+                if summary is None or summary.might_match(keywords, ttl):
+                    selected.append((peer_id, info))
 
-        data = receive_packet(conn)
-        send_host, send_port = addr
+        self.pings_forwarded += len(selected)
+        self.pings_pruned += len(peers) - len(selected)
+        return selected
 
-        while data is not None:
-            try:
+    def select_walker_targets(self, keywords, ttl: int, count: int, exclude: str = None) -> list:
+        '''
+        Picks random peers for 'count' walkers, peers whose keyword summary may match are preferred. If there are
+        fewer candidates than walkers, some walkers share a peer. A walker in a dead end goes back to 'exclude'.
+        :param ttl: steps left for the walker when it arrives at the peer
+        :param exclude: node id of the peer the walker came from
+        :return: list of (peer_id, (host, port, is_super)), empty if this node has no peers
+        '''
+        with self.peers_lock:
+            peers = list(self.peers.items())
+        others = [(peer_id, info) for peer_id, info in peers if peer_id != exclude] or peers
+
+        candidates = others
+        if keywords:
+            matching = []
+            for peer_id, info in others:
+                summary = self.neighbour_summaries.get(peer_id)
+                if summary is None or summary.might_match(keywords, ttl):
+                    matching.append((peer_id, info))
+            # the summaries only see SUMMARY_DEPTH hops, a walker may still find something behind a pruned peer
+            candidates = matching or others
+        if not candidates:
+            return []
 
-                # transform data into a readable format
-                data = json.loads(data)
-                print (f"Received data from {send_host}:{send_port}: {data}")
-                try:
-                    msg_type = MessageType(data.get("type", "error"))
-
-                except ValueError as e:
-                    print(f"Couldnt get type of dataset: {e}")
-                    msg_type = MessageType.ERROR
-                other_id = data.get("node_id")
-                reach_host = data.get("host")
-                reach_port = data.get("port")
-                payload = data.get('payload')
-
-                match msg_type:
-                    case MessageType.DATA_REQUEST:
-                        print("Data request received.")
-                        # send requested data
-                        self.data_request_handler(conn, payload, reach_host, reach_port)
-                    case MessageType.DATA_PEER_REQUEST:
-                        self.send_req_card_frame(conn, payload)
-                    case MessageType.DATA_RESPONSE:
-                        print("Got data response.")
-                        # send close, only react to possible cases
-                        send_close(self, conn)
-                    case MessageType.DATA_UPDATE:
-                        print("Data update received.")
-                        self.data_update_handler(other_id, payload, reach_host, reach_port)
-                        # update local data
-
-                    case MessageType.PING:
-                        print("Received PING.")
-                        handle_ping(self, conn, data)
-                        # reply with PONG
-
-                    case MessageType.PONG:
-                        print("Received PONG.")
-                        self.pongs += 1
-                        handle_pong(self, data)
-                        # maybe update liveness
-
-                    case MessageType.GET_PEERS:
-                        get_peers_handler(self, conn, other_id, reach_host, reach_port)
-                        print("Peer requests peer list.")
-                        # send known peers
-
-                    case MessageType.PEER_LIST:
-                        print("Got peer list.")
-                        peer_list_handler(self, data.get('payload'))
-                        # after adding whole peer list break this loop ???
-                        return
-                        # add peers
-                    case MessageType.CLOSE:
-                        print("Connection close requested.")
-                        if conn.fileno() != -1:
-                            conn.shutdown(socket.SHUT_RDWR)
-                            conn.close()
-                        # cleanup and close
-                    case MessageType.ERROR:
-                        print("Received unknown or malformed message.")
-                        # maybe log or ignore
-
-                        # DEFAULT handling: close connection
-                        send_close(self, conn)
-                        break
-
-                    case MessageType.CONNECT:
-                        print("Connection request")
-                        connect_handler(self, conn, other_id, reach_host, reach_port, data.get('super'))
-
-                    case MessageType.CONNECT_RESPONSE:
-                        print("Response to connection request")
-                        # always decline
-                        send_close(self, conn)
-
-                    case MessageType.BOARD_REGISTER:
-                        print("Board registration received.")
-                        self.handle_board_registration(payload)
-                        # Send confirmation back
-                        response = create_packet(MessageType.BOARD_REGISTER_RESPONSE, self.node_id, self.host, self.port, self.super_peer, {"status": "registered"})
-                        send_packet(response, conn)
-
-                    case MessageType.BOARD_REGISTER_RESPONSE:
-                        print("Board registration confirmed.")
-                        # Handle confirmation if needed
-                    
-                    case MessageType.BOARD_UNREGISTER:
-                        print("Board unregistration received.")
-                        self.handle_board_unregistration(payload)
-                        # Send confirmation back
-                        response = create_packet(MessageType.BOARD_UNREGISTER_RESPONSE, self.node_id, self.host, self.port, self.super_peer, {"status": "unregistered"})
-                        send_packet(response, conn)
-
-                    case MessageType.BOARD_UNREGISTER_RESPONSE:
-                        print("Board unregistration confirmed.")
-                        # Handle confirmation if needed
+        if count <= len(candidates):
+            selected = random.sample(candidates, count)
+        else:
+            selected = candidates + random.choices(candidates, k=count - len(candidates))
+        self.pings_forwarded += len(selected)
+        return selected
 
-            except Exception as e:
-                print(
-                    f"Error host: {self.host}:{self.port} handling client connection from {addr} with msg_type: {msg_type}: {e}")
-            finally:
-                conn.close()
-                # if finally executes break or return the error is discarded (maybe think about this here??!?)
+    def _local_keywords(self) -> set:
+        '''
+        :return: keywords a search can find on this node
+        '''
+        self._index_own_board()
+        self.registry.refresh()
+        sources = self._answer_sources()
+        if REGISTERED in sources and self.registry.searchable:
+            return self.keyword_index.get_terms(sources) | self.registry.get_terms()
+        return self.keyword_index.get_terms(sources)
+
+    def get_cached_search(self, keywords, prefix: bool, ttl: int):
+        '''
+        :param ttl: hops the results have to cover
+        :return: PONGs of an own search with the same keywords or 'None' if this node should search itself
+        '''
+        if not self.super_peer or not keywords:
+            return None
+        self._close_routed_windows()
+        return self.query_cache.get(keywords, prefix, ttl)
 
-            # sanity check whether is closed, this can happen whenever
-            if conn.fileno() < 0:
-                # break the while loop and therefore close connection entirely
-                break
+    def collect_routed_results(self, ping_id, keywords, prefix: bool, ttl: int):
+        '''
+        Collects the PONGs routed back for a PING of another node this super peer forwards, for QUERY_CACHE_SETTLE
+        seconds. Then they go into the query cache like the results of an own search.
+        :param ttl: ttl the PING was forwarded with
+        '''
+        if not self.super_peer or not keywords:
+            return
+        self.routed_results[ping_id] = []
+        closes = self.query_cache.clock() + self.QUERY_CACHE_SETTLE
+        with self.routed_lock:
+            self.routed_windows.append((closes, ping_id, tuple(keywords), prefix, ttl))
+        self._close_routed_windows()
+
+    def add_routed_result(self, ping_id, responder_info: dict):
+        '''
+        Remembers a PONG routed back for a forwarded PING. PONGs of registry nodes are left out, they carry the changes
+        since the registry position of the origin and only the ids of the matching boards.
+        '''
+        if not responder_info.get("boards"):
+            return
+        if (responder_info.get("responder_host"), responder_info.get("responder_port")) in registry_nodes():
+            return
+        results = self.routed_results.get(ping_id)
+        if results is not None:
+            results.append(responder_info)
+
+    def _close_routed_windows(self):
+        '''
+        Puts the forwarded searches whose window closed into the query cache. The list stays in routed_results, PONGs
+        arriving later still fill the cached entry.
+        '''
+        now = self.query_cache.clock()
+        closed = []
+        with self.routed_lock:
+            while self.routed_windows and self.routed_windows[0][0] <= now:
+                closed.append(self.routed_windows.popleft())
+        for closes, ping_id, keywords, prefix, ttl in closed:
+            results = self.routed_results.get(ping_id)
+            if results:
+                self.query_cache.put(keywords, prefix, results, ttl, closes - self.QUERY_CACHE_SETTLE)
+
+    def invalidate_cached_searches(self, board: dict):
+        '''
+        Drops the cached searches a registered, changed or removed board could be a result of.
+        '''
+        dropped = self.query_cache.invalidate(board_terms(board))
+        if dropped:
+            print(f"[CACHE] {dropped} cached searches invalidated by board {board.get('board_title')}")
+
+    def load_board_lists(self):
+        '''
+        Indexes the board registry and the boards received from the bootstrap node. The index follows all later
+        changes of the registry.
+        '''
+        if not self.registry.searchable:
+            self.keyword_index.replace_source(REGISTERED, self.registry.get_snapshot())
+        self.registry.add_listener(self._registry_changed)
+        if self.bootstrap:
+            # the owners of boards registered before the start have one lease to send their first heartbeat
+            self.leases.grant(board["board_id"] for board in self.registry.get_boards())
+
+        self.registry_replica.load()
+        self.keyword_index.replace_source(RECEIVED, self.registry_replica.get_boards())
+
+    def get_registry_changes(self, positions) -> dict:
+        '''
+        :param positions: epoch and version of the registry copy of the origin of a PING per registry node
+        :return: changes of the registry of this node since that version, all of it if the origin is too far behind
+        '''
+        position = positions.get(f"{self.host}:{self.port}") if isinstance(positions, dict) else None
+        if not isinstance(position, dict):
+            position = {}
+        try:
+            version = int(position.get("version", -1))
+        except (TypeError, ValueError):
+            version = -1
+        return self.registry.get_changes(position.get("epoch"), version)
+
+    def apply_registry_changes(self, changes, source: str) -> bool:
+        '''
+        Applies registry changes sent by a registry node to the registry copy and the keyword index.
+        :param source: "host:port" of the registry node
+        :return: 'True' if the copy changed
+        '''
+        try:
+            applied = self.registry_replica.apply(changes, source)
+        except ValueError as e:
+            print(f"[REGISTRY] Ignoring registry changes: {e}")
+            return False
+        if applied is None:
+            return False
+        upserted, removed, full = applied
+        self._replica_changed(upserted, removed, full)
+        kind = "snapshot" if full else "delta"
+        print(f"[REGISTRY] Applied {kind} version {changes.get('version')} of {source}: "
+              f"{len(upserted)} boards, {len(removed)} removed")
+        return True
+
+    def _replica_changed(self, upserted: list, removed: list, full: bool = False):
+        '''
+        Follows the changes of the registry copy in the keyword index, the query cache and the keyword summary.
+        :param removed: entries of the removed boards, their titles and keywords tell which cached searches they were
+        a result of
+        :param full: a snapshot replaced the boards of a registry node, every cached search is dropped at once
+        '''
+        for board in removed:
+            self.keyword_index.remove_board(board["board_id"], RECEIVED)
+        for board in upserted:
+            self.keyword_index.add_board(board, RECEIVED)
+        if full:
+            dropped = self.query_cache.invalidate()
+            if dropped:
+                print(f"[CACHE] {dropped} cached searches invalidated by a registry snapshot")
+        else:
+            for board in removed + upserted:
+                self.invalidate_cached_searches(board)
+        if (upserted or removed) and self.answers_from_replica():
+            self._mark_summary_dirty()
+
+    def _mark_summary_dirty(self):
+        '''
+        The keywords this node can answer for changed, the maintenance thread sends the keyword summary after
+        SUMMARY_DEBOUNCE seconds, so that searches pruned by it do not miss new boards until the next SUMMARY_INTERVAL.
+        '''
+        if self.summary_dirty_since is None:
+            self.summary_dirty_since = time.monotonic()
+            self.maintenance_wakeup.set()
+
+    def _registry_changed(self, added: list, removed: list):
+        if added or removed:
+            self._mark_summary_dirty()
+        if self.bootstrap:
+            self.leases.release(board.get("board_id") for board in removed)
+            self.leases.grant(board.get("board_id") for board in added)
+        # a registry searching by itself is not copied into the keyword index
+        indexed = not self.registry.searchable
+        for board in removed:
+            if indexed:
+                self.keyword_index.remove_board(board.get("board_id"), REGISTERED)
+            self.invalidate_cached_searches(board)
+        for board in added:
+            if indexed:
+                self.keyword_index.add_board(board, REGISTERED)
+            self.invalidate_cached_searches(board)
+
+    def _answer_sources(self) -> tuple:
+        # registry nodes answer for their shard of the registry, super peers holding a copy of every shard for that
+        # copy, every other node for its own boards only
+        if self.bootstrap:
+            return OWN, REGISTERED
+        if self.answers_from_replica():
+            return OWN, RECEIVED
+        return (OWN,)
+
+    def answers_from_replica(self) -> bool:
+        return (self.ANSWER_FROM_REPLICA and self.super_peer and not self.bootstrap
+                and self.registry_replica.covers(f"{host}:{port}" for host, port in registry_nodes()))
+
+    def sync_registry(self, host: str = None, port: int = None) -> int:
+        '''
+        One anti-entropy round: fetches the parts of the registry copy of another super peer that are ahead of the own
+        copy. The hash trees of every such source are compared level by level, only the boards of the key ranges whose
+        digests differ are transferred.
+        :param host: peer to reconcile with, by default a random super peer neighbour
+        :return: number of boards received
+        '''
+        if host is None:
+            shards = set(registry_nodes())
+            with self.peers_lock:
+                candidates = [(h, p) for h, p, is_super in self.peers.values() if is_super and (h, p) not in shards]
+            if not candidates:
+                return 0
+            host, port = random.choice(candidates)
+
+        received = 0
+        try:
+            ahead = self._sync_request(host, port, {"positions": self.registry_replica.get_sync_positions()})
+            for source, state in (ahead.get("sources") or {}).items():
+                received += self._sync_source(host, port, source, state["position"], state["children"])
+        except (OSError, ConnectionError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.sync_failures += 1
+            print(f"[SYNC] Anti-entropy with {host}:{port} failed: {e}")
+            return received
+        self.registry_syncs += 1
+        return received
+
+    def _sync_source(self, host, port, source: str, position: dict, children: dict) -> int:
+        '''
+        Walks down the hash tree of one source while the digests differ and replaces the differing key ranges.
+        '''
+        _, own = self.registry_replica.get_children(source, [""])
+        pending = diff_children(own.get("", {}), children)
+        while pending and len(pending[0]) < DEPTH:
+            answer = self._sync_request(host, port, {"source": source, "prefixes": pending})
+            if answer.get("position") != position:
+                # the other copy changed meanwhile, the next round starts over
+                return 0
+            _, own = self.registry_replica.get_children(source, pending)
+            other = answer.get("children") or {}
+            pending = [child for prefix in pending for child in diff_children(own.get(prefix, {}), other.get(prefix, {}))]
+
+        boards = []
+        if pending:
+            answer = self._sync_request(host, port, {"source": source, "ranges": pending})
+            if answer.get("position") != position:
+                return 0
+            boards = answer.get("boards") or []
+        applied = self.registry_replica.replace_ranges(source, position, pending, boards)
+        if applied is None:
+            return 0
+        upserted, removed = applied
+        self._replica_changed(upserted, removed)
+        print(f"[SYNC] Copy of {source} now at version {position.get('version')}: {len(pending)} ranges, "
+              f"{len(upserted)} boards, {len(removed)} removed")
+        return len(upserted)
+
+    def _sync_request(self, host, port, payload: dict) -> dict:
+        packet = create_packet(MessageType.REGISTRY_SYNC, self.node_id, self.host, self.port, self.super_peer, payload)
+        self.sync_requests += 1
+        response = self.pool.request(host, port, packet)
+        if response is None:
+            raise ConnectionError("no answer")
+        response = decode_packet(response)
+        if response.get("type") != MessageType.REGISTRY_SYNC_RESPONSE.value:
+            raise ValueError(f"unexpected answer {response.get('type')}")
+        answer = response.get("payload") or {}
+        if answer.get("error"):
+            raise ValueError(answer["error"])
+        return answer
+
+    def _own_board_entry(self, board_id, title, keywords) -> dict:
+        return {
+            "board_id": board_id,
+            "peer_id": self.node_id,
+            "board_title": title,
+            "keywords": list(keywords),
+            "peer_host": self.host,
+            "peer_port": self.port,
+            "status": "active",
+        }
+
+    def _index_own_board(self):
+        '''
+        Keeps the index entry of self.board up to date, the board can be replaced or get new keywords at any time.
+        '''
+        board = self.board
+        if not isinstance(board, Board):
+            return
+        state = (board.board_id, board.get_title(), frozenset(board.get_keywords()))
+        if state == self.indexed_own_board:
+            return
+        entry = self._own_board_entry(*state)
+        self.invalidate_cached_searches(entry)
+        if self.indexed_own_board is not None and self.indexed_own_board[0] != board.board_id:
+            self.keyword_index.remove_board(self.indexed_own_board[0])
+        self.keyword_index.add_board(entry, OWN)
+        self.indexed_own_board = state
+
+    def find_matching_boards(self, keywords, prefix: bool = False, sources=None) -> list:
+        '''
+        :param keywords: one of them has to match a keyword or title word, no keywords match every board
+        :param prefix: keywords also match words they are a prefix of
+        :param sources: by default the boards this node answers PINGs for, its own and on the bootstrap node the
+        registered ones
+        :return: matching board entries in the format of data/boards.json
+        '''
+        self._index_own_board()
+        # notices changes of the registry file made by other processes, only touches the disk every few seconds
+        self.registry.refresh()
+        sources = sources or self._answer_sources()
+        if REGISTERED not in sources or not self.registry.searchable:
+            return self.keyword_index.search(keywords, prefix, sources)
+
+        # the SQLite registry searches itself, entries of more authoritative sources win as in the keyword index
+        boards = []
+        seen = set()
+        for source in sorted(sources, key=ALL_SOURCES.index):
+            if source == REGISTERED:
+                found = self.registry.search(keywords, prefix)
             else:
-                data = receive_packet(conn)
+                found = self.keyword_index.search(keywords, prefix, (source,))
+            for board in found:
+                if board.get("board_id") not in seen:
+                    seen.add(board.get("board_id"))
+                    boards.append(board)
+        return boards
+
+    def build_keyword_summary(self) -> KeywordSummary:
+        return KeywordSummary.build(self._local_keywords(), self.neighbour_summaries.values())
+
+    def send_keyword_summary(self, host, port, summary: KeywordSummary = None):
+        '''
+        Sends the keyword summary of this node to a single peer.
+        '''
+        summary = summary or self.build_keyword_summary()
+        data = create_packet(MessageType.KEYWORD_SUMMARY, self.node_id, self.host, self.port, self.super_peer,
+                             summary.to_payload())
+        try:
+            self.pool.send(host, port, data)
+        except Exception as e:
+            print(f"Error sending keyword summary to {host}:{port}: {e}")
+
+    def send_keyword_summaries(self):
+        '''
+        Sends the current keyword summary of this node to all peers. Every round spreads the keywords one hop further,
+        until SUMMARY_DEPTH hops are covered.
+        '''
+        summary = self.build_keyword_summary()
+        with self.peers_lock:
+            peers = list(self.peers.values())
+        data = create_packet(MessageType.KEYWORD_SUMMARY, self.node_id, self.host, self.port, self.super_peer,
+                             summary.to_payload())
+        self.fan_out([(host, port) for host, port, _ in peers], data, "keyword summary")
+
+    def keyword_summary_handler(self, other_id: str, payload: dict):
+        try:
+            self.neighbour_summaries[other_id] = KeywordSummary.from_payload(payload)
+        except ValueError as e:
+            print(f"Ignoring keyword summary of {other_id}: {e}")
+
+    def _handle_message(self, conn, data: dict, addr) -> bool:
+        '''
+        Dispatches a single decoded frame to its handler. This is shared by the threaded and the asyncio network core,
+        conn only has to provide the socket methods used by send_packet and send_close.
+        :return: 'False' if no further frames should be read from this connection, otherwise 'True'
+        '''
+        send_host, send_port = addr
+        print (f"Received data from {send_host}:{send_port}: {data}")
+        try:
+            msg_type = MessageType(data.get("type", "error"))
+
+        except ValueError as e:
+            print(f"Couldnt get type of dataset: {e}")
+            msg_type = MessageType.ERROR
+        other_id = data.get("node_id")
+        reach_host = data.get("host")
+        reach_port = data.get("port")
+        payload = data.get('payload')
+
+        match msg_type:
+            case MessageType.DATA_REQUEST:
+                print("Data request received.")
+                # send requested data
+                self.data_request_handler(conn, payload, reach_host, reach_port)
+            case MessageType.DATA_PEER_REQUEST:
+                self.send_req_card_frame(conn, payload)
+            case MessageType.DATA_RESPONSE:
+                print("Got data response.")
+                # send close, only react to possible cases
+                send_close(self, conn)
+            case MessageType.DATA_UPDATE:
+                print("Data update received.")
+                self.data_update_handler(other_id, payload, reach_host, reach_port)
+                # update local data
+
+            case MessageType.PING:
+                print("Received PING.")
+                handle_ping(self, conn, data)
+                # reply with PONG
+
+            case MessageType.PONG:
+                print("Received PONG.")
+                self.pongs += 1
+                handle_pong(self, data)
+                # maybe update liveness
+
+            case MessageType.PONG_BATCH:
+                pongs = payload.get("pongs") or []
+                print(f"Received {len(pongs)} PONGs.")
+                self.pongs += len(pongs)
+                for pong_payload in pongs:
+                    handle_pong(self, {"payload": pong_payload})
+
+            case MessageType.GET_PEERS:
+                get_peers_handler(self, conn, other_id, reach_host, reach_port)
+                print("Peer requests peer list.")
+                # send known peers
+
+            case MessageType.PEER_LIST:
+                print("Got peer list.")
+                peer_list_handler(self, data.get('payload'))
+                # after adding whole peer list stop serving this connection
+                return False
+                # add peers
+            case MessageType.CLOSE:
+                print("Connection close requested.")
+                if conn.fileno() != -1:
+                    conn.shutdown(socket.SHUT_RDWR)
+                    conn.close()
+                # cleanup and close
+            case MessageType.ERROR:
+                print("Received unknown or malformed message.")
+                # maybe log or ignore
+
+                # DEFAULT handling: close connection
+                send_close(self, conn)
+                return False
+
+            case MessageType.CONNECT:
+                print("Connection request")
+                connect_handler(self, conn, other_id, reach_host, reach_port, data.get('super'), payload)
+
+            case MessageType.CONNECT_RESPONSE:
+                print("Response to connection request")
+                # always decline
+                send_close(self, conn)
+
+            case MessageType.BOARD_REGISTER:
+                print("Board registration received.")
+                self.handle_board_registration(payload)
+                # Send confirmation back
+                response = create_packet(MessageType.BOARD_REGISTER_RESPONSE, self.node_id, self.host, self.port, self.super_peer, {"status": "registered", "lease": self.leases.duration})
+                send_packet(response, conn)
+
+            case MessageType.BOARD_REGISTER_RESPONSE:
+                print("Board registration confirmed.")
+                # Handle confirmation if needed
+            
+            case MessageType.BOARD_UNREGISTER:
+                print("Board unregistration received.")
+                self.handle_board_unregistration(payload)
+                # Send confirmation back
+                response = create_packet(MessageType.BOARD_UNREGISTER_RESPONSE, self.node_id, self.host, self.port, self.super_peer, {"status": "unregistered"})
+                send_packet(response, conn)
+
+            case MessageType.BOARD_UNREGISTER_RESPONSE:
+                print("Board unregistration confirmed.")
+                # Handle confirmation if needed
+
+            case MessageType.KEYWORD_SUMMARY:
+                self.keyword_summary_handler(other_id, payload)
+
+            case MessageType.BOARD_HEARTBEAT:
+                response = create_packet(MessageType.BOARD_HEARTBEAT_RESPONSE, self.node_id, self.host, self.port,
+                                         self.super_peer, self.handle_board_heartbeat(payload))
+                send_packet(response, conn)
+
+            case MessageType.BOARD_HEARTBEAT_RESPONSE:
+                print("Board heartbeat confirmed.")
+
+            case MessageType.REGISTRY_SYNC:
+                registry_sync_handler(self, conn, payload)
+
+        return True
 
     def stop(self):
         """Stops the node and closes all connections."""
         self.running = False
+        self.stopped.set()
+        self.maintenance_wakeup.set()
+        self.registry.remove_listener(self._registry_changed)
         self.peers.clear()
+        self.pong_batcher.stop()
+        self.pool.close_all()
+        if self.worker_pool:
+            self.worker_pool.stop()
         if self.server_socket:
             self.server_socket.close()
 
@@ -373,20 +1442,29 @@ class PeerNode:
             # First time becoming super peer
             self.super_peer = True
             self.board = Board(title, keywords)
+            board_id = self.board.board_id
+            # searches for the new board shall reach this node
+            self._index_own_board()
+            self.send_keyword_summaries()
             
             # Send board registration to bootstrap via P2P
             if not self.bootstrap:
-                self.send_board_registration_to_bootstrap(title, keywords)
+                self.send_board_registration_to_bootstrap(title, keywords, board_id)
             
             print(f"Peer is superpeer:{self.super_peer}")
             return True
         else:
             # Already a super peer, but allow additional board creation
             print("Peer is already super peer, registering additional board")
+            board_id = str(uuid.uuid4())
+            entry = self._own_board_entry(board_id, title, keywords)
+            self.keyword_index.add_board(entry, OWN)
+            self.invalidate_cached_searches(entry)
+            self.send_keyword_summaries()
             
             # Send board registration to bootstrap via P2P for additional boards
             if not self.bootstrap:
-                self.send_board_registration_to_bootstrap(title, keywords)
+                self.send_board_registration_to_bootstrap(title, keywords, board_id)
             
             return True  # Return True to indicate success
 
@@ -440,11 +1518,9 @@ class PeerNode:
                         host = pong.get("responder_host")
                         port = pong.get("responder_port")
 
-                        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        conn.connect((host, port))
                         data = create_packet(MessageType.DATA_UPDATE, self.node_id, self.host, self.port,
                                              self.super_peer, payload)
-                        send_packet(data, conn)
+                        self.pool.send(host, port, data)
 
     # CHAT-GPT -lol
     def send_req_card_frame(self, conn, payload):
@@ -467,17 +1543,13 @@ class PeerNode:
             )
             send_packet(error_packet, conn)
 
-        finally:
-            # aufräumen, also connection schließen
-            if conn.fileno() != -1:
-                conn.close()
-
     def send_content_card(self, conn, content_title):
 
         card_ref = self.data_store.get(content_title)
         if not card_ref:
-            # no such content reference
-            # just leave this function
+            # no such content reference, answer anyway so the requester does not wait for nothing
+            send_packet(create_packet(MessageType.DATA_RESPONSE, self.node_id, self.host, self.port,
+                                      self.super_peer, []), conn)
             return
 
         (content, board) = card_ref
@@ -555,19 +1627,29 @@ class PeerNode:
     def resolve_meta_data(self, meta_list: str, board_title: str, board_id: str):
         # load meta list into a json format
         result = []
-        # sequentiell:
+        # ask all content peers at once, requests to the same peer are pipelined over one connection
+        requests = []
         for (b_id, title, host, port, timestamp) in meta_list:
             # define meta_info as tuple (id, host, port, title
             # ask for the content matching to the meta informaton
-            response = self.send_data_request(host, port, board_title, "content", title, peer_request=True)
+            packet = self._create_data_request_packet(board_title, "content", title, peer_request=True)
+            try:
+                requests.append((host, port, self.pool.submit(host, port, packet)))
+            except Exception as e:
+                print(f"Fehler beim Senden des DATA_REQUEST an {host}:{port} – {e}")
+
+        for (host, port, future) in requests:
+            try:
+                response = decode_packet(future.result(timeout=self.pool.io_timeout))
+            except Exception as e:
+                print(f"Fehler beim Empfangen der DATA_RESPONSE von {host}:{port} – {e}")
+                continue
 
-            # response = json.loads(response)
-            payload = response.get("payload")
             # expect a list in return
             if response and response.get("type") == MessageType.DATA_RESPONSE and response.get("payload"):
                 # Every entry in payload should contain (board-title, content-title, content)
                 node_id = response.get("node_id")
-                for (board, content_title, content) in payload:
+                for (board, content_title, content) in response.get("payload"):
                     # TODO put the data into the right format
                     if board == board_title:
                         result.append((board_id, board_title, node_id, content_title, content))
@@ -576,6 +1658,24 @@ class PeerNode:
 
         return result
 
+    def _create_data_request_packet(self, board_title: str, request_type: str, content_title: str = None,
+                                    peer_request: bool = False) -> dict:
+        payload = {
+            "board": board_title,
+            "type": request_type
+        }
+
+        if request_type == "content" and content_title:
+            payload["title"] = content_title
+
+        return create_packet(
+            MessageType.DATA_REQUEST if not peer_request else MessageType.DATA_PEER_REQUEST,
+            self.node_id,
+            self.host,
+            self.port,
+            self.super_peer,
+            payload
+        )
 
     def send_data_request(self, host: str, port: int, board_title: str, request_type: str = "meta",
                           content_title: str = None, peer_request: bool = False):
@@ -589,31 +1689,12 @@ class PeerNode:
         :param request_type: "meta" für Meta-Daten oder "content" für konkreten Inhalt
         :param content_title: optionaler Titel für eine spezifische Karte (bei Content-Anfrage) nicht implementiert!!!!!!!!!!!!
         """
-        payload = {
-            "board": board_title,
-            "type": request_type
-        }
-
-        if request_type == "content" and content_title:
-            payload["title"] = content_title
-
         try:
-            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            conn.connect((host, port))
-
-            packet = create_packet(
-                MessageType.DATA_REQUEST if not peer_request else MessageType.DATA_PEER_REQUEST,
-                self.node_id,
-                self.host,
-                self.port,
-                self.super_peer,
-                payload
-            )
-            send_packet(packet, conn)
+            packet = self._create_data_request_packet(board_title, request_type, content_title, peer_request)
 
             # Direkt Antwort lesen (optional, falls synchron gewünscht)
-            response = receive_packet(conn)
-            response = json.loads(response)
+            response = self.pool.request(host, port, packet)
+            response = decode_packet(response)
 
             if response and request_type == "meta" and response.get("payload"):
                 print(f"DATA_RESPONSE erhalten: {response}")
@@ -623,16 +1704,12 @@ class PeerNode:
                 return response
 
                 # Verarbeitung (optional)
-                # z. B. json.loads(response) und weiterreichen an eine handler-Methode
+                # z. B. json.loads(response) und weiterreichen an eine handler-Methode
             else:
                 print("Keine Antwort vom Peer erhalten.")
 
                 return None
 
-            # Verbindung schließen
-            # if conn.fileno() != -1:
-            #     send_close(self, conn)
-
         except Exception as e:
             print(f"Fehler beim Senden des DATA_REQUEST an {host}:{port} – {e}")
 
@@ -649,14 +1726,10 @@ class PeerNode:
         # very simple, maybe optimize
         self.data_store[title] = (content, board)
 
-    def send_board_registration_to_bootstrap(self, title, keywords):
+    def send_board_registration_to_bootstrap(self, title, keywords, board_id: str = None):
         try:
-            from Backend.config import BOOTSTRAP
-            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            conn.connect(BOOTSTRAP)
-            
             board_data = {
-                "board_id": str(uuid.uuid4()),
+                "board_id": board_id or str(uuid.uuid4()),
                 "peer_id": self.node_id,
                 "board_title": title,
                 "keywords": keywords,
@@ -665,36 +1738,117 @@ class PeerNode:
             }
             
             packet = create_packet(MessageType.BOARD_REGISTER, self.node_id, self.host, self.port, self.super_peer, board_data)
-            send_packet(packet, conn)
-            
-            # Wait for response
-            response = receive_packet(conn)
-            if response:
-                print(f"Board registration response: {response}")
-            
-            conn.close()
         except Exception as e:
             print(f"Error registering board with bootstrap: {e}")
+            return
+
+        # the lease of the registration is renewed by send_heartbeats from now on
+        with self.registered_lock:
+            self.registered_boards[board_data["board_id"]] = board_data
+
+        # the registry nodes owning the board on the hash ring, one per replica
+        for host, port in registry_owners(board_data["board_id"]):
+            try:
+                # Wait for response
+                response = self.pool.request(host, port, packet)
+                if response:
+                    print(f"Board registration response from {host}:{port}: {response}")
+                    self._note_lease(decode_packet(response).get("payload"))
+            except Exception as e:
+                print(f"Error registering board with registry node {host}:{port}: {e}")
+
+    def _note_lease(self, answer):
+        # renewals follow the shortest lease a registry node granted
+        lease = answer.get("lease") if isinstance(answer, dict) else None
+        if isinstance(lease, (int, float)) and lease > 0:
+            self.granted_lease = min(self.BOARD_LEASE, lease)
+
+    def _renewal_interval(self) -> float:
+        interval = self.granted_lease * self.LEASE_RENEW_FRACTION
+        return interval * (1 + random.uniform(-self.LEASE_JITTER, self.LEASE_JITTER))
+
+    def send_heartbeats(self):
+        '''
+        Renews the leases of the boards this node registered, one BOARD_HEARTBEAT per registry node carrying all boards
+        registered there. Boards a registry node does not know (anymore), e.g. because their lease ended while this
+        node was unreachable, are registered again.
+        '''
+        with self.registered_lock:
+            registrations = dict(self.registered_boards)
+        if not registrations:
+            return
+
+        by_node = {}
+        for board_id in registrations:
+            for owner in registry_owners(board_id):
+                by_node.setdefault(owner, []).append(board_id)
+
+        # all registry nodes at once, the requests are pipelined like GET_PEERS
+        requests = []
+        for (host, port), board_ids in by_node.items():
+            packet = create_packet(MessageType.BOARD_HEARTBEAT, self.node_id, self.host, self.port, self.super_peer,
+                                   {"peer_id": self.node_id, "board_ids": board_ids})
+            requests.append((host, port, self.pool.submit(host, port, packet)))
+
+        lost = set()
+        for host, port, future in requests:
+            try:
+                response = future.result(timeout=self.pool.io_timeout)
+            except Exception as e:
+                print(f"[LEASE] Heartbeat to {host}:{port} failed: {e}")
+                continue
+            self.heartbeats_sent += 1
+            answer = decode_packet(response).get("payload") if response is not None else None
+            if isinstance(answer, dict):
+                self._note_lease(answer)
+                lost.update(answer.get("unknown") or [])
+
+        for board_id in lost:
+            board = registrations.get(board_id)
+            with self.registered_lock:
+                if board is None or board_id not in self.registered_boards:
+                    # unregistered meanwhile
+                    continue
+            print(f"[LEASE] Board {board['board_title']} unknown to its registry node, registering it again")
+            self.reregistrations += 1
+            self.send_board_registration_to_bootstrap(board["board_title"], board["keywords"], board_id)
+
+    def handle_board_heartbeat(self, heartbeat) -> dict:
+        '''
+        Renews the leases of the boards a peer registered with this registry node.
+        :return: answer with the lease duration and the ids of the boards unknown here, the peer registers them again
+        '''
+        if not self.bootstrap or not isinstance(heartbeat, dict):
+            return {"error": "not a registry node"}
+        peer_id = heartbeat.get("peer_id")
+        owned, unknown = [], []
+        for board_id in heartbeat.get("board_ids") or []:
+            board = self.registry.get_board(board_id)
+            if board is not None and board.get("peer_id") == peer_id:
+                owned.append(board_id)
+            else:
+                unknown.append(board_id)
+        self.leases.grant(owned)
+        return {"lease": self.leases.duration, "renewed": len(owned), "unknown": unknown}
+
+    def expire_leases(self) -> list:
+        '''
+        Removes the boards whose lease ended from the registry, the replicas learn it from the next registry changes.
+        :return: removed board entries
+        '''
+        expired = self.leases.pop_expired()
+        if not expired:
+            return []
+        removed = self.registry.unregister_ids(expired)
+        if removed:
+            print(f"[LEASE] {len(removed)} boards expired: {[board.get('board_title') for board in removed]}")
+        return removed
 
     def handle_board_registration(self, board_data):
         """Handle board registration from a peer (only on bootstrap node)"""
         if not self.bootstrap:
             return  # Only bootstrap should handle registrations
         
-        import json
-        import os
-        
-        # Create data directory if it doesn't exist
-        os.makedirs("data", exist_ok=True)
-        file_path = os.path.join("data", "boards.json")
-        
-        # Load existing boards
-        if os.path.exists(file_path):
-            with open(file_path, "r", encoding="utf-8") as f:
-                boards = json.load(f)
-        else:
-            boards = []
-        
         # Add new board
         board_entry = {
             "board_id": board_data["board_id"],
@@ -707,66 +1861,56 @@ class PeerNode:
             "status": "active"
         }
         
-        boards.append(board_entry)
-        
-        # Save boards
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(boards, f, ensure_ascii=False, indent=2)
-        
-        print(f"[BOOTSTRAP] Board registered: {board_data['board_title']} by peer {board_data['peer_id']}")
+        # the registry appends it to its log, the keyword index and the search cache follow it
+        if self.registry.register(board_entry):
+            print(f"[BOOTSTRAP] Board registered: {board_data['board_title']} by peer {board_data['peer_id']}")
+        else:
+            print(f"[BOOTSTRAP] Board already registered: {board_data['board_title']} ({board_data['board_id']})")
+            # registering again renews the lease like a heartbeat
+            self.leases.grant([board_data["board_id"]])
 
     def send_board_unregistration_to_bootstrap(self, board_title):
         try:
-            from Backend.config import BOOTSTRAP
-            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            conn.connect(BOOTSTRAP)
-            
             unregister_data = {
                 "peer_id": self.node_id,
                 "board_title": board_title
             }
             
             packet = create_packet(MessageType.BOARD_UNREGISTER, self.node_id, self.host, self.port, self.super_peer, unregister_data)
-            send_packet(packet, conn)
-            
-            # Wait for response
-            response = receive_packet(conn)
-            if response:
-                print(f"Board unregistration response: {response}")
-            
-            conn.close()
         except Exception as e:
             print(f"Error unregistering board with bootstrap: {e}")
+            return
+
+        # the registry nodes owning the own boards with this title, all of them if none is known
+        with self.registered_lock:
+            board_ids = [board_id for board_id, board in self.registered_boards.items()
+                         if board.get("board_title") == board_title]
+            for board_id in board_ids:
+                del self.registered_boards[board_id]
+        board_ids += [board["board_id"] for board in self.keyword_index.search([], sources=(OWN,))
+                      if board.get("board_title") == board_title and board["board_id"] not in board_ids]
+        owners = {owner for board_id in board_ids for owner in registry_owners(board_id)} or set(registry_nodes())
+        for host, port in owners:
+            try:
+                # Wait for response
+                response = self.pool.request(host, port, packet)
+                if response:
+                    print(f"Board unregistration response from {host}:{port}: {response}")
+            except Exception as e:
+                print(f"Error unregistering board with registry node {host}:{port}: {e}")
 
     def handle_board_unregistration(self, unregister_data):
         """Handle board unregistration from a peer (only on bootstrap node)"""
         if not self.bootstrap:
             return  # Only bootstrap should handle unregistrations
         
-        import json
-        import os
-        
-        file_path = os.path.join("data", "boards.json")
-        
-        if not os.path.exists(file_path):
-            return
-        
-        # Load existing boards
-        with open(file_path, "r", encoding="utf-8") as f:
-            boards = json.load(f)
-        
         # Remove boards matching peer_id and board_title
         peer_id = unregister_data["peer_id"]
         board_title = unregister_data["board_title"]
         
-        original_count = len(boards)
-        boards = [board for board in boards if not (board["peer_id"] == peer_id and board["board_title"] == board_title)]
+        removed = self.registry.unregister_owner(peer_id, board_title)
         
-        if len(boards) < original_count:
-            # Save updated boards list
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(boards, f, ensure_ascii=False, indent=2)
-            
+        if removed:
             print(f"[BOOTSTRAP] Board unregistered: {board_title} by peer {peer_id}")
         else:
             print(f"[BOOTSTRAP] Board not found for unregistration: {board_title} by peer {peer_id}")
@@ -0,0 +1,139 @@
+import threading
+import time
+
+from Backend.expiring_store import ExpiringStore
+
+'''
+PONGs travel back to the origin of a PING along the path the PING came, over the connections the peers keep open
+anyway. A super peer on that path collects the PONGs of its subtree for a short window and sends them on as one frame.
+'''
+
+
+class PongBatcher:
+    '''
+    Collects PONG payloads per next hop and hands them to 'send' as one list once the oldest of them waited 'window'
+    seconds or 'max_batch' of them are collected. The same responder answering the same PING twice (e.g. itself and
+    from the cache of a super peer) is passed on only once. Thread safe, the sending thread is started on first use.
+    '''
+
+    def __init__(self, send, window: float = 0.05, max_batch: int = 64, seen_ttl: float = 60.0,
+                 seen_capacity: int = 100000, clock=time.monotonic):
+        '''
+        :param send: called with (address, payloads) outside of the lock, may raise
+        :param seen_ttl: seconds a (ping_id, responder_id) pair is remembered to drop duplicates
+        '''
+        self.send = send
+        self.window = window
+        self.max_batch = max_batch
+        self.clock = clock
+
+        self.condition = threading.Condition()
+        # address: (time the first payload was added, payloads)
+        self.buffers = {}
+        self.seen = ExpiringStore(seen_ttl, seen_capacity)
+        self.thread = None
+        self.running = False
+        self.closed = False
+
+        self.pongs_added = 0
+        self.duplicates_dropped = 0
+        self.batches_sent = 0
+        self.send_failures = 0
+
+    def add(self, address: tuple, payload: dict) -> bool:
+        '''
+        :param address: (host, port) of the next hop towards the origin
+        :return: 'False' if the PONG was dropped as duplicate
+        '''
+        key = (payload.get("ping_id"), payload.get("responder_id"))
+        if not self.seen.add_if_absent(key, True):
+            with self.condition:
+                self.duplicates_dropped += 1
+            return False
+
+        with self.condition:
+            closed = self.closed
+            if not closed:
+                if not self.running:
+                    self._start()
+                buffer = self.buffers.get(address)
+                if buffer is None:
+                    buffer = self.buffers[address] = (self.clock(), [])
+                buffer[1].append(payload)
+                self.pongs_added += 1
+                self.condition.notify()
+        if closed:
+            # after stop() every PONG is sent on its own right away
+            self._send([(address, [payload])])
+        return True
+
+    def _start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="pong-batcher", daemon=True)
+        self.thread.start()
+
+    def _due(self, now: float) -> list:
+        due = [address for address, (started, payloads) in self.buffers.items()
+               if now - started >= self.window or len(payloads) >= self.max_batch or not self.running]
+        return [(address, self.buffers.pop(address)[1]) for address in due]
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    batches = self._due(self.clock())
+                    if batches or not self.running:
+                        break
+                    if self.buffers:
+                        oldest = min(started for started, _ in self.buffers.values())
+                        self.condition.wait(max(0.0, oldest + self.window - self.clock()))
+                    else:
+                        self.condition.wait()
+                running = self.running
+            self._send(batches)
+            if not running:
+                return
+
+    def _send(self, batches: list):
+        for address, payloads in batches:
+            try:
+                self.send(address, payloads)
+                with self.condition:
+                    self.batches_sent += 1
+            except Exception as e:
+                with self.condition:
+                    self.send_failures += 1
+                print(f"Failed to send {len(payloads)} PONGs to {address[0]}:{address[1]}: {e}")
+
+    def flush(self):
+        '''
+        Sends everything collected so far from the calling thread.
+        '''
+        with self.condition:
+            batches = [(address, payloads) for address, (_, payloads) in self.buffers.items()]
+            self.buffers.clear()
+        self._send(batches)
+
+    def stop(self):
+        '''
+        Sends the PONGs still collected and ends the sending thread.
+        '''
+        with self.condition:
+            self.running = False
+            self.closed = True
+            thread = self.thread
+            self.condition.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+        self.flush()
+
+    def get_stats(self) -> dict:
+        with self.condition:
+            return {
+                "window": self.window,
+                "pending": sum(len(payloads) for _, payloads in self.buffers.values()),
+                "pongs": self.pongs_added,
+                "batches": self.batches_sent,
+                "duplicates_dropped": self.duplicates_dropped,
+                "send_failures": self.send_failures,
+            }
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+from Backend.keyword_summary import normalize_keyword
+
+'''
+Results of recent searches kept by a super peer, so that popular searches passing through it are answered right away
+instead of being flooded further.
+'''
+
+
+def query_key(keywords, prefix: bool = False):
+    '''
+    :return: key of a search, independent of order, case and duplicates of its keywords
+    '''
+    return frozenset(normalize_keyword(keyword) for keyword in keywords), bool(prefix)
+
+
+class QueryCache:
+    '''
+    LRU cache of search results with a ttl, thread safe.
+    An entry is the PONG list of a search, an own one of this node or one of another node routed through it, which keeps
+    filling while the PONGs arrive. It is only served once it is 'settle' seconds old, until then the search is likely
+    still running.
+    '''
+
+    def __init__(self, ttl: float = 30.0, capacity: int = 256, settle: float = 1.0, clock=time.monotonic):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.settle = settle
+        self.clock = clock
+
+        # key: (results, ttl of the search, time it was started), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidated = 0
+
+    def put(self, keywords, prefix: bool, results: list, search_ttl: int, started: float = None):
+        '''
+        :param results: PONG list of the search, may still be filled after this call
+        :param search_ttl: ttl the search was sent with, the results do not cover nodes further away
+        :param started: time of 'clock' the search was sent, defaults to now. The ttl of the entry counts from there.
+        '''
+        key = query_key(keywords, prefix)
+        with self.lock:
+            self.entries[key] = (results, search_ttl, self.clock() if started is None else started)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evicted += 1
+
+    def get(self, keywords, prefix: bool, min_ttl: int):
+        '''
+        :param min_ttl: ttl the results have to cover
+        :return: copy of the cached PONG list or 'None' if there is no fresh entry covering min_ttl
+        '''
+        key = query_key(keywords, prefix)
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[2] > self.ttl:
+                del self.entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None or entry[1] < min_ttl or now - entry[2] < self.settle:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[0])
+
+    def invalidate(self, terms=None) -> int:
+        '''
+        Drops the entries a changed board could be a result of.
+        :param terms: normalized keywords and title words of the board, 'None' drops every entry
+        :return: number of dropped entries
+        '''
+        with self.lock:
+            if terms is None:
+                keys = list(self.entries)
+            else:
+                keys = [key for key in self.entries if self._may_match(key, terms)]
+            for key in keys:
+                del self.entries[key]
+            self.invalidated += len(keys)
+            return len(keys)
+
+    @staticmethod
+    def _may_match(key, terms) -> bool:
+        keywords, prefix = key
+        if prefix:
+            return any(term.startswith(keyword) for keyword in keywords for term in terms)
+        return not keywords.isdisjoint(terms)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "invalidated": self.invalidated,
+            }
@@ -0,0 +1,95 @@
+import threading
+import time
+
+'''
+Handle of a running search, yields the PONGs while they arrive instead of making the caller sleep and then read
+pongs_received.
+'''
+
+
+class SearchResults(list):
+    '''
+    PONG list of a search as stored in pongs_received, wakes up the handles waiting on it when a PONG is appended.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.condition = threading.Condition()
+
+    def append(self, result):
+        with self.condition:
+            super().append(result)
+            self.condition.notify_all()
+
+    def wait_for(self, count: int, timeout: float) -> bool:
+        '''
+        :return: 'True' if the list holds more than 'count' results, 'False' if the timeout passed before
+        '''
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self) > count, timeout)
+
+
+class SearchHandle:
+    '''
+    Iterating the handle yields one PONG (responder info as stored by handle_pong) per answering node, as soon as it
+    arrives. Iteration ends at the deadline, after max_results results or when the handle is closed.
+
+        with node.search(["music"], deadline=2.0, max_results=10) as search:
+            for result in search:
+                print(result["board_title"])
+    '''
+
+    def __init__(self, ping_id: str, results: SearchResults, deadline: float, max_results: int = None,
+                 clock=time.monotonic):
+        '''
+        :param deadline: seconds from now after which no more results are yielded
+        :param max_results: number of results after which the search ends, 'None' for no limit
+        '''
+        self.ping_id = ping_id
+        self.results = results
+        self.max_results = max_results
+        self.clock = clock
+        self.deadline = clock() + deadline
+        self.closed = threading.Event()
+        # responders already yielded, nodes can answer more than once (expanding rings, cached answers)
+        self.seen = set()
+        self.yielded = []
+
+    def __iter__(self):
+        position = 0
+        while not self.done():
+            if position < len(self.results):
+                result = self.results[position]
+                position += 1
+                responder = result.get("responder_id")
+                if responder in self.seen:
+                    continue
+                self.seen.add(responder)
+                self.yielded.append(result)
+                yield result
+                continue
+
+            # wake up regularly to notice close() called from another thread
+            remaining = self.deadline - self.clock()
+            if remaining > 0:
+                self.results.wait_for(position, min(remaining, 0.1))
+
+    def done(self) -> bool:
+        if self.closed.is_set() or self.clock() >= self.deadline:
+            return True
+        return self.max_results is not None and len(self.yielded) >= self.max_results
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - self.clock())
+
+    def close(self):
+        '''
+        Ends the iteration, PONGs arriving later are still stored in pongs_received.
+        '''
+        self.closed.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,417 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from types import MappingProxyType
+
+from Backend.board_registry import BOARDS_FILE, REGISTRY_HISTORY, BoardRegistry
+from Backend.keyword_index import board_terms
+
+'''
+Board registry in a SQLite database (stdlib sqlite3), used instead of data/boards.json if config.REGISTRY_BACKEND is
+"sqlite". Keyword and prefix searches run in the database on a FTS5 table over the keywords and title words of the
+boards, so the node does not need to keep the registry in its keyword index.
+
+The database runs in WAL mode, readers of other processes (e.g. a second Flask worker) are not blocked by a
+registration. Every change is recorded in the changes table, which gives the versions for the registry copies of other
+peers and lets a process notice the changes of the others.
+'''
+
+# characters kept inside a token by the FTS5 tokenizer, so that keywords like "c++" or "e-mail" stay one term
+TOKEN_CHARS = "-_.+#&@/:"
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS boards (
+    board_id TEXT PRIMARY KEY,
+    peer_id TEXT,
+    board_title TEXT,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS boards_peer ON boards (peer_id, board_title);
+CREATE VIRTUAL TABLE IF NOT EXISTS board_terms USING fts5(
+    terms, tokenize="unicode61 remove_diacritics 0 tokenchars '{TOKEN_CHARS}'"
+);
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    board_id TEXT NOT NULL,
+    entry TEXT,
+    old_entry TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def database_path(path: str = BOARDS_FILE) -> str:
+    '''
+    :return: path of the database replacing the registry file 'path', e.g. data/boards.db
+    '''
+    return os.path.splitext(path)[0] + ".db"
+
+
+def match_expression(keywords, prefix: bool) -> str:
+    '''
+    :return: FTS5 query matching boards with any of the keywords as term (or term prefix)
+    '''
+    phrases = []
+    for keyword in keywords:
+        keyword = str(keyword).strip().lower()
+        if keyword:
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            phrases.append(phrase + "*" if prefix else phrase)
+    return " OR ".join(phrases)
+
+
+class SqliteBoardRegistry:
+    '''
+    Same interface as BoardRegistry plus search() and get_terms(). Thread safe, all threads share one connection.
+    Entries are returned read only, like the snapshot entries of BoardRegistry.
+    '''
+
+    # find_matching_boards asks the registry instead of the keyword index
+    searchable = True
+
+    def __init__(self, database: str, migrate_from: str = None, check_interval: float = 1.0,
+                 history: int = REGISTRY_HISTORY, clock=time.monotonic):
+        '''
+        :param migrate_from: registry file whose boards are copied into a newly created database
+        '''
+        self.database = database
+        self.migrate_from = migrate_from
+        self.check_interval = check_interval
+        self.history = history
+        self.clock = clock
+
+        self.lock = threading.RLock()
+        self.connection = None
+        self.epoch = None
+        # last change of the changes table this process has seen and told its listeners about
+        self.version = 0
+        self.snapshot_cache = None
+        self.last_check = None
+        self.listeners = []
+        self.searches = 0
+
+    # --- database ---------------------------------------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.connection is not None:
+            return self.connection
+        os.makedirs(os.path.dirname(self.database) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.database, check_same_thread=False, isolation_level=None, timeout=10.0)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        self.connection = connection
+
+        row = connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()
+        if row is None:
+            # new database, versions of an old copy of the registry mean nothing here
+            with self._transaction():
+                created = connection.execute("INSERT OR IGNORE INTO meta VALUES ('epoch', ?)",
+                                             (uuid.uuid4().hex,)).rowcount
+                # another process may have created it meanwhile
+                if created and self.migrate_from is not None:
+                    self._migrate(self.migrate_from)
+            row = connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()
+        self.epoch = row[0]
+        self.version = self._last_version()
+        return connection
+
+    def _transaction(self):
+        connection = self.connection
+
+        class Transaction:
+            def __enter__(self):
+                connection.execute("BEGIN IMMEDIATE")
+
+            def __exit__(self, exc_type, exc_value, traceback):
+                connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+        return Transaction()
+
+    def _migrate(self, path: str):
+        migrated = 0
+        for board in BoardRegistry(path).get_boards():
+            try:
+                self._insert(board)
+                migrated += 1
+            except sqlite3.IntegrityError:
+                print(f"[BOOTSTRAP] Board {board.get('board_id')} doppelt in {path}, übersprungen")
+        print(f"[BOOTSTRAP] {migrated} Boards aus {path} nach {self.database} übernommen")
+
+    def _last_version(self) -> int:
+        row = self.connection.execute("SELECT MAX(version) FROM changes").fetchone()
+        return row[0] or 0
+
+    def _insert(self, board: dict):
+        cursor = self.connection.execute(
+            "INSERT INTO boards (board_id, peer_id, board_title, entry) VALUES (?, ?, ?, ?)",
+            (board.get("board_id"), board.get("peer_id"), board.get("board_title"),
+             json.dumps(board, ensure_ascii=False)))
+        self.connection.execute("INSERT INTO board_terms (rowid, terms) VALUES (?, ?)",
+                                (cursor.lastrowid, " ".join(sorted(board_terms(board)))))
+
+    def _delete(self, board_id) -> dict:
+        row = self.connection.execute("SELECT rowid, entry FROM boards WHERE board_id = ?", (board_id,)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute("DELETE FROM boards WHERE rowid = ?", (row[0],))
+        self.connection.execute("DELETE FROM board_terms WHERE rowid = ?", (row[0],))
+        return json.loads(row[1])
+
+    def _record(self, board_id, entry: dict = None, old_entry: dict = None) -> int:
+        cursor = self.connection.execute(
+            "INSERT INTO changes (board_id, entry, old_entry) VALUES (?, ?, ?)",
+            (board_id, json.dumps(entry, ensure_ascii=False) if entry is not None else None,
+             json.dumps(old_entry, ensure_ascii=False) if old_entry is not None else None))
+        self.connection.execute("DELETE FROM changes WHERE version <= ?", (cursor.lastrowid - self.history,))
+        return cursor.lastrowid
+
+    @staticmethod
+    def _freeze(entry: str):
+        return MappingProxyType(json.loads(entry))
+
+    # --- changes ----------------------------------------------------------------------------------------------------
+
+    def _notify(self, added: list, removed: list):
+        if not added and not removed:
+            return
+        for listener in list(self.listeners):
+            try:
+                listener(added, removed)
+            except Exception as e:
+                print(f"Board registry listener failed: {e}")
+
+    def _read_changes(self) -> tuple:
+        '''
+        :return: (added, removed) by changes of other processes since the last call
+        '''
+        rows = self._connect().execute(
+            "SELECT version, entry, old_entry FROM changes WHERE version > ? ORDER BY version",
+            (self.version,)).fetchall()
+        added, removed = [], []
+        for version, entry, old_entry in rows:
+            if old_entry is not None:
+                removed.append(self._freeze(old_entry))
+            if entry is not None:
+                added.append(self._freeze(entry))
+            self.version = version
+        if rows:
+            self.snapshot_cache = None
+        return added, removed
+
+    def refresh(self, force: bool = False):
+        '''
+        Reads the changes other processes made to the database, checked at most every check_interval seconds.
+        '''
+        now = self.clock()
+        with self.lock:
+            if not force and self.last_check is not None and now - self.last_check < self.check_interval:
+                return
+            self.last_check = now
+            added, removed = self._read_changes()
+        self._notify(added, removed)
+
+    def get_changes(self, epoch: str = None, version: int = -1) -> dict:
+        '''
+        See BoardRegistry.get_changes, the versions are the ones of the changes table and survive restarts.
+        '''
+        self.refresh()
+        with self.lock:
+            connection = self._connect()
+            current = self._last_version()
+            oldest = connection.execute("SELECT MIN(version) FROM changes").fetchone()[0] or current + 1
+            if epoch != self.epoch or version > current or version < oldest - 1:
+                return {
+                    "epoch": self.epoch,
+                    "version": current,
+                    "full": True,
+                    "boards": self.get_boards(),
+                }
+
+            # the last change of a board wins
+            changes = {}
+            for board_id, entry in connection.execute(
+                    "SELECT board_id, entry FROM changes WHERE version > ? AND version <= ? ORDER BY version",
+                    (version, current)):
+                changes[board_id] = entry
+            return {
+                "epoch": self.epoch,
+                "since": version,
+                "version": current,
+                "full": False,
+                "upserted": [json.loads(entry) for entry in changes.values() if entry is not None],
+                "removed": [board_id for board_id, entry in changes.items() if entry is None],
+            }
+
+    # --- reading ----------------------------------------------------------------------------------------------------
+
+    def get_snapshot(self) -> tuple:
+        '''
+        :return: immutable tuple of read only board entries
+        '''
+        self.refresh()
+        with self.lock:
+            if self.snapshot_cache is None:
+                rows = self._connect().execute("SELECT entry FROM boards ORDER BY rowid").fetchall()
+                self.snapshot_cache = tuple(self._freeze(row[0]) for row in rows)
+            return self.snapshot_cache
+
+    def get_boards(self) -> list:
+        return [dict(board) for board in self.get_snapshot()]
+
+    def get_board(self, board_id):
+        with self.lock:
+            row = self._connect().execute("SELECT entry FROM boards WHERE board_id = ?", (board_id,)).fetchone()
+        return self._freeze(row[0]) if row is not None else None
+
+    def find_by_owner(self, peer_id, board_title) -> list:
+        with self.lock:
+            rows = self._connect().execute("SELECT entry FROM boards WHERE peer_id = ? AND board_title = ?",
+                                           (peer_id, board_title)).fetchall()
+        return [self._freeze(row[0]) for row in rows]
+
+    def search(self, keywords, prefix: bool = False) -> list:
+        '''
+        :param keywords: one of them has to match a keyword or title word, no keywords match every board
+        :param prefix: keywords also match terms they are a prefix of
+        :return: copies of the matching board entries
+        '''
+        expression = match_expression(keywords, prefix)
+        with self.lock:
+            self.searches += 1
+            connection = self._connect()
+            if not expression:
+                if keywords:
+                    return []
+                rows = connection.execute("SELECT entry FROM boards ORDER BY rowid").fetchall()
+            else:
+                rows = connection.execute(
+                    "SELECT boards.entry FROM board_terms JOIN boards ON boards.rowid = board_terms.rowid "
+                    "WHERE board_terms MATCH ?", (expression,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_terms(self) -> set:
+        '''
+        :return: normalized keywords and title words of all boards, e.g. for the keyword summary
+        '''
+        with self.lock:
+            rows = self._connect().execute("SELECT terms FROM board_terms").fetchall()
+        terms = set()
+        for row in rows:
+            terms.update(row[0].split())
+        return terms
+
+    # --- writing ----------------------------------------------------------------------------------------------------
+
+    def register(self, board: dict) -> bool:
+        '''
+        :return: 'False' if a board with the same board_id is already registered
+        '''
+        added, removed, registered = [], [], False
+        with self.lock:
+            self._connect()
+            try:
+                # no other process can write within the transaction, so no change of theirs is skipped
+                with self._transaction():
+                    added, removed = self._read_changes()
+                    self._insert(board)
+                    self.version = self._record(board.get("board_id"), board)
+                registered = True
+                added.append(MappingProxyType(dict(board)))
+                self.snapshot_cache = None
+            except sqlite3.IntegrityError:
+                pass
+        self._notify(added, removed)
+        return registered
+
+    def _unregister(self, select) -> list:
+        '''
+        :param select: called within the transaction, returns the ids of the boards to remove
+        '''
+        deleted = []
+        with self.lock:
+            self._connect()
+            with self._transaction():
+                added, removed = self._read_changes()
+                for board_id in select():
+                    old = self._delete(board_id)
+                    if old is not None:
+                        deleted.append(old)
+                        self.version = self._record(board_id, None, old)
+            if deleted:
+                self.snapshot_cache = None
+        self._notify(added, removed + [MappingProxyType(board) for board in deleted])
+        return deleted
+
+    def unregister(self, predicate) -> list:
+        '''
+        Removes all boards 'predicate' returns 'True' for, checks every board.
+        :return: removed board entries
+        '''
+        def select():
+            rows = self.connection.execute("SELECT entry FROM boards").fetchall()
+            return [board["board_id"] for board in (self._freeze(row[0]) for row in rows) if predicate(board)]
+        return self._unregister(select)
+
+    def unregister_owner(self, peer_id, board_title) -> list:
+        '''
+        Removes the boards 'peer_id' registered under 'board_title', a lookup in the peer_id index.
+        :return: removed board entries
+        '''
+        def select():
+            rows = self.connection.execute("SELECT board_id FROM boards WHERE peer_id = ? AND board_title = ?",
+                                           (peer_id, board_title)).fetchall()
+            return [row[0] for row in rows]
+        return self._unregister(select)
+
+    def unregister_ids(self, board_ids) -> list:
+        '''
+        Removes the boards with the given ids, unknown ids are skipped.
+        :return: removed board entries
+        '''
+        return self._unregister(lambda: list(board_ids))
+
+    def add_listener(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            boards = self._connect().execute("SELECT COUNT(*) FROM boards").fetchone()[0]
+            return {
+                "backend": "sqlite",
+                "database": self.database,
+                "boards": boards,
+                "epoch": self.epoch,
+                "version": self.version,
+                "searches": self.searches,
+                "listeners": len(self.listeners),
+            }
+
+
+if __name__ == "__main__":
+    # python -m Backend.sqlite_registry [data/boards.json] copies a registry file into a new database next to it
+    source = sys.argv[1] if len(sys.argv) > 1 else BOARDS_FILE
+    target = database_path(source)
+    if os.path.exists(target):
+        print(f"{target} exists already, nothing migrated")
+    else:
+        print(SqliteBoardRegistry(target, migrate_from=source).get_stats())
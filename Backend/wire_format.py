@@ -0,0 +1,173 @@
+import json
+import struct
+import time
+
+from message_type import MessageType
+
+'''
+Encodings for the body of a frame. The 4 byte length header in front of every frame stays the same for all of them.
+
+JSON (default, understood by every peer):
+    {"type": ..., "node_id": ..., "host": ..., "port": ..., "super": ..., "timestamp": ..., "payload": ...}
+
+BINARY (only used after both sides agreed on it during CONNECT / CONNECT_RESPONSE):
+    magic       1 byte   always 0xB7, a JSON body always starts with '{' instead
+    version     1 byte
+    type        1 byte   integer code of the MessageType
+    flags       1 byte   bit 0: sender is a super peer
+    node_id    16 byte   uuid of the sender
+    port        2 byte
+    timestamp   8 byte   epoch seconds as double
+    host_len    1 byte
+    host        host_len bytes utf-8
+    payload     rest of the frame, compact json
+'''
+
+JSON = "json"
+BINARY = "binary"
+# ordered by preference
+SUPPORTED_CODECS = [BINARY, JSON]
+
+BINARY_MAGIC = 0xB7
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct(">BBBB16sHdB")
+
+FLAG_SUPER = 0x01
+
+# integer codes of the message types, never reuse or change a code once it was released
+MESSAGE_CODES = {
+    MessageType.DATA_REQUEST: 1,
+    MessageType.DATA_PEER_REQUEST: 2,
+    MessageType.DATA_RESPONSE: 3,
+    MessageType.DATA_UPDATE: 4,
+    MessageType.PING: 5,
+    MessageType.PONG: 6,
+    MessageType.GET_PEERS: 7,
+    MessageType.PEER_LIST: 8,
+    MessageType.CLOSE: 9,
+    MessageType.ERROR: 10,
+    MessageType.CONNECT: 11,
+    MessageType.CONNECT_RESPONSE: 12,
+    MessageType.BOARD_REGISTER: 13,
+    MessageType.BOARD_REGISTER_RESPONSE: 14,
+    MessageType.BOARD_UNREGISTER: 15,
+    MessageType.BOARD_UNREGISTER_RESPONSE: 16,
+    MessageType.KEYWORD_SUMMARY: 17,
+    MessageType.PONG_BATCH: 18,
+    MessageType.REGISTRY_SYNC: 19,
+    MessageType.REGISTRY_SYNC_RESPONSE: 20,
+    MessageType.BOARD_HEARTBEAT: 21,
+    MessageType.BOARD_HEARTBEAT_RESPONSE: 22,
+}
+MESSAGE_TYPES = {code: msg_type.value for msg_type, code in MESSAGE_CODES.items()}
+
+# reused instances skip the argument handling of json.dumps / json.loads for every frame
+_payload_encoder = json.JSONEncoder(separators=(",", ":"))
+_decoder = json.JSONDecoder()
+
+
+def encode_json(message: dict) -> bytes:
+    return json.dumps(message).encode("utf-8")
+
+
+def decode_json(data) -> dict:
+    return _decoder.decode(str(data, "utf-8"))
+
+
+def encode_binary(message: dict) -> bytes:
+    '''
+    Encodes a message with the binary layout.
+    :raise ValueError: if the message can not be represented (e.g. the node id is no uuid)
+    '''
+    # MessageType is a str enum, so the plain value finds the code as well
+    code = MESSAGE_CODES.get(message["type"])
+    if code is None:
+        raise ValueError(f"no binary code for message type {message['type']}")
+
+    # cheaper than going through uuid.UUID, which matters on the hot path
+    node_id = message["node_id"]
+    if len(node_id) != 36:
+        raise ValueError("node id is no uuid")
+    node_id = bytes.fromhex(node_id.replace("-", ""))
+
+    host = message["host"].encode("utf-8")
+    if len(host) > 255:
+        raise ValueError("host too long")
+
+    timestamp = message.get("timestamp")
+    if not isinstance(timestamp, float):
+        timestamp = time.time()
+
+    header = BINARY_HEADER.pack(
+        BINARY_MAGIC,
+        BINARY_VERSION,
+        code,
+        FLAG_SUPER if message.get("super") else 0,
+        node_id,
+        message["port"],
+        timestamp,
+        len(host),
+    )
+    payload = _payload_encoder.encode(message.get("payload")).encode("utf-8")
+    return b"".join((header, host, payload))
+
+
+def decode_binary(data) -> dict:
+    magic, version, code, flags, node_id, port, timestamp, host_len = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("unsupported binary frame")
+
+    offset = BINARY_HEADER.size
+    host = str(data[offset:offset + host_len], "utf-8")
+    offset += host_len
+
+    node_id = node_id.hex()
+    return {
+        "type": MESSAGE_TYPES.get(code, MessageType.ERROR.value),
+        "node_id": f"{node_id[:8]}-{node_id[8:12]}-{node_id[12:16]}-{node_id[16:20]}-{node_id[20:]}",
+        "host": host,
+        "port": port,
+        "super": bool(flags & FLAG_SUPER),
+        "timestamp": timestamp,
+        "payload": _decoder.decode(str(data[offset:], "utf-8")),
+    }
+
+
+def detect_codec(data) -> str:
+    return BINARY if len(data) > 0 and data[0] == BINARY_MAGIC else JSON
+
+
+def encode(message: dict, codec: str = JSON) -> bytes:
+    '''
+    Encodes a message with the given codec. Messages the binary layout can not represent are sent as JSON,
+    which the receiver detects on its own.
+    '''
+    if codec == BINARY:
+        try:
+            return encode_binary(message)
+        except (ValueError, KeyError, TypeError, AttributeError, struct.error):
+            pass
+    return encode_json(message)
+
+
+def decode(data) -> dict:
+    '''
+    Decodes a frame body of any supported codec.
+    '''
+    if detect_codec(data) == BINARY:
+        try:
+            return decode_binary(data)
+        except struct.error as e:
+            raise ValueError(f"truncated binary frame: {e}")
+    return decode_json(data)
+
+
+def choose_codec(offered) -> str:
+    '''
+    Picks the preferred codec out of the codecs offered by a remote peer during CONNECT.
+    '''
+    if isinstance(offered, list):
+        for codec in SUPPORTED_CODECS:
+            if codec in offered:
+                return codec
+    return JSON
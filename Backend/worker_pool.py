@@ -0,0 +1,98 @@
+import queue
+import threading
+
+
+class WorkerPool:
+    '''
+    Fixed number of worker threads consuming a bounded job queue.
+    Instead of blocking or growing without limit, submit() refuses new jobs while the queue is full, so the caller
+    can shed load. Above the high water mark the pool counts as under pressure, callers use this to drop low priority
+    work (PINGs) before real requests have to be rejected.
+    '''
+
+    def __init__(self, workers: int = 16, queue_size: int = 256, high_water: float = 0.75, name: str = "peer-worker"):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.high_water_mark = max(1, int(queue_size * high_water))
+        self.name = name
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.threads: list[threading.Thread] = []
+        self.running = False
+
+        # counters, only written while holding the lock
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        while self.running:
+            job = self.jobs.get()
+            if job is None:
+                break
+            fn, args = job
+            try:
+                fn(*args)
+                with self.lock:
+                    self.completed += 1
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                print(f"Error in worker job {getattr(fn, '__name__', fn)}: {e}")
+
+    def submit(self, fn, *args) -> bool:
+        '''
+        Queues fn(*args) for execution on a worker thread.
+        :return: 'False' if the queue is saturated and the job was rejected, otherwise 'True'
+        '''
+        try:
+            self.jobs.put_nowait((fn, args))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.accepted += 1
+        return True
+
+    def is_under_pressure(self) -> bool:
+        return self.jobs.qsize() >= self.high_water_mark
+
+    def record_dropped(self):
+        with self.lock:
+            self.dropped += 1
+
+    def get_queue_depth(self) -> int:
+        return self.jobs.qsize()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queue_depth": self.jobs.qsize(),
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "dropped": self.dropped,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+    def stop(self):
+        self.running = False
+        # wake up idle workers, busy ones finish their current job and stop afterwards
+        for _ in self.threads:
+            try:
+                self.jobs.put_nowait(None)
+            except queue.Full:
+                break
+        self.threads.clear()
@@ -0,0 +1,340 @@
+'''
+Multi-node benchmark of the join, search and data paths, all nodes run in this process on localhost.
+
+Measured:
+    join     time of do_bootstrap + request_peers per node, the peer limit of every node is --degree
+    search   latency until the first and the last PONG, recall and precision of the responders and the
+             frames (PING, PONG, PONG_BATCH) sent by all nodes per search. Before, --summary-rounds rounds of keyword summaries
+             are exchanged, with 0 only the one hop summaries sent while joining are known.
+             --mode ring runs expanding ring searches ending at --target-results answering nodes instead of floods,
+             --mode walk sends --walkers random walkers with --walker-steps steps each.
+             The time until the first PONG of a node with a matching board is reported as first match.
+    data     throughput of single send_data_request calls and of batched resolve_meta_data calls
+
+Run from the project root:
+    python benchmarks/network_benchmark.py --nodes 20 --output results.json
+'''
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Backend import config, peer_message_handler, peer_node
+from Backend.async_peer_node import AsyncPeerNode
+from Backend.Board import Board
+from Backend.peer_message_handler import SEARCH_RANDOM_WALK
+from Backend.peer_node import PeerNode
+from message_type import MessageType
+
+# frames sent for a search, PONGs merged on their way back arrive as PONG_BATCH
+SEARCH_FRAMES = (MessageType.PING.value, MessageType.PONG.value, MessageType.PONG_BATCH.value)
+KEYWORDS = ["fun", "chat", "random", "music", "sport", "news", "games", "study", "food", "travel"]
+
+
+def vocabulary(size: int) -> list:
+    return KEYWORDS[:size] + [f"topic{i}" for i in range(size - len(KEYWORDS))]
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def use_local_bootstrap(port: int):
+    '''
+    Points all nodes of this process at a bootstrap node on localhost, like editing config.py would.
+    '''
+    address = ("127.0.0.1", port)
+    for module in (config, peer_node, peer_message_handler):
+        module.BOOTSTRAP = address
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def count_frames(nodes: list, msg_types: tuple) -> int:
+    total = 0
+    for node in nodes:
+        with node.metrics.lock:
+            total += sum(node.metrics.messages_out.get(msg_type, 0) for msg_type in msg_types)
+    return total
+
+
+def start_network(args, rng: random.Random):
+    node_class = AsyncPeerNode if args.async_core else PeerNode
+
+    bootstrap_port = free_port()
+    use_local_bootstrap(bootstrap_port)
+    bootstrap = node_class("127.0.0.1", bootstrap_port, True)
+    bootstrap.start()
+
+    nodes = []
+    for i in range(args.nodes):
+        keywords = set(rng.sample(vocabulary(args.vocabulary), args.keywords_per_board))
+        node = node_class("127.0.0.1", 0, True, Board(f"board-{i}", keywords))
+        node.max_total_conn = args.degree
+        node.start()
+        nodes.append(node)
+    return bootstrap, nodes
+
+
+def run_join(nodes: list) -> dict:
+    durations = []
+    for node in nodes:
+        start = time.perf_counter()
+        node.do_bootstrap()
+        node.request_peers()
+        durations.append(time.perf_counter() - start)
+
+    degrees = [len(node.peers) for node in nodes]
+    return {
+        "seconds": summarize(durations),
+        "degree": summarize(degrees),
+    }
+
+
+def exchange_summaries(nodes: list, rounds: int):
+    '''
+    Runs the periodic keyword summary exchange right away, every round spreads the keywords one hop further.
+    '''
+    for _ in range(rounds):
+        for node in nodes:
+            node.send_keyword_summaries()
+        # summaries are sent without waiting for an answer
+        time.sleep(0.2)
+
+
+def wait_for_pongs(pongs: list, timeout: float, settle: float, expected: set = frozenset(), start: float = None):
+    '''
+    Waits until no new PONG arrived for 'settle' seconds.
+    :param expected: node ids with a matching board
+    :return: (time of the first PONG, time of the last PONG, time of the first PONG of an expected node) relative to
+    'start', 'None' if there was none
+    '''
+    start = start or time.perf_counter()
+    first = last = first_match = None
+    seen = 0
+    while time.perf_counter() - start < timeout:
+        now = time.perf_counter()
+        if len(pongs) > seen:
+            new = pongs[seen:]
+            seen += len(new)
+            last = now - start
+            if first is None:
+                first = last
+            if first_match is None and any(pong.get("responder_id") in expected for pong in new):
+                first_match = last
+        elif last is not None and now - start - last >= settle:
+            break
+        time.sleep(0.002)
+    return first, last, first_match
+
+
+def run_search(nodes: list, args, rng: random.Random) -> dict:
+    exchange_summaries(nodes, args.summary_rounds)
+    pruned_before = sum(node.pings_pruned for node in nodes)
+
+    for node in nodes:
+        node.WALKERS = args.walkers
+
+    first_latencies, last_latencies, match_latencies, recalls, precisions, frames = [], [], [], [], [], []
+    for _ in range(args.searches):
+        origin = rng.choice(nodes)
+        keyword = rng.choice(vocabulary(args.vocabulary))
+        expected = {node.node_id for node in nodes if keyword in node.board.get_keywords() and node is not origin}
+
+        frames_before = count_frames(nodes, SEARCH_FRAMES)
+        if args.mode == "ring":
+            start = time.perf_counter()
+            pongs = origin.expanding_ring_search([keyword], args.target_results, window=args.ring_window)
+            first = last = time.perf_counter() - start
+            first_match = first if {pong.get("responder_id") for pong in pongs} & expected else None
+            # PONGs of the last ring still on their way count towards the frames of this search
+            time.sleep(args.settle)
+        else:
+            start = time.perf_counter()
+            if args.mode == "walk":
+                ping_id = origin.issue_search_request([keyword], args.walker_steps, mode=SEARCH_RANDOM_WALK)
+            else:
+                ping_id = origin.issue_search_request([keyword])
+            pongs = origin.pongs_received[ping_id]
+            first, last, first_match = wait_for_pongs(pongs, args.search_timeout, args.settle, expected, start)
+        frames.append(count_frames(nodes, SEARCH_FRAMES) - frames_before)
+
+        responders = {pong.get("responder_id") for pong in pongs}
+        responders.discard(origin.node_id)
+        if first is not None:
+            first_latencies.append(first)
+            last_latencies.append(last)
+        if first_match is not None:
+            match_latencies.append(first_match)
+        recalls.append(len(responders & expected) / len(expected) if expected else 1.0)
+        precisions.append(len(responders & expected) / len(responders) if responders else 1.0)
+
+    return {
+        "first_pong_seconds": summarize(first_latencies),
+        "last_pong_seconds": summarize(last_latencies),
+        "first_match_seconds": summarize(match_latencies),
+        "unanswered": args.searches - len(first_latencies),
+        "recall": statistics.fmean(recalls) if recalls else 0.0,
+        "precision": statistics.fmean(precisions) if precisions else 0.0,
+        "frames_per_search": summarize(frames),
+        "pings_pruned": sum(node.pings_pruned for node in nodes) - pruned_before,
+    }
+
+
+def run_data(nodes: list, args) -> dict:
+    requester, holder = nodes[0], nodes[-1]
+    titles = [f"card-{i}" for i in range(args.cards)]
+    for title in titles:
+        holder.add_content_card(f"content of {title}", title, holder.board.get_title())
+    board_title = holder.board.get_title()
+
+    start = time.perf_counter()
+    answered = 0
+    for title in titles:
+        if requester.send_data_request(holder.host, holder.port, board_title, "content", title, peer_request=True):
+            answered += 1
+    single = time.perf_counter() - start
+
+    meta = [(None, title, holder.host, holder.port, 0) for title in titles]
+    start = time.perf_counter()
+    resolved = requester.resolve_meta_data(meta, board_title, holder.board.board_id)
+    batched = time.perf_counter() - start
+
+    return {
+        "cards": len(titles),
+        "single_answered": answered,
+        "single_requests_per_second": len(titles) / single if single else 0.0,
+        "batched_resolved": len(resolved),
+        "batched_cards_per_second": len(titles) / batched if batched else 0.0,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def run(args) -> dict:
+    rng = random.Random(args.seed)
+    bootstrap, nodes = start_network(args, rng)
+    try:
+        results = {
+            "config": {
+                "nodes": args.nodes,
+                "degree": args.degree,
+                "core": "async" if args.async_core else "threaded",
+                "searches": args.searches,
+                "mode": args.mode,
+                "target_results": args.target_results if args.mode == "ring" else None,
+                "walkers": args.walkers if args.mode == "walk" else None,
+                "walker_steps": args.walker_steps if args.mode == "walk" else None,
+                "summary_rounds": args.summary_rounds,
+                "vocabulary": args.vocabulary,
+                "cards": args.cards,
+                "seed": args.seed,
+                "revision": git_revision(),
+                "python": platform.python_version(),
+            },
+            "join": run_join(nodes),
+        }
+        results["search"] = run_search(nodes, args, rng)
+        results["data"] = run_data(nodes, args)
+    finally:
+        for node in nodes + [bootstrap]:
+            node.stop()
+    return results
+
+
+def print_table(results: dict):
+    join, search, data = results["join"], results["search"], results["data"]
+    print(f"{results['config']['nodes']} nodes, degree {results['config']['degree']}, {results['config']['core']} core,"
+          f" {results['config']['mode']} search")
+    print(f"join          p50 {join['seconds']['p50'] * 1000:8.1f} ms   p95 {join['seconds']['p95'] * 1000:8.1f} ms"
+          f"   mean degree {join['degree']['mean']:.1f}")
+    print(f"first pong    p50 {search['first_pong_seconds']['p50'] * 1000:8.1f} ms"
+          f"   p95 {search['first_pong_seconds']['p95'] * 1000:8.1f} ms")
+    print(f"last pong     p50 {search['last_pong_seconds']['p50'] * 1000:8.1f} ms"
+          f"   p95 {search['last_pong_seconds']['p95'] * 1000:8.1f} ms")
+    print(f"first match   p50 {search['first_match_seconds']['p50'] * 1000:8.1f} ms"
+          f"   p95 {search['first_match_seconds']['p95'] * 1000:8.1f} ms")
+    print(f"search        recall {search['recall']:.2f}   precision {search['precision']:.2f}"
+          f"   frames/search {search['frames_per_search']['mean']:.1f}   unanswered {search['unanswered']}")
+    print(f"data          single {data['single_requests_per_second']:8.1f} req/s"
+          f"   batched {data['batched_cards_per_second']:8.1f} cards/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=20, help="nodes started besides the bootstrap node")
+    parser.add_argument("--degree", type=int, default=4, help="peer limit of every node")
+    parser.add_argument("--keywords-per-board", type=int, default=2)
+    parser.add_argument("--vocabulary", type=int, default=len(KEYWORDS), help="number of distinct keywords")
+    parser.add_argument("--searches", type=int, default=20)
+    parser.add_argument("--search-timeout", type=float, default=5.0, help="seconds to wait for PONGs per search")
+    parser.add_argument("--summary-rounds", type=int, default=3,
+                        help="keyword summary rounds before searching")
+    parser.add_argument("--mode", choices=("flood", "ring", "walk"), default="flood",
+                        help="flood every search SEARCH_TTL hops, use expanding rings or random walkers")
+    parser.add_argument("--target-results", type=int, default=1,
+                        help="answering nodes that end an expanding ring search")
+    parser.add_argument("--ring-window", type=float, default=0.2, help="seconds to wait for the PONGs of a ring")
+    parser.add_argument("--walkers", type=int, default=PeerNode.WALKERS, help="walkers per search in walk mode")
+    parser.add_argument("--walker-steps", type=int, default=PeerNode.WALKER_STEPS, help="steps of every walker")
+    parser.add_argument("--settle", type=float, default=0.3, help="seconds without a new PONG that end a search")
+    parser.add_argument("--cards", type=int, default=200, help="cards requested in the data benchmark")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--async", dest="async_core", action="store_true", help="use the asyncio network core")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    parser.add_argument("--output", help="also write the machine readable results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the log output of the nodes")
+    args = parser.parse_args()
+
+    # handle_ping reads data/boards.json relative to the working directory
+    os.chdir(ROOT)
+    if args.verbose:
+        results = run(args)
+    else:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = run(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+'''
+Registration throughput of the board registry of the bootstrap node while it grows, measured in blocks of --step
+registrations in a temporary directory. Background compaction runs as it would on the bootstrap node.
+
+Run from the project root:
+    python benchmarks/registry_benchmark.py --boards 100000
+'''
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.board_registry import BoardRegistry
+
+
+def board(i: int) -> dict:
+    return {
+        "board_id": str(uuid.uuid4()),
+        "peer_id": str(uuid.uuid4()),
+        "board_title": f"Board {i}",
+        "keywords": ["fun", "chat", "random"],
+        "peer_host": "192.168.0.17",
+        "peer_port": 9005,
+        "created_at": time.time(),
+        "status": "active",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--boards", type=int, default=100000, help="boards registered in total")
+    parser.add_argument("--step", type=int, default=10000, help="registrations per measured block")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    registry = BoardRegistry(os.path.join(directory, "boards.json"))
+    results = []
+    try:
+        registry.get_snapshot()
+        for start in range(0, args.boards, args.step):
+            boards = [board(i) for i in range(start, min(args.boards, start + args.step))]
+            began = time.perf_counter()
+            for entry in boards:
+                registry.register(entry)
+            elapsed = time.perf_counter() - began
+
+            began = time.perf_counter()
+            registry.unregister_owner(boards[0]["peer_id"], boards[0]["board_title"])
+            unregister = time.perf_counter() - began
+            registry.register(boards[0])
+
+            results.append({
+                "size": start + len(boards),
+                "registrations_per_s": len(boards) / elapsed,
+                "unregister_ms": unregister * 1000,
+                "compactions": registry.get_stats()["compactions"],
+            })
+    finally:
+        registry.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'boards':>8}{'reg/s':>12}{'unreg':>11}{'compactions':>13}")
+    for r in results:
+        print(f"{r['size']:>8}{r['registrations_per_s']:>12.0f}{r['unregister_ms']:>9.2f}ms{r['compactions']:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+'''
+Microbenchmark comparing the JSON frame encoding with the compact binary encoding.
+
+Run from the project root:
+    python benchmarks/wire_format_benchmark.py
+'''
+import argparse
+import json
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.peer_message_handler import create_packet
+from Backend.wire_format import encode_binary, decode_binary
+from message_type import MessageType
+
+
+def sample_messages(n_boards: int) -> dict:
+    node_id = str(uuid.uuid4())
+    boards = [{
+        "board_id": str(uuid.uuid4()),
+        "peer_id": str(uuid.uuid4()),
+        "board_title": f"Board {i}",
+        "keywords": ["fun", "chat", "random"],
+        "peer_host": "192.168.0.17",
+        "peer_port": 9005,
+        "created_at": 1751649784.3463838,
+        "status": "active"
+    } for i in range(n_boards)]
+
+    return {
+        "ping": create_packet(MessageType.PING, node_id, "192.168.0.17", 9005, True, {
+            "ping_id": str(uuid.uuid4()),
+            "origin_id": node_id,
+            "origin_host": "192.168.0.17",
+            "origin_port": 9005,
+            "ttl": 5,
+            "keywords": ["fun", "chat"],
+        }),
+        "close": create_packet(MessageType.CLOSE, node_id, "192.168.0.17", 9005, True, {}),
+        f"pong ({n_boards} boards)": create_packet(MessageType.PONG, node_id, "192.168.0.17", 9005, True, {
+            "ping_id": str(uuid.uuid4()),
+            "title": "My Awesome Board",
+            "board_id": str(uuid.uuid4()),
+            "responder_id": node_id,
+            "responder_host": "192.168.0.17",
+            "responder_port": 9005,
+            "boards": boards,
+        }),
+    }
+
+
+def measure(fn, arg, number: int, repeat: int = 5) -> float:
+    '''
+    :return: microseconds per call, best of several runs to reduce noise
+    '''
+    return min(timeit.repeat(lambda: fn(arg), number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=5000, help="iterations per measurement")
+    parser.add_argument("--boards", type=int, default=20, help="boards carried in the sample PONG")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+
+    results = []
+    for name, message in sample_messages(args.boards).items():
+        # the old format: json string with a datetime string as timestamp
+        legacy = dict(message, timestamp="2025-07-04 19:23:04.346383")
+        legacy_frame = json.dumps(legacy)
+        binary_frame = encode_binary(message)
+
+        results.append({
+            "message": name,
+            "json_bytes": len(legacy_frame.encode("utf-8")),
+            "binary_bytes": len(binary_frame),
+            "json_encode_us": measure(json.dumps, legacy, args.number),
+            "binary_encode_us": measure(encode_binary, message, args.number),
+            "json_decode_us": measure(lambda frame: json.loads(frame.decode("utf-8")), legacy_frame.encode("utf-8"),
+                                      args.number),
+            "binary_decode_us": measure(decode_binary, binary_frame, args.number),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'message':<18}{'json B':>8}{'bin B':>8}{'enc json':>11}{'enc bin':>10}{'dec json':>11}{'dec bin':>10}")
+    for r in results:
+        print(f"{r['message']:<18}{r['json_bytes']:>8}{r['binary_bytes']:>8}"
+              f"{r['json_encode_us']:>9.2f}us{r['binary_encode_us']:>8.2f}us"
+              f"{r['json_decode_us']:>9.2f}us{r['binary_decode_us']:>8.2f}us")
+
+
+if __name__ == "__main__":
+    main()
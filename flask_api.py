@@ -1,9 +1,12 @@
 import os
 import json
-from flask import Flask, request, jsonify
+import math
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from Backend.peer_node import PeerNode
 from Backend.Board import Board
+from Backend.keyword_index import ALL_SOURCES
+from Backend.hash_ring import registry_owners
 import time
 import uuid  
 
@@ -123,9 +126,18 @@ def get_peer_info():
         "port": peer_node.get_port()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Runtime metrics of the PeerNode in the Prometheus text format"""
+    if peer_node is None:
+        return jsonify({"error": "PeerNode not initialized"}), 500
+
+    return Response(peer_node.render_metrics(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/register_board', methods=['POST'])
 def register_board():
-    """Register a new board with the bootstrap peer"""
+    """Register a new board with the bootstrap peer. The board holds a lease of 'lease' seconds, the client has to renew
+    it through /board_heartbeat before it ends, otherwise the board is removed again."""
     data = request.get_json()
     
     if not data:
@@ -143,16 +155,15 @@ def register_board():
     if not board_id or not peer_id or not board_title:
         return jsonify({"error": "Missing required fields: board_id, peer_id, board_title"}), 400
     
-    # Create data directory if it doesn't exist
-    os.makedirs("data", exist_ok=True)
-    file_path = os.path.join("data", "boards.json")
+    if peer_node is None:
+        return jsonify({"error": "PeerNode not initialized"}), 500
     
-    # Load existing boards (if file exists)
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            boards = json.load(f)
-    else:
-        boards = []
+    # only the registry nodes owning the board on the hash ring keep it, the registry of this node is the one the
+    # PeerNode reads (data/boards-N.json for --registry-node N)
+    owners = registry_owners(board_id)
+    if not peer_node.bootstrap or (peer_node.get_host(), peer_node.get_port()) not in owners:
+        return jsonify({"error": "Board belongs to other registry nodes",
+                        "registry_nodes": [f"{host}:{port}" for host, port in owners]}), 421
     
     # Create new board entry
     new_board = {
@@ -166,34 +177,39 @@ def register_board():
         "status": "active"
     }
     
-    # Check if board already exists
-    for board in boards:
-        if board["board_id"] == board_id:
-            return jsonify({"error": "Board already exists"}), 409
+    # Add new board, the registry stores it (log or database) and updates the keyword index of the PeerNode
+    if not peer_node.registry.register(new_board):
+        return jsonify({"error": "Board already exists"}), 409
     
-    # Add new board to list
-    boards.append(new_board)
+    print(f"[BOOTSTRAP] New board registered: {board_title} (ID: {board_id}) by peer {peer_id}")
     
-    # Save updated boards list
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(boards, f, ensure_ascii=False, indent=2)
+    return jsonify({"status": "board_registered", "board_id": board_id, "lease": peer_node.leases.duration}), 200
+
+@app.route('/board_heartbeat', methods=['POST'])
+def board_heartbeat():
+    """Renew the leases of boards registered through /register_board, same as a BOARD_HEARTBEAT of a peer"""
+    data = request.get_json(silent=True)
     
-    print(f"[BOOTSTRAP] New board registered: {board_title} (ID: {board_id}) by peer {peer_id}")
+    if not data or not data.get("peer_id") or not isinstance(data.get("board_ids"), list):
+        return jsonify({"error": "Missing required fields: peer_id, board_ids"}), 400
     
-    return jsonify({"status": "board_registered", "board_id": board_id}), 200
+    if peer_node is None:
+        return jsonify({"error": "PeerNode not initialized"}), 500
+    
+    # boards of other peers or unknown here come back as "unknown", the client registers them again
+    answer = peer_node.handle_board_heartbeat({"peer_id": data["peer_id"], "board_ids": data["board_ids"]})
+    if "error" in answer:
+        return jsonify(answer), 421
+    return jsonify(answer), 200
 
 @app.route('/get_boards', methods=['GET'])
 def get_boards():
     """Get list of all registered boards"""
-    file_path = os.path.join("data", "boards.json")
-    
-    if not os.path.exists(file_path):
-        return jsonify({"boards": []}), 200
-    
-    with open(file_path, "r", encoding="utf-8") as f:
-        boards = json.load(f)
+    if peer_node is None:
+        return jsonify({"error": "PeerNode not initialized"}), 500
     
-    return jsonify({"boards": boards}), 200
+    # served from memory, the registry files are only read again after they changed
+    return jsonify({"boards": peer_node.registry.get_boards()}), 200
 
 @app.route('/search_boards', methods=['GET'])
 def search_boards():
@@ -203,23 +219,52 @@ def search_boards():
     if not keyword:
         return jsonify({"error": "No keyword provided"}), 400
     
-    file_path = os.path.join("data", "boards.json")
+    if peer_node is None:
+        return jsonify({"error": "PeerNode not initialized"}), 500
     
-    if not os.path.exists(file_path):
-        return jsonify({"boards": []}), 200
+    # Search in the keywords and title words of every known board, the keyword may be the beginning of a word
+    matching_boards = peer_node.find_matching_boards([keyword], prefix=True, sources=ALL_SOURCES)
     
-    with open(file_path, "r", encoding="utf-8") as f:
-        boards = json.load(f)
+    return jsonify({"boards": matching_boards}), 200
+
+@app.route('/search_stream', methods=['GET'])
+def search_stream():
+    """Search the network for boards, the results are streamed as Server-Sent Events while they arrive"""
+    keywords = [keyword for keyword in request.args.getlist('keyword') if keyword]
     
-    # Search for boards matching the keyword
-    matching_boards = []
-    for board in boards:
-        # Search in title and keywords
-        if (keyword in board["board_title"].lower() or 
-            any(keyword in kw.lower() for kw in board["keywords"])):
-            matching_boards.append(board)
+    if peer_node is None:
+        return jsonify({"error": "PeerNode not initialized"}), 500
     
-    return jsonify({"boards": matching_boards}), 200
+    try:
+        deadline = float(request.args.get('deadline', peer_node.SEARCH_DEADLINE))
+    except ValueError:
+        deadline = math.nan
+    if not math.isfinite(deadline):
+        return jsonify({"error": "deadline has to be a number"}), 400
+    
+    # without max_results the search yields results until the deadline, a bad value must not mean unlimited
+    max_results = request.args.get('max_results')
+    if max_results is not None:
+        try:
+            max_results = int(max_results)
+        except ValueError:
+            max_results = 0
+        if max_results < 1:
+            return jsonify({"error": "max_results has to be a positive integer"}), 400
+    # a client must not keep a search open forever
+    deadline = min(max(deadline, 0.0), 60.0)
+    prefix = request.args.get('prefix', 'false').lower() in ("1", "true", "yes")
+    
+    search = peer_node.search(keywords, deadline=deadline, max_results=max_results, prefix=prefix)
+    
+    def events():
+        # one "result" event per answering peer, "done" when the deadline or max_results is reached
+        with search:
+            for result in search:
+                yield f"event: result\ndata: {json.dumps(result, ensure_ascii=False)}\n\n"
+            yield f"event: done\ndata: {json.dumps({'ping_id': search.ping_id, 'count': len(search.yielded)})}\n\n"
+    
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.route('/unregister_board', methods=['DELETE'])
 def unregister_board():
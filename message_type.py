@@ -38,6 +38,16 @@ class MessageType(str, Enum):
     # delete board 
     BOARD_UNREGISTER = "board_unregister"
     BOARD_UNREGISTER_RESPONSE = "board_unregister_response"
+    # bloom filter summary of the keywords reachable through a super peer, exchanged periodically between neighbours
+    KEYWORD_SUMMARY = "keyword_summary"
+    # several PONGs routed back along the path of their PING in one frame
+    PONG_BATCH = "pong_batch"
+    # anti-entropy between the registry copies of super peers: digests of key ranges and the boards of those that differ
+    REGISTRY_SYNC = "registry_sync"
+    REGISTRY_SYNC_RESPONSE = "registry_sync_response"
+    # renews the leases of all boards a peer registered with a registry node
+    BOARD_HEARTBEAT = "board_heartbeat"
+    BOARD_HEARTBEAT_RESPONSE = "board_heartbeat_response"
 
 
 '''
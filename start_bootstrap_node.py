@@ -1,5 +1,7 @@
 from Backend.peer_node import PeerNode
+from Backend.async_peer_node import AsyncPeerNode
 from Backend.config import BOOTSTRAP
+from Backend.hash_ring import registry_nodes
 import time
 import webbrowser
 import subprocess
@@ -37,10 +39,29 @@ def start_frontend():
     except Exception as e:
         print(f"[ERROR] Fehler beim Starten des Webservers: {e}")
 
+def get_node_class():
+    # mit "--async" startet der Node auf dem asyncio Netzwerk-Kern statt mit einem Thread pro Verbindung
+    if "--async" in sys.argv[1:]:
+        return AsyncPeerNode
+    return PeerNode
+
+def get_address():
+    # mit "--registry-node 2" startet der Node unter dem dritten Eintrag aus REGISTRY_NODES, jeder hält einen Teil der
+    # Board Registry in einer eigenen Datei (data/boards-2.json), damit mehrere davon auf einem Rechner laufen können
+    if "--registry-node" in sys.argv[1:]:
+        index = int(sys.argv[sys.argv.index("--registry-node") + 1])
+        host, port = registry_nodes()[index]
+        return host, port, f"data/boards-{index}.json"
+    return BOOTSTRAP_IP, BOOTSTRAP_PORT, None
+
 def main():
-    node = PeerNode(BOOTSTRAP_IP, BOOTSTRAP_PORT)
+    host, port, registry_file = get_address()
+    node_class = get_node_class()
+    if registry_file is not None:
+        node_class.REGISTRY_FILE = registry_file
+    node = node_class(host, port)
     node.start()
-    print(f"[BOOTSTRAP NODE] Running at {BOOTSTRAP_IP}:{BOOTSTRAP_PORT}")
+    print(f"[BOOTSTRAP NODE] Running at {host}:{port}")
     start_frontend()
 
     # Hier könnt ihr eine Endlosschleife oder eine manuelle Stop-Möglichkeit einbauen
@@ -1,4 +1,5 @@
 from Backend.peer_node import PeerNode
+from Backend.async_peer_node import AsyncPeerNode
 from Backend.config import BOOTSTRAP, LOCAL
 from Backend.Board import Board
 import threading
@@ -76,10 +77,16 @@ def start_frontend():
     print("3. Führen Sie aus: python -m http.server 8080")
     print("4. Öffnen Sie: http://localhost:8080/bulletin_board_frontend/")
 
+def get_node_class():
+    # mit "--async" startet der Node auf dem asyncio Netzwerk-Kern statt mit einem Thread pro Verbindung
+    if "--async" in sys.argv[1:]:
+        return AsyncPeerNode
+    return PeerNode
+
 def main():
     try:
         # Peer Node starten
-        node = PeerNode(MY_IP, MY_PORT)
+        node = get_node_class()(MY_IP, MY_PORT)
         node.start()
         print(f"[PEER NODE] Started at {MY_IP}:{MY_PORT}")
         
@@ -101,20 +108,30 @@ def main():
         # Bootstrap-Verbindung
         print(f"node.do_bootstrap(): {node.do_bootstrap()}")
         
+        search = None
         if node.do_bootstrap():
             print(f"[PEER NODE] Connected to Bootstrap at {BOOTSTRAP_IP}:{BOOTSTRAP_PORT}")
             print(f"Node Board id is: {node.board.board_id if node.board else 'No Board'}")
             # node.board_request(BOOTSTRAP_IP, BOOTSTRAP_PORT, keywords=set())
-            node.issue_search_request([])
+            search = node.search([], deadline=2.0)
         node.super_peer = True  # Setze den PeerNode als Super Peer
         node.board = "fc64983c-5e1f-424e-836d-c612b9ad5de9"
 
-        try:
-            with open("data/received_boards.json", "r", encoding="utf-8") as f:
-                boards = json.load(f)
-                print(f"[PEER NODE] Loaded boards from data/received_boards.json: {boards}")
-        except FileNotFoundError:
-            print("[PEER NODE] No boards found in data/received_boards.json")
+        if search is not None:
+            # Boards der Antworten einsammeln, sobald sie ankommen, statt zu warten und die Datei zu lesen
+            received = {}
+            for result in search:
+                for board in result.get("boards") or []:
+                    received[board.get("board_id")] = board
+            boards = list(received.values())
+            print(f"[PEER NODE] Received boards: {boards}")
+        else:
+            try:
+                with open("data/received_boards.json", "r", encoding="utf-8") as f:
+                    boards = json.load(f)
+                    print(f"[PEER NODE] Loaded boards from data/received_boards.json: {boards}")
+            except FileNotFoundError:
+                print("[PEER NODE] No boards found in data/received_boards.json")
 
         for board in boards:
             peer_host = board.get("peer_host")
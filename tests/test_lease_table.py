@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+
+from Backend.board_registry import BoardRegistry
+from Backend.Board import Board
+from Backend.lease_table import LeaseTable
+from Backend.peer_node import PeerNode
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class LeaseTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.leases = LeaseTable(10.0, self.clock)
+
+    def test_grant_renew_expire(self):
+        self.assertEqual(self.leases.grant(["a", "b"]), 1010.0)
+        self.clock.now += 6
+        self.leases.grant(["a"])
+        self.assertEqual(self.leases.next_expiry(), 1010.0)
+
+        self.clock.now += 4
+        # 'b' ends now, the renewed lease of 'a' runs until 1016
+        self.assertEqual(self.leases.pop_expired(), ["b"])
+        self.assertEqual(self.leases.next_expiry(), 1016.0)
+        self.assertEqual(self.leases.pop_expired(), [])
+
+        self.clock.now += 6
+        self.assertEqual(self.leases.pop_expired(), ["a"])
+        self.assertIsNone(self.leases.next_expiry())
+        stats = self.leases.get_stats()
+        self.assertEqual((stats["granted"], stats["renewed"], stats["expired"], stats["leases"]), (2, 1, 2, 0))
+
+    def test_released_lease_does_not_expire(self):
+        self.leases.grant(["a", "b"])
+        self.leases.release(["a"])
+        self.clock.now += 10
+        self.assertEqual(self.leases.pop_expired(), ["b"])
+
+    def test_heap_is_rebuilt(self):
+        for _ in range(100):
+            self.clock.now += 1
+            self.leases.grant(["a"])
+        self.assertLessEqual(len(self.leases.heap), 2 * len(self.leases.expiries) + 64)
+        self.assertEqual(self.leases.next_expiry(), self.clock.now + 10)
+
+
+class LeaseReaperTest(unittest.TestCase):
+    '''
+    A registry node grants every registered board a lease, heartbeats of its owner renew it and the maintenance
+    thread removes the board once it ended.
+    '''
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.node = PeerNode("127.0.0.1", 0, True, Board("R", {"r"}))
+        self.node.bootstrap = True
+        self.node.leases = LeaseTable(10.0, self.clock)
+        self.node.registry = BoardRegistry(os.path.join(tempfile.mkdtemp(), "boards.json"))
+        self.node.registry.add_listener(self.node._registry_changed)
+        for board_id, peer_id in (("a", "p"), ("b", "q")):
+            self.node.registry.register({"board_id": board_id, "peer_id": peer_id, "board_title": board_id,
+                                         "keywords": []})
+
+    def tearDown(self):
+        self.node.registry.close()
+        self.node.pool.close_all()
+
+    def test_heartbeat_keeps_board(self):
+        self.clock.now += 6
+        answer = self.node.handle_board_heartbeat({"peer_id": "p", "board_ids": ["a", "b", "c"]})
+        # 'b' belongs to another peer, 'c' is not registered
+        self.assertEqual(answer, {"lease": 10.0, "renewed": 1, "unknown": ["b", "c"]})
+
+        self.clock.now += 4
+        self.assertEqual([board["board_id"] for board in self.node.expire_leases()], ["b"])
+        self.assertEqual([board["board_id"] for board in self.node.registry.get_boards()], ["a"])
+
+        self.clock.now += 6
+        self.assertEqual([board["board_id"] for board in self.node.expire_leases()], ["a"])
+        self.assertEqual(self.node.registry.get_boards(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
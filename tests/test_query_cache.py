@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+
+from Backend.board_registry import RegistryReplica
+from Backend.Board import Board
+from Backend.peer_node import PeerNode
+from Backend.query_cache import QueryCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = QueryCache(ttl=30.0, capacity=2, settle=1.0, clock=self.clock)
+
+    def test_served_after_settle(self):
+        results = [{"responder_id": "a"}]
+        self.cache.put(["Foo", "bar"], False, results, 3)
+        self.assertIsNone(self.cache.get(["foo", "bar"], False, 2))
+        self.clock.now += 1.0
+        self.assertEqual(self.cache.get(["bar", "FOO"], False, 2), results)
+        self.assertIsNone(self.cache.get(["foo", "bar"], True, 2))
+        self.assertIsNone(self.cache.get(["foo", "bar"], False, 4))
+
+    def test_lru_eviction(self):
+        self.cache.put(["a"], False, [1], 3)
+        self.cache.put(["b"], False, [2], 3)
+        self.clock.now += 1.0
+        # 'a' is used, 'b' becomes the least recently used entry
+        self.assertEqual(self.cache.get(["a"], False, 1), [1])
+        self.cache.put(["c"], False, [3], 3, self.clock.now - 1.0)
+
+        self.assertIsNone(self.cache.get(["b"], False, 1))
+        self.assertEqual(self.cache.get(["a"], False, 1), [1])
+        self.assertEqual(self.cache.get(["c"], False, 1), [3])
+        self.assertEqual(self.cache.get_stats()["evicted"], 1)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_ttl_expiry(self):
+        self.cache.put(["a"], False, [1], 3)
+        self.clock.now += 30.0
+        self.assertEqual(self.cache.get(["a"], False, 1), [1])
+        self.clock.now += 0.1
+        self.assertIsNone(self.cache.get(["a"], False, 1))
+        self.assertEqual(self.cache.get_stats()["expired"], 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_ttl_counts_from_start_of_search(self):
+        # results of a forwarded search are put when its window closed, the entry ages from the time it was sent
+        self.cache.put(["a"], False, [1], 3, started=self.clock.now - 29.5)
+        self.assertEqual(self.cache.get(["a"], False, 1), [1])
+        self.clock.now += 1.0
+        self.assertIsNone(self.cache.get(["a"], False, 1))
+
+    def test_results_keep_filling(self):
+        results = []
+        self.cache.put(["a"], False, results, 3)
+        self.clock.now += 1.0
+        results.append({"responder_id": "late"})
+        self.assertEqual(self.cache.get(["a"], False, 1), [{"responder_id": "late"}])
+
+    def test_invalidate(self):
+        self.cache.put(["foo"], False, [1], 3)
+        self.cache.put(["ba"], True, [2], 3)
+        self.assertEqual(self.cache.invalidate({"bar"}), 1)
+        self.assertEqual(self.cache.invalidate({"foo"}), 1)
+        self.assertEqual(len(self.cache), 0)
+
+
+class ReplicaInvalidationTest(unittest.TestCase):
+    '''
+    Super peers fill their keyword index from the changes of the registry nodes, those changes drop cached searches
+    as well.
+    '''
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.node = PeerNode("127.0.0.1", 0, True, Board("S", {"s"}))
+        self.node.registry_replica = RegistryReplica(os.path.join(directory, "received_boards.json"))
+        self.node.apply_registry_changes({"epoch": "e", "version": 1, "full": True, "boards": [
+            {"board_id": "b1", "peer_id": "p", "board_title": "Garden", "keywords": ["plants"]}]}, "r:1")
+        for keywords in (["plants"], ["garden"], ["tools"], ["other"]):
+            self.node.query_cache.put(keywords, False, [], 3)
+
+    def tearDown(self):
+        self.node.pool.close_all()
+
+    def cached(self) -> set:
+        return {next(iter(keywords)) for keywords, _ in self.node.query_cache.entries}
+
+    def test_delta_drops_matching_searches(self):
+        self.node.apply_registry_changes({"epoch": "e", "version": 3, "full": False, "since": 1, "removed": ["b1"],
+                                          "upserted": [{"board_id": "b2", "peer_id": "p", "board_title": "Shed",
+                                                        "keywords": ["tools"]}]}, "r:1")
+        # the removed board by the title and keywords it had, the registered one by its own
+        self.assertEqual(self.cached(), {"other"})
+
+    def test_snapshot_drops_all_searches(self):
+        self.node.apply_registry_changes({"epoch": "f", "version": 1, "full": True, "boards": []}, "r:1")
+        self.assertEqual(self.cached(), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
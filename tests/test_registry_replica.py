@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+import unittest
+
+from Backend.board_registry import RegistryReplica
+
+
+def board(board_id, title="t", keywords=()):
+    return {"board_id": board_id, "peer_id": "p", "board_title": title, "keywords": list(keywords)}
+
+
+class RegistryReplicaFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "received_boards.json")
+        self.replica = RegistryReplica(self.path, compact_min_records=10)
+        self.replica.apply({"epoch": "e", "version": 2, "full": True, "boards": [board("a"), board("b")]}, "r:1")
+
+    def reloaded(self) -> dict:
+        replica = RegistryReplica(self.path)
+        replica.load()
+        return {entry["board_id"]: entry for entry in replica.get_boards()}
+
+    def test_delta_is_appended_to_the_log(self):
+        self.assertFalse(os.path.exists(self.path))
+        self.replica.apply({"epoch": "e", "version": 4, "full": False, "since": 2,
+                            "upserted": [board("c"), board("a", "new")], "removed": ["b"]}, "r:1")
+
+        # no snapshot yet, every change is a line in the log
+        self.assertFalse(os.path.exists(self.path))
+        with open(self.replica.log_path, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 5)
+        boards = self.reloaded()
+        self.assertEqual(sorted(boards), ["a", "c"])
+        self.assertEqual(boards["a"]["board_title"], "new")
+
+    def test_long_log_is_compacted(self):
+        for version in range(3, 13):
+            self.replica.apply({"epoch": "e", "version": version, "full": False, "since": version - 1,
+                                "upserted": [board(f"x{version}")], "removed": []}, "r:1")
+
+        self.assertEqual(self.replica.get_stats()["compactions"], 1)
+        with open(self.path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        self.assertEqual(len(snapshot), 2 + 8)
+        self.assertEqual(self.replica.log_records, 2)
+        self.assertEqual(sorted(self.reloaded()), sorted(entry["board_id"] for entry in self.replica.get_boards()))
+
+
+if __name__ == "__main__":
+    unittest.main()